@@ -0,0 +1,178 @@
+import RiotConstants as Consts
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from RateLimiter import endpoint_of
+from WriteBuffer import WriteBuffer
+from CrawlFrontier import SeenMatches
+from MatchRecords import parse_match
+from Metrics import METRICS
+from CrawlScheduler import ranked_share, record_yield
+
+class AsyncCrawler(object):
+	#asyncio version of steps 2 and 3 of RiotAPI.populate_matches_from_summoners.
+	#Up to `concurrency` match_list/match_info requests are kept in flight at once.  Every request waits for api.rate_limiter
+	#(the same one the blocking crawler uses) and is then sent on a thread pool.
+	#Parsed matches are put on a bounded queue and written in batches (see WriteBuffer.py) by a single writer task with its own DB connection, so a slow
+	#commit never holds up the network side (and a slow network never holds a transaction open).
+
+	def __init__(self, api, concurrency=8, queue_size=None, flush_size=Consts.WRITE_BUFFER['flush_size'], flush_interval=Consts.WRITE_BUFFER['flush_interval']):
+		self.api = api
+		self.flush_size = flush_size
+		self.flush_interval = flush_interval
+		self.concurrency = concurrency
+		#Every worker thread should get its own pooled connection rather than opening throwaway ones
+		if api.pool_size < concurrency:
+			api._mount(concurrency)
+		#Bound the hand-off queue so that the fetchers can't run arbitrarily far ahead of the writer
+		self.queue_size = queue_size or 4*concurrency
+		self.stats = {'summoners':0, 'matchlists':0, 'matches':0, 'written':0, 'errors':0, 'requests':0}
+
+	def run(self, accountIds, matchNo, seen=None, frontier=None, queues=None):
+		#Blocking entry point: crawl matchNo matches from each of accountIds and return the stats dictionary.
+		#seen and frontier are the SeenMatches/CrawlFrontier for the crawl (see CrawlFrontier.py); both are optional.
+		#queues limits the crawl to games from those queues (see RiotAPI._select_matches).
+		return asyncio.run(self.crawl(accountIds, matchNo, seen, frontier, queues))
+
+	async def crawl(self, accountIds, matchNo, seen=None, frontier=None, queues=None):
+		self._loop = asyncio.get_running_loop()
+		self._seen = seen if seen is not None else SeenMatches()
+		self._frontier = frontier
+		self._queues = queues
+		self._semaphore = asyncio.Semaphore(self.concurrency)
+		self._queue = asyncio.Queue(self.queue_size)
+		self._http = ThreadPoolExecutor(self.concurrency)
+		#pymysql connections are not thread safe, so every DB call happens on this one thread
+		self._db = ThreadPoolExecutor(1)
+
+		work = asyncio.Queue()
+		for accountId in accountIds:
+			work.put_nowait(accountId)
+
+		writer = asyncio.ensure_future(self._writer())
+		#A fixed pool of summoner workers.  The semaphore (not the number of workers) is what bounds the requests in flight.
+		fetchers = asyncio.ensure_future(asyncio.gather(*[self._summoner_worker(work, matchNo) for _ in range(self.concurrency)]))
+		try:
+			#The writer only finishes before the fetchers if it died (lost DB connection, etc.).  In that case the fetchers
+			#would block forever on a full queue, so stop them too.
+			done, pending = await asyncio.wait([writer, fetchers], return_when=asyncio.FIRST_COMPLETED)
+			if writer in done:
+				fetchers.cancel()
+				writer.result()
+			fetchers.result()
+
+			#Tell the writer there is nothing more coming and let it drain the queue
+			await self._queue.put(None)
+			await writer
+		except BaseException:
+			fetchers.cancel()
+			writer.cancel()
+			raise
+		finally:
+			self._http.shutdown(wait=True)
+			self._db.shutdown(wait=True)
+
+		return self.stats
+
+	async def _get(self, api_url, params={}):
+		#Wait for the rate limiter on the event loop rather than in a worker thread, then send the request on the thread pool.
+		#Same retry rule for 429s as RiotAPI._request.
+		endpoint = endpoint_of(api_url)[0]
+		cached = self.api.cache.get(self.api.region, endpoint, api_url, params)
+		if cached is not None:
+			METRICS.inc('riot_cache_hits_total', region=self.api.region, endpoint=endpoint)
+			return cached
+		async with self._semaphore:
+			for attempt in range(Consts.MAX_RETRIES + 1):
+				await self.api.rate_limiter.acquire_async(self.api.region, endpoint)
+				response = await self._loop.run_in_executor(self._http, self.api._send, api_url, params, endpoint)
+				self.stats['requests'] += 1
+				if response.status_code != 429:
+					break
+			return response
+
+	async def _summoner_worker(self, work, matchNo):
+		while True:
+			try:
+				accountId = work.get_nowait()
+			except asyncio.QueueEmpty:
+				return
+
+			if self.stats['summoners'] % 100 == 0:
+				print('Progress: ' + str(self.stats['summoners']) + ' records')
+			self.stats['summoners'] += 1
+			METRICS.inc('crawl_summoners_total', region=self.api.region)
+
+			requests = self.stats['requests']
+			new, rankedShare = await self._crawl_summoner(accountId, matchNo)
+			#Goes through the queue behind this summoner's matches, so the writer marks it done only after they are buffered.
+			#The request count is approximate when several summoners are in flight; it only feeds the metrics.
+			await self._queue.put(('done', (accountId, new, rankedShare, self.stats['requests'] - requests)))
+
+	async def _crawl_summoner(self, accountId, matchNo):
+		#(matches queued for writing, share of ranked games in the matchlist or None)
+		try:
+			match_api_response = await self._get(self.api._matchlist_url(accountId))
+		except Exception:
+			self.stats['errors'] += 1
+			return 0, None
+
+		#Go to the next summoner if the match list response code is not 200
+		if match_api_response.status_code != 200:
+			return 0, None
+		self.stats['matchlists'] += 1
+
+		matchJSON = match_api_response.json()
+		M = self.api._select_matches(matchJSON, matchNo, self._queues)
+		#Don't spend a request on a match we already have (or that another worker is fetching right now)
+		queued = await asyncio.gather(*[self._fetch_match(match['gameId']) for match in M if self._seen.claim(match['gameId'])])
+		return sum(queued), ranked_share(matchJSON)
+
+	async def _fetch_match(self, matchId):
+		try:
+			api_query = await self._get(self.api._match_url(matchId))
+		except Exception:
+			self.stats['errors'] += 1
+			self._seen.release(matchId)
+			return 0
+
+		#If the API request code is anything but a 200 then just move along to the next query
+		if api_query.status_code != 200:
+			self._seen.release(matchId)
+			return 0
+		#Check that the match was played on Summoner's rift, mapId = 11
+		record = parse_match(api_query.content, mapId=11)
+		self.stats['matches'] += 1
+		if record is None:
+			return 0
+
+		await self._queue.put(('match', record.rows()))
+		return 1
+
+	async def _writer(self):
+		conn = await self._loop.run_in_executor(self._db, self.api._connect)
+		buffer = WriteBuffer(conn, flush_size=self.flush_size, flush_interval=self.flush_interval, on_flush=self._frontier.checkpoint if self._frontier is not None else None, region=self.api.region)
+		try:
+			while True:
+				try:
+					item = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+				except asyncio.TimeoutError:
+					#Nothing has arrived for a while; don't leave a partial batch sitting in memory
+					await self._loop.run_in_executor(self._db, buffer.flush_if_due)
+					continue
+				if item is None:
+					break
+				kind, value = item
+				if kind == 'match':
+					await self._loop.run_in_executor(self._db, buffer.add_match, value)
+					self.stats['written'] += 1
+					METRICS.inc('crawl_matches_total', region=self.api.region)
+				else:
+					accountId, new, rankedShare, requests = value
+					await self._loop.run_in_executor(self._db, buffer.add, 'mark_crawled', (int(time.time()*1000), new, rankedShare, accountId, self.api.region))
+					record_yield(self.api.region, requests, self.stats['written'], self.stats['requests'])
+					if self._frontier is not None:
+						self._frontier.done(accountId)
+			await self._loop.run_in_executor(self._db, buffer.flush)
+		finally:
+			await self._loop.run_in_executor(self._db, conn.close)
@@ -0,0 +1,136 @@
+import RiotConstants as Consts
+import hashlib
+import json
+import math
+import os
+import pymysql
+import threading
+
+#Two pieces of crawl state that let populate_matches_from_summoners avoid wasting API calls:
+#	SeenMatches remembers every matchId we already have (warmed from the matches table at startup), so a match is
+#	skipped before its match_info request instead of after it, by INSERT IGNORE.
+#	CrawlFrontier is the list of summoners still to be crawled, checkpointed to a file, so a crawl that dies can pick
+#	up where it stopped instead of starting a fresh sample.
+
+class BloomFilter(object):
+	#A plain Bloom filter over integer keys.  Uses a fraction of the memory of a set of Python ints (about 1.8 bytes per
+	#key at a 0.1% error rate, against ~70 for a set), at the price of occasionally claiming to have seen a key it hasn't.
+
+	def __init__(self, capacity, error_rate=0.001):
+		self.size = max(8, int(-capacity*math.log(error_rate)/(math.log(2)**2)))
+		self.hashes = max(1, int(round(self.size/float(capacity)*math.log(2))))
+		self.bits = bytearray((self.size + 7)//8)
+
+	def _positions(self, key):
+		#Double hashing: the k positions are h1 + i*h2 for two halves of one digest
+		digest = hashlib.blake2b(str(key).encode('ascii'), digest_size=16).digest()
+		h1 = int.from_bytes(digest[:8], 'little')
+		h2 = int.from_bytes(digest[8:], 'little') | 1
+		return [(h1 + i*h2) % self.size for i in range(self.hashes)]
+
+	def add(self, key):
+		for p in self._positions(key):
+			self.bits[p >> 3] |= 1 << (p & 7)
+
+	def __contains__(self, key):
+		for p in self._positions(key):
+			if not self.bits[p >> 3] & (1 << (p & 7)):
+				return False
+		return True
+
+class SeenMatches(object):
+	#The set of matchIds that are stored (or are being fetched right now).  Shared by the crawler's worker threads/tasks.
+	#With bloom=True a few new matches will be skipped as false positives; that is usually a good trade when the budget
+	#is API calls and the table has millions of matches.
+
+	def __init__(self, bloom=False, capacity=1000000, error_rate=0.001):
+		self._lock = threading.Lock()
+		self._bloom = bloom
+		self._ids = BloomFilter(capacity, error_rate) if bloom else set()
+		self.skipped = 0
+
+	@classmethod
+	def from_db(cls, conn, bloom=Consts.SEEN_MATCHES['bloom'], error_rate=Consts.SEEN_MATCHES['error_rate'], region=None):
+		#With region, only that region's matches (matchIds are only unique within a region)
+		where, args = (' WHERE region = %s', (region,)) if region is not None else ('', ())
+		cur = conn.cursor()
+		cur.execute('SELECT COUNT(*) FROM matches' + where, args)
+		count = cur.fetchone()[0]
+		cur.close()
+		seen = cls(bloom=bloom, capacity=max(2*count, 100000), error_rate=error_rate)
+		#An index-only scan (the region index holds the primary key).  An unbuffered cursor streams the ids from the server
+		#in chunks; the default cursor would materialize millions of tuples before the first fetchmany returned.
+		cur = conn.cursor(pymysql.cursors.SSCursor)
+		cur.execute('SELECT matchId FROM matches' + where, args)
+		while True:
+			rows = cur.fetchmany(10000)
+			if not rows:
+				break
+			for row in rows:
+				seen._ids.add(row[0])
+		cur.close()
+		return seen
+
+	def claim(self, matchId):
+		#True if matchId is new, in which case it is now marked as seen.  False if we have it already.
+		with self._lock:
+			if matchId in self._ids:
+				self.skipped += 1
+				return False
+			self._ids.add(matchId)
+			return True
+
+	def release(self, matchId):
+		#The fetch for a claimed match failed, so let a later summoner try it again.  A Bloom filter can't forget, so there
+		#the match just stays skipped for the rest of this crawl.
+		if not self._bloom:
+			with self._lock:
+				self._ids.discard(matchId)
+
+class CrawlFrontier(object):
+	#Summoners still to crawl, kept in order and saved to `path` as JSON.
+	#A summoner only counts as done once everything fetched for it has been committed: the crawler calls done(accountId)
+	#after handing the summoner's matches to the WriteBuffer, and the buffer calls checkpoint() after each commit.
+
+	def __init__(self, path):
+		self.path = path
+		self.pending = []
+		self.matchNo = None
+		self._done = set()
+		self._lock = threading.Lock()
+		if os.path.isfile(path):
+			with open(path, encoding='utf-8') as f:
+				state = json.load(f)
+			self.pending = state['pending']
+			self.matchNo = state['matchNo']
+
+	def start(self, accountIds, matchNo):
+		self.pending = list(accountIds)
+		self.matchNo = matchNo
+		self._done = set()
+		self.checkpoint()
+
+	def __len__(self):
+		return len(self.pending)
+
+	def done(self, accountId):
+		with self._lock:
+			self._done.add(accountId)
+
+	def checkpoint(self):
+		with self._lock:
+			if self._done:
+				self.pending = [a for a in self.pending if a not in self._done]
+				self._done = set()
+			state = {'pending':self.pending, 'matchNo':self.matchNo}
+		#Write to a temporary file and rename it into place, so a crash mid-write can't leave a corrupt checkpoint
+		tmp = self.path + '.tmp'
+		with open(tmp, 'w', encoding='utf-8') as f:
+			json.dump(state, f)
+		os.replace(tmp, self.path)
+
+	def finish(self):
+		#The crawl completed; there is nothing to resume
+		if os.path.isfile(self.path):
+			os.remove(self.path)
+		self.pending = []
@@ -0,0 +1,106 @@
+import RiotConstants as Consts
+import numpy as np
+import time
+from Metrics import METRICS
+from SummonerSampler import SummonerSampler
+
+#Chooses which summoners to crawl next by the new data we expect to get out of them.
+#
+#A uniform sample spends much of the rate limit on summoners whose matchlists are full of matches we already have, or
+#of games we then throw away.  CrawlScheduler samples a larger pool of candidates (Consts.SCHEDULER['candidates'] per
+#summoner wanted) and hands back the best of them, best first, scored by
+#	yield      new matches per crawl so far: (newMatches + m*prior)/(crawls + prior), where m is the mean over the
+#	           candidates (itself pulled towards one match per crawl, so it is never 0), so a summoner with one lucky
+#	           (or unlucky) crawl isn't taken at face value
+#	staleness  1 - exp(-days since last crawled/staleness_days): just-crawled summoners have had no time to play
+#	           (never crawled counts as fully stale)
+#	tier gap   how short their tier is of an even share of the region's matches we have, from match_tiers, capped at
+#	           max_tier_boost
+#	queue      the share of ranked games in their last matchlist (the region's mean until we've seen one)
+#The history behind the first and last is kept in summoner_sample by every crawl (Consts.SQL['mark_crawled']).
+#
+#The prioritized crawl also only requests games from Consts.RANKED_QUEUES, so no request goes on a game that would be
+#dropped for not being on Summoner's Rift.
+
+def ranked_share(matchJSON):
+	#Share of the games in a matchlist response that are ranked Summoner's Rift games, or None for an empty list
+	matches = matchJSON['matches']
+	if not matches:
+		return None
+	return sum(1 for match in matches if match.get('queue') in Consts.RANKED_QUEUES)/float(len(matches))
+
+def record_yield(region, requests, written, requests_made):
+	#Add a summoner's API calls to the crawl totals and update the yield gauge (written and requests_made are the
+	#crawl's running totals)
+	METRICS.inc('crawl_requests_total', requests, region=region)
+	if requests_made:
+		METRICS.set('crawl_yield_per_request', written/float(requests_made), region=region)
+
+class CrawlScheduler(object):
+
+	def __init__(self, conn, region=Consts.REGIONS['north_america'], settings=Consts.SCHEDULER):
+		self.conn = conn
+		self.region = region
+		self.settings = settings
+
+	def tier_weights(self):
+		#{tier: multiplier} from the number of this region's matches we have at each tier (an index-only count on
+		#match_tiers' (region, tierBucket) key)
+		values = dict((tier, value) for tier, value in Consts.TIER_VALUES.items() if value is not None)
+		counts = dict((value, 0) for value in values.values())
+		cur = self.conn.cursor()
+		cur.execute('SELECT tierBucket, COUNT(*) FROM match_tiers WHERE region = %s GROUP BY tierBucket', (self.region,))
+		for bucket, n in cur.fetchall():
+			if bucket in counts:
+				counts[bucket] = int(n)
+		cur.close()
+		mean = sum(counts.values())/float(len(counts))
+		if mean == 0:
+			return dict((tier, 1.0) for tier in values)
+		boost = self.settings['max_tier_boost']
+		return dict((tier, min(boost, mean/counts[value]) if counts[value] else boost) for tier, value in values.items())
+
+	def candidates(self, accountIds):
+		#(accountIds, tier, lastCrawled, crawls, newMatches, rankedShare) columns for the candidates
+		cur = self.conn.cursor()
+		rows = []
+		for i in range(0, len(accountIds), Consts.NAME_CHUNK_SIZE):
+			chunk = list(accountIds[i:i+Consts.NAME_CHUNK_SIZE])
+			cur.execute('SELECT accountId, tier, lastCrawled, crawls, newMatches, rankedShare FROM summoner_sample WHERE region = %s AND accountId IN (' + ','.join(['%s']*len(chunk)) + ')', [self.region] + chunk)
+			rows.extend(cur.fetchall())
+		cur.close()
+		return rows
+
+	def score(self, rows, tier_weights, now=None):
+		#Expected yield of each candidate row (see the top of the file), as a NumPy array
+		now = now if now is not None else time.time()*1000
+		if not rows:
+			return np.zeros(0)
+		tiers = [row[1] for row in rows]
+		lastCrawled = np.array([row[2] if row[2] is not None else np.nan for row in rows], dtype=float)
+		crawls = np.array([row[3] or 0 for row in rows], dtype=float)
+		newMatches = np.array([row[4] or 0 for row in rows], dtype=float)
+		rankedShare = np.array([row[5] if row[5] is not None else np.nan for row in rows], dtype=float)
+
+		prior = self.settings['prior_crawls']
+		mean_yield = (newMatches.sum() + prior)/(crawls.sum() + prior)
+		expected = (newMatches + prior*mean_yield)/(crawls + prior)
+
+		days = (now - lastCrawled)/86400000.0
+		staleness = np.where(np.isnan(days), 1.0, 1 - np.exp(-np.maximum(days, 0)/self.settings['staleness_days']))
+
+		gap = np.array([tier_weights.get(tier, 1.0) for tier in tiers])
+
+		seen = ~np.isnan(rankedShare)
+		queue = np.where(seen, rankedShare, rankedShare[seen].mean() if seen.any() else 1.0)
+
+		return expected*staleness*gap*queue
+
+	def next(self, k, tiers=None):
+		#The k best of a random pool of candidates from this region (or from tiers, if given), best first
+		sampler = SummonerSampler(self.conn)
+		pool = list(dict.fromkeys(sampler.sample(k*self.settings['candidates'], tiers=tiers, region=self.region)))
+		rows = self.candidates(pool)
+		scores = self.score(rows, self.tier_weights())
+		order = np.argsort(-scores, kind='stable')[:k]
+		return [rows[i][0] for i in order]
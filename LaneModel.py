@@ -0,0 +1,314 @@
+import RiotConstants as Consts
+import numpy as np
+import os
+
+#The bot lane network behind find_best_bot_lane_duo, trained once and kept on disk.
+#
+#Training is done with TensorFlow, but once trained the network is just three weight matrices, so they are saved as an
+#.npz and evaluated with NumPy.  Loading the model doesn't need TensorFlow at all, and scoring any number of opponent
+#lanes is three matrix products.
+#
+#Every saved model carries the version of the data it was trained on (snapshot_version): the meta champion lists and
+#the number of qualifying matches.  On the next load it is retrained if the meta lists have changed or the number of
+#qualifying matches has moved by more than a threshold, like MatchupTable below, so new matches from a running crawl
+#don't throw the model away one at a time.
+#
+#There are only 14*14 possible opponent lanes, so MatchupTable scores all of them in one batch and stores the ranked
+#duos for each.  A recommendation is then an array lookup.  The table remembers how many qualifying matches it was
+#built from and is only rebuilt (retraining the network) once that number has moved by more than a threshold.
+
+#These lists fix the categorical positions of the 14 in-meta supports and ADCs in the network's inputs and outputs
+SUPPORTS = ('Zyra', 'Bard', 'Braum', 'Soraka', 'Leona', 'Janna', 'Nami', 'Karma', 'Lulu', 'Morgana', 'Sona', 'Blitzcrank', 'Rakan', 'Thresh')
+ADCS = ('Caitlyn', 'Xayah', 'Lucian', 'Draven', 'Jinx', 'Vayne', 'Twitch', 'Ashe', 'Ezreal', 'MissFortune', 'Jhin', 'Varus', 'Tristana', 'KogMaw')
+SUPPORT_INDEX = {champ:i for i, champ in enumerate(SUPPORTS)}
+ADC_INDEX = {champ:i for i, champ in enumerate(ADCS)}
+
+N_INPUT = len(SUPPORTS) + len(ADCS)
+N_CLASSES = len(SUPPORTS)*len(ADCS)
+
+def duo_class(support, adc):
+	#Output class of a (support, adc) pair, ordered lexicographically by support > adc
+	return ADC_INDEX[adc] + len(ADCS)*SUPPORT_INDEX[support]
+
+def class_duo(i):
+	#Inverse of duo_class, as (adc, support) like the original output
+	return (ADCS[i % len(ADCS)], SUPPORTS[i//len(ADCS)])
+
+def encode(opponents):
+	#Network inputs for a list of opponent (support, adc) pairs: one row per pair, with a 1 in the support's column and
+	#a 1 in 14 + the adc's column
+	x = np.zeros((len(opponents), N_INPUT), dtype=np.float32)
+	rows = np.arange(len(opponents))
+	x[rows, [SUPPORT_INDEX[s] for s, a in opponents]] = 1
+	x[rows, [len(SUPPORTS) + ADC_INDEX[a] for s, a in opponents]] = 1
+	return x
+
+def snapshot_version(conn, qualifying=None):
+	#Identifies the data a model was trained on, as '<meta supports>-<meta ADCs>-<qualifying matches>'.  The meta counts
+	#are two small lookups; the qualifying count is one grouped pass over the junction table (qualifying_matches), so
+	#pass it in if it is already known.
+	if qualifying is None:
+		qualifying = qualifying_matches(conn)
+	cur = conn.cursor()
+	cur.execute('SELECT (SELECT COUNT(*) FROM meta_supports), (SELECT COUNT(*) FROM meta_adc)')
+	supports, adcs = cur.fetchone()
+	cur.close()
+	return '%d-%d-%d' % (supports, adcs, qualifying)
+
+def is_current(version, current, stale_fraction=Consts.LANE_MODEL['stale_fraction']):
+	#Whether a model trained on data of snapshot version still fits the data of version current: the same meta lists,
+	#and a number of qualifying matches within stale_fraction of the one it was trained on
+	if version is None or version.count('-') != 2:
+		return False
+	meta, qualifying = version.rsplit('-', 1)
+	current_meta, current_qualifying = current.rsplit('-', 1)
+	return meta == current_meta and abs(int(current_qualifying) - int(qualifying)) <= stale_fraction*max(int(qualifying), 1)
+
+#Matches where all four bot laners are on in-meta champions, which are the ones the network is trained on
+_QUALIFYING_SQL = "SELECT matchId FROM summonersjctmatches WHERE lane=\'BOTTOM\' AND CASE WHEN role=\'DUO_SUPPORT\' THEN champId IN (SELECT champId FROM meta_supports) WHEN role=\'DUO_CARRY\' THEN champId IN (SELECT champId FROM meta_adc) END GROUP BY matchId, region HAVING count(*) = 4"
+
+def qualifying_matches(conn):
+	#The number of matches the network can train on.  One grouped pass over the junction table, with no joins.
+	cur = conn.cursor()
+	cur.execute('SELECT COUNT(*) FROM (' + _QUALIFYING_SQL + ') AS Q')
+	count = cur.fetchone()[0]
+	cur.close()
+	return count
+
+#One row per qualifying match: the champIds of the winning support and ADC and of the losing support and ADC.  A match
+#qualifies when its bottom lane is exactly one in-meta support and one in-meta ADC on each team.  Like the rest of the
+#queries here it sticks to SQL that MySQL, DuckDB and SQLite all run, so the model can be trained from a
+#Storage.AnalyticsStore as well.
+_LANES_SQL = ("SELECT MAX(CASE WHEN j.team = w.winner AND j.role='DUO_SUPPORT' THEN j.champId END), MAX(CASE WHEN j.team = w.winner AND j.role='DUO_CARRY' THEN j.champId END),"
+	" MAX(CASE WHEN j.team <> w.winner AND j.role='DUO_SUPPORT' THEN j.champId END), MAX(CASE WHEN j.team <> w.winner AND j.role='DUO_CARRY' THEN j.champId END)"
+	" FROM summonersjctmatches j JOIN (SELECT matchId, region, CASE WHEN win = 1 THEN 200 ELSE 100 END AS winner FROM matches) w ON w.matchId = j.matchId AND w.region = j.region"
+	" WHERE j.lane='BOTTOM' AND CASE WHEN j.role='DUO_SUPPORT' THEN j.champId IN (SELECT champId FROM meta_supports) WHEN j.role='DUO_CARRY' THEN j.champId IN (SELECT champId FROM meta_adc) END"
+	" GROUP BY j.matchId, j.region HAVING count(*) = 4 AND SUM(CASE WHEN j.team = w.winner AND j.role='DUO_SUPPORT' THEN 1 ELSE 0 END) = 1 AND SUM(CASE WHEN j.team = w.winner AND j.role='DUO_CARRY' THEN 1 ELSE 0 END) = 1"
+	" AND SUM(CASE WHEN j.team <> w.winner AND j.role='DUO_SUPPORT' THEN 1 ELSE 0 END) = 1 AND SUM(CASE WHEN j.team <> w.winner AND j.role='DUO_CARRY' THEN 1 ELSE 0 END) = 1")
+
+def _champ_lookups(conn, min_size=0):
+	#Arrays indexed by champId (at least min_size long) giving the champion's position in SUPPORTS and in ADCS (-1 if it isn't one)
+	cur = conn.cursor()
+	cur.execute('SELECT * FROM meta_champs')
+	meta_champs = cur.fetchall()
+	cur.close()
+	size = max([champ[0] + 1 for champ in meta_champs] + [min_size])
+	supports = np.full(size, -1, dtype=np.int16)
+	adcs = np.full(size, -1, dtype=np.int16)
+	for champId, name in ((champ[0], champ[1]) for champ in meta_champs):
+		supports[champId] = SUPPORT_INDEX.get(name, -1)
+		adcs[champId] = ADC_INDEX.get(name, -1)
+	return supports, adcs
+
+def training_data(conn, fetch_size=100000):
+
+	#INPUTS: an open DB connection
+	#OUTPUTS: Numpy Arrays, bx and by, consisting of all training data.  The training data are as follows:
+
+	#The array bx[j] is a 28x1 int8 array.  The first 14 entries indicate the support player of the losing team; the next 14 entries indicate the ADC of the losing team.
+	#by[j] is the class id (see duo_class) of the winning team's ADC/support pair, as an int16.  That's 30 bytes a match, against 1.75KB
+	#for dense float64 inputs and one-hot labels.
+
+	#One query for all four bot laners of every match, read in blocks straight into an int array
+	cur = conn.cursor()
+	cur.execute(_LANES_SQL)
+	blocks = []
+	while True:
+		rows = cur.fetchmany(fetch_size)
+		if not rows:
+			break
+		blocks.append(np.array(rows, dtype=np.int64).reshape(len(rows), 4))
+	cur.close()
+	lanes = np.concatenate(blocks) if blocks else np.zeros((0, 4), dtype=np.int64)
+
+	#Champion ids to positions, all at once.  Matches with a champion that isn't among the 14 are dropped.
+	supports, adcs = _champ_lookups(conn, int(lanes.max(initial=0)) + 1)
+	win_support, win_adc, lose_support, lose_adc = supports[lanes[:, 0]], adcs[lanes[:, 1]], supports[lanes[:, 2]], adcs[lanes[:, 3]]
+	keep = (win_support >= 0) & (win_adc >= 0) & (lose_support >= 0) & (lose_adc >= 0)
+
+	#Record the losing support and adc
+	rows = np.arange(keep.sum())
+	bx = np.zeros((len(rows), N_INPUT), dtype=np.int8)
+	bx[rows, lose_support[keep]] = 1
+	bx[rows, len(SUPPORTS) + lose_adc[keep]] = 1
+
+	#Record the winning support and adc
+	by = (win_adc[keep] + len(ADCS)*win_support[keep]).astype(np.int16)
+
+	return bx, by
+
+class LaneModel(object):
+
+	#The input to the neural network is an array of length #adc + #support champs.  The elements of the array represent categorical variables that describe the losing team's
+	#champions.  An entry of the input array is 0 if the champ was not part of the losing team, and is equal to 1 if the champ was a part of the losing team.  The output of the
+	#neural network is an array of length 14*14
+
+	#I am using code from: https://github.com/aymericdamien/TensorFlow-Examples/blob/master/examples/3_NeuralNetworks/multilayer_perceptron.py
+	#in order to get myself in a position where I can get familiar with tensorflow.
+
+	def __init__(self, weights, biases, version=None):
+		#weights and biases are dicts of NumPy arrays with keys h1, h2, out and b1, b2, out
+		self.weights = weights
+		self.biases = biases
+		self.version = version
+
+	@classmethod
+	def train(cls, data, labels, version=None, learning_rate=0.001, training_epochs=15, batch_size=100, n_hidden_1=100, n_hidden_2=100, display_step=1):
+		#Only training needs TensorFlow, so it is only imported here
+		import tensorflow as tf
+
+		# tf Graph input
+		x = tf.placeholder("float", [None, N_INPUT])
+		y = tf.placeholder(tf.int32, [None])
+
+		# Store layers weight & bias, randomly initialized.
+		weights = {
+		    'h1': tf.Variable(tf.random_normal([N_INPUT, n_hidden_1])),
+		    'h2': tf.Variable(tf.random_normal([n_hidden_1, n_hidden_2])),
+		    'out': tf.Variable(tf.random_normal([n_hidden_2, N_CLASSES]))
+		}
+		biases = {
+		    'b1': tf.Variable(tf.random_normal([n_hidden_1])),
+		    'b2': tf.Variable(tf.random_normal([n_hidden_2])),
+		    'out': tf.Variable(tf.random_normal([N_CLASSES]))
+		}
+
+		# Create model with 2 hidden layers and an output layer
+		layer_1 = tf.nn.relu(tf.add(tf.matmul(x, weights['h1']), biases['b1']))
+		layer_2 = tf.nn.relu(tf.add(tf.matmul(layer_1, weights['h2']), biases['b2']))
+		pred = tf.matmul(layer_2, weights['out']) + biases['out']
+
+		# Define loss and optimizer
+		cost = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(logits=pred, labels=y))
+		optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(cost)
+
+		training_data = data[:int(0.8*len(data))]
+		training_labels = labels[:int(0.8*len(labels))]
+
+		# Launch the graph
+		with tf.Session() as sess:
+			sess.run(tf.global_variables_initializer())
+
+			# Training cycle
+			for epoch in range(training_epochs):
+				avg_cost = 0.
+				total_batch = int(len(training_data)/batch_size)
+
+				#Randomize the data, keeping every game with its label
+				order = np.random.permutation(len(training_data))
+				training_data, training_labels = training_data[order], training_labels[order]
+
+				# Loop over all batches
+				for i in range(total_batch):
+					#The data are stored compactly (see training_data), so only each batch is widened for the network
+					batch_x, batch_y = training_data[i*batch_size:(i+1)*batch_size].astype(np.float32), training_labels[i*batch_size:(i+1)*batch_size].astype(np.int32)
+					# Run optimization op (backprop) and cost op (to get loss value)
+					_, c = sess.run([optimizer, cost], feed_dict={x: batch_x, y: batch_y})
+					# Compute average loss
+					avg_cost += c / total_batch
+				# Display logs per epoch step
+				if epoch % display_step == 0:
+					print("Epoch:", '%04d' % (epoch+1), "cost=", \
+						"{:.9f}".format(avg_cost))
+			print("Optimization Finished!")
+
+			#Keep the trained parameters as plain arrays
+			return cls(sess.run(weights), sess.run(biases), version)
+
+	def save(self, path):
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		#np.savez adds .npz to names without it, so write to a name that already has it and rename it into place
+		tmp = path + '.tmp.npz'
+		np.savez(tmp, version=np.array(self.version or ''), **dict([('w_' + k, v) for k, v in self.weights.items()] + [('b_' + k, v) for k, v in self.biases.items()]))
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path) as f:
+			weights = {k[2:]:f[k] for k in f.files if k.startswith('w_')}
+			biases = {k[2:]:f[k] for k in f.files if k.startswith('b_')}
+			version = str(f['version']) or None
+		return cls(weights, biases, version)
+
+	def logits(self, x):
+		layer_1 = np.maximum(x.dot(self.weights['h1']) + self.biases['b1'], 0)
+		layer_2 = np.maximum(layer_1.dot(self.weights['h2']) + self.biases['b2'], 0)
+		return layer_2.dot(self.weights['out']) + self.biases['out']
+
+	def scores(self, opponents):
+		#Softmax over the 196 duos for each opponent (support, adc) pair, as an (n, 196) array, in one forward pass
+		z = self.logits(encode(opponents))
+		z = np.exp(z - z.max(axis=1, keepdims=True))
+		return z/z.sum(axis=1, keepdims=True)
+
+	def best_duos(self, opponents):
+		#The best (adc, support) against each opponent (support, adc) pair
+		return [class_duo(i) for i in np.argmax(self.logits(encode(opponents)), axis=1)]
+
+def cached_model(conn, path=Consts.LANE_MODEL['path'], retrain=False, stale_fraction=Consts.LANE_MODEL['stale_fraction'], qualifying=None):
+	#The model saved at path if it still fits the current data (is_current), otherwise a freshly trained one (which is
+	#saved there).  qualifying is the number of qualifying matches, if the caller has already counted them.
+	version = snapshot_version(conn, qualifying)
+	if not retrain and os.path.isfile(path):
+		model = LaneModel.load(path)
+		if is_current(model.version, version, stale_fraction):
+			return model
+	data, labels = training_data(conn)
+	model = LaneModel.train(data, labels, version)
+	model.save(path)
+	return model
+
+class MatchupTable(object):
+	#Scores of every duo against every opponent lane.  Row i is the opponent lane of class i (so duo_class(support, adc)
+	#of the opponents), column j is duo j, and ranking[i] lists the duos from best to worst.
+
+	def __init__(self, scores, qualifying, version=None):
+		self.scores = scores.astype(np.float32)
+		self.ranking = np.argsort(-self.scores, axis=1, kind='stable').astype(np.int16)
+		#The number of qualifying matches and the model version the table was built from
+		self.qualifying = qualifying
+		self.version = version
+
+	@classmethod
+	def build(cls, model, qualifying):
+		opponents = [(SUPPORTS[i//len(ADCS)], ADCS[i % len(ADCS)]) for i in range(N_CLASSES)]
+		return cls(model.scores(opponents), qualifying, model.version)
+
+	def save(self, path):
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		tmp = path + '.tmp.npz'
+		np.savez(tmp, scores=self.scores, qualifying=np.array(self.qualifying), version=np.array(self.version or ''))
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path) as f:
+			return cls(f['scores'], int(f['qualifying']), str(f['version']) or None)
+
+	def is_stale(self, qualifying, stale_fraction=Consts.LANE_MATCHUPS['stale_fraction']):
+		return abs(qualifying - self.qualifying) > stale_fraction*max(self.qualifying, 1)
+
+	def recommend(self, support, adc, top=1):
+		#The top duos against the opponent (support, adc), best first, as ((adc, support), score) pairs
+		opponent = duo_class(support, adc)
+		return [(class_duo(j), float(self.scores[opponent, j])) for j in self.ranking[opponent, :top]]
+
+	def best_duos(self, opponents):
+		#Same answers as LaneModel.best_duos, read from the table
+		return [class_duo(self.ranking[duo_class(s, a), 0]) for s, a in opponents]
+
+def cached_matchups(conn, path=Consts.LANE_MATCHUPS['path'], stale_fraction=Consts.LANE_MATCHUPS['stale_fraction'], rebuild=False):
+	#The table saved at path, unless the number of qualifying matches has moved too far since it was built, in which
+	#case the network is brought up to date and the table rebuilt and saved.  Only a rebuild pays for training.
+	qualifying = qualifying_matches(conn)
+	if not rebuild and os.path.isfile(path):
+		table = MatchupTable.load(path)
+		if not table.is_stale(qualifying, stale_fraction):
+			return table
+	table = MatchupTable.build(cached_model(conn, retrain=rebuild, stale_fraction=stale_fraction, qualifying=qualifying), qualifying)
+	table.save(path)
+	return table
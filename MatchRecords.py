@@ -0,0 +1,89 @@
+import json
+import time
+from Metrics import METRICS, profiled
+
+#Compact records for the parts of a match_info response that we store.
+#
+#A decoded match is a tree of a few hundred dicts and lists, and the ingest loop only needs about 60 values out of it.
+#parse_match decodes the response body and copies those values into three small __slots__ classes, so the dict tree
+#can be dropped straight away and the rows are built from attributes instead of repeated nested lookups.
+#
+#If orjson is installed it is used to decode the body, which is several times faster than the json module.  It is
+#optional; without it parsing falls back to json.
+
+try:
+	import orjson
+	_loads = orjson.loads
+except ImportError:
+	_loads = json.loads
+
+class TeamRecord(object):
+	__slots__ = ('teamId', 'win', 'firstBlood', 'firstTower', 'firstInhibitor', 'firstBaron', 'firstDragon', 'firstRiftHerald', 'towerKills', 'inhibitorKills', 'baronKills', 'dragonKills')
+
+	def __init__(self, team):
+		for field in self.__slots__:
+			setattr(self, field, team[field])
+
+class ParticipantRecord(object):
+	__slots__ = ('summonerId', 'accountId', 'summonerName', 'championId', 'teamId', 'lane', 'role', 'tier')
+
+	def __init__(self, identity, participant):
+		player = identity['player']
+		self.summonerId = player['summonerId']
+		self.accountId = player['accountId']
+		self.summonerName = player['summonerName']
+		self.championId = participant['championId']
+		self.teamId = participant['teamId']
+		self.lane = participant['timeline']['lane']
+		self.role = participant['timeline']['role']
+		self.tier = participant['highestAchievedSeasonTier']
+
+class MatchRecord(object):
+	__slots__ = ('gameId', 'gameDuration', 'seasonId', 'gameVersion', 'mapId', 'teams', 'participants')
+
+	def __init__(self, gameJSON):
+		self.gameId = gameJSON['gameId']
+		self.gameDuration = gameJSON['gameDuration']
+		self.seasonId = gameJSON['seasonId']
+		self.gameVersion = gameJSON['gameVersion']
+		self.mapId = gameJSON['mapId']
+		#In the order of the response: teams[0] is team 100, teams[1] is team 200
+		self.teams = tuple(TeamRecord(team) for team in gameJSON['teams'])
+		#In participantIdentities order, each joined to its entry in participants
+		participants = gameJSON['participants']
+		self.participants = tuple(ParticipantRecord(identity, participants[identity['participantId']-1]) for identity in gameJSON['participantIdentities'])
+
+	def _first(self, field):
+		#We use the convention that team 200 := True and team 100 := False, while neither := None
+		if getattr(self.teams[1], field) == True:
+			return True
+		if getattr(self.teams[0], field) == True:
+			return False
+		return None
+
+	def summoner_rows(self):
+		return [(p.summonerId, p.accountId, p.summonerName) for p in self.participants]
+
+	def match_row(self):
+		#Column order of Consts.SQL['insert_match']
+		blue, red = self.teams[1], self.teams[0]
+		return (self.gameId, self.gameDuration, self.seasonId, self.gameVersion, self._first('firstDragon'), self._first('firstBaron'), self._first('firstRiftHerald'), blue.firstInhibitor, blue.firstTower, blue.firstBlood, red.dragonKills, red.baronKills, red.towerKills, red.inhibitorKills, blue.dragonKills, blue.baronKills, blue.towerKills, blue.inhibitorKills, blue.win == 'Win')
+
+	def jct_rows(self):
+		#Column order of Consts.SQL['insert_jct']
+		return [(p.summonerId, self.gameId, p.championId, p.teamId, p.lane, p.role, p.tier) for p in self.participants]
+
+	def rows(self):
+		#(summoner rows, the match row, junction table rows), as taken by WriteBuffer.add_match
+		return self.summoner_rows(), self.match_row(), self.jct_rows()
+
+@profiled('parse')
+def parse_match(content, mapId=None):
+	#MatchRecord from the raw body (bytes or str) of a match_info response.
+	#With mapId, a game played on any other map gives None, and is never built: games on other maps can lack fields
+	#the record reads (lanes, tiers), which would otherwise raise.
+	start = time.perf_counter()
+	gameJSON = _loads(content)
+	record = MatchRecord(gameJSON) if mapId is None or gameJSON.get('mapId') == mapId else None
+	METRICS.observe('json_parse_seconds', time.perf_counter() - start, kind='match')
+	return record
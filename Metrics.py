@@ -0,0 +1,308 @@
+import RiotConstants as Consts
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#Counters and latency histograms for the crawler and the analyses, so we can see where a run spends its time.
+#
+#The hot paths record into the module-level registry METRICS:
+#	riot_request_seconds{region, endpoint}            histogram of HTTP round trips (RiotAPI._send)
+#	riot_responses_total{region, endpoint, status}    responses by status code
+#	riot_cache_hits_total{region, endpoint}           requests answered by the ResponseCache
+#	rate_limit_wait_seconds_total{region}             time spent sleeping in the RateLimiter
+#	db_flush_seconds                                  histogram of WriteBuffer flushes (executemany + commit)
+#	db_rows_written_total{statement}                  rows written, by Consts.SQL key
+#	db_deadlocks_total                                WriteBuffer flushes rolled back by a deadlock and retried
+#	json_parse_seconds{kind}                          histogram of response parsing (MatchRecords.parse_match)
+#	crawl_summoners_total{region}, crawl_matches_total{region}
+#	analysis_seconds{analysis}                        histogram of win probability and lane lookups
+#	crawl_requests_total{region}                      API calls sent by the crawler (matchlists and matches, not cache hits)
+#	crawl_yield_per_request{region}                   gauge: new Summoner's Rift matches written per crawl API call so far
+#Comparing the request, rate limit and flush totals tells whether a crawl is bound by the network, the rate limit or
+#the DB.
+#
+#Ways to read them:
+#	METRICS.prometheus()                      Prometheus text format
+#	METRICS.serve(port)                       ... served over HTTP at /metrics
+#	METRICS.snapshot(), write_snapshot(path)  a JSON-able dict, once
+#	METRICS.start_snapshots(path, interval)   ... written to path every interval seconds
+#
+#profile(stage) (or the @profiled(stage) decorator) is a cProfile hook around the stages 'crawl', 'request', 'parse' and 'db_flush'.  It does nothing until
+#enable_profiling(stages, directory) is called; after that each stage collects a profile (one per thread, merged on
+#dump) and dump_profiles() writes <directory>/<stage>.prof for pstats or snakeviz.
+
+def _label_key(labels):
+	return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+	items = list(key) + list(extra)
+	if not items:
+		return ''
+	return '{' + ','.join(k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for k, v in items) + '}'
+
+class Histogram(object):
+	#Cumulative-bucket histogram in the Prometheus style: counts[i] is the number of observations <= buckets[i]
+
+	def __init__(self, buckets):
+		self.buckets = tuple(buckets)
+		self.counts = [0]*(len(self.buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def cumulative(self):
+		total = 0
+		out = []
+		for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+			total += n
+			out.append((bound, total))
+		return out
+
+	def quantile(self, q):
+		#Upper bound of the bucket holding the q-th quantile (an estimate, as precise as the buckets)
+		if self.count == 0:
+			return None
+		target = q*self.count
+		for bound, total in self.cumulative():
+			if total >= target:
+				return bound
+
+class Metrics(object):
+
+	def __init__(self, buckets=Consts.METRICS['latency_buckets']):
+		self.buckets = buckets
+		self._lock = threading.Lock()
+		#name -> {label key -> value or Histogram}
+		self.counters = {}
+		self.gauges = {}
+		self.histograms = {}
+		self.started = time.time()
+		self._server = None
+		self._snapshots = None
+
+	def inc(self, name, value=1, **labels):
+		key = _label_key(labels)
+		with self._lock:
+			series = self.counters.setdefault(name, {})
+			series[key] = series.get(key, 0) + value
+
+	def set(self, name, value, **labels):
+		#Gauges hold the last value set
+		key = _label_key(labels)
+		with self._lock:
+			self.gauges.setdefault(name, {})[key] = value
+
+	def observe(self, name, value, **labels):
+		key = _label_key(labels)
+		with self._lock:
+			series = self.histograms.setdefault(name, {})
+			if key not in series:
+				series[key] = Histogram(self.buckets)
+			series[key].observe(value)
+
+	@contextmanager
+	def time(self, name, **labels):
+		#Observe how long the with block takes, in seconds
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(name, time.perf_counter() - start, **labels)
+
+	def reset(self):
+		with self._lock:
+			self.counters = {}
+			self.gauges = {}
+			self.histograms = {}
+			self.started = time.time()
+
+	def prometheus(self):
+		#Everything in the Prometheus text exposition format
+		lines = []
+		with self._lock:
+			for name in sorted(self.counters):
+				lines.append('# TYPE ' + name + ' counter')
+				for key, value in sorted(self.counters[name].items()):
+					lines.append(name + _format_labels(key) + ' ' + repr(float(value)))
+			for name in sorted(self.gauges):
+				lines.append('# TYPE ' + name + ' gauge')
+				for key, value in sorted(self.gauges[name].items()):
+					lines.append(name + _format_labels(key) + ' ' + repr(float(value)))
+			for name in sorted(self.histograms):
+				lines.append('# TYPE ' + name + ' histogram')
+				for key, h in sorted(self.histograms[name].items()):
+					for bound, total in h.cumulative():
+						lines.append(name + '_bucket' + _format_labels(key, [('le', '+Inf' if bound == float('inf') else repr(bound))]) + ' ' + str(total))
+					lines.append(name + '_sum' + _format_labels(key) + ' ' + repr(h.sum))
+					lines.append(name + '_count' + _format_labels(key) + ' ' + str(h.count))
+		return '\n'.join(lines) + '\n'
+
+	def snapshot(self):
+		#A JSON-able summary: counters and gauges as {name: [{labels, value}]}, histograms with count, sum, mean and p50/p90/p99
+		with self._lock:
+			counters = dict((name, [{'labels':dict(key), 'value':value} for key, value in sorted(series.items())]) for name, series in self.counters.items())
+			gauges = dict((name, [{'labels':dict(key), 'value':value} for key, value in sorted(series.items())]) for name, series in self.gauges.items())
+			histograms = {}
+			for name, series in self.histograms.items():
+				histograms[name] = [{'labels':dict(key), 'count':h.count, 'sum':h.sum, 'mean':h.sum/h.count if h.count else None, 'p50':h.quantile(0.5), 'p90':h.quantile(0.9), 'p99':h.quantile(0.99)} for key, h in sorted(series.items())]
+		return {'time':time.time(), 'uptime':time.time() - self.started, 'counters':counters, 'gauges':gauges, 'histograms':histograms}
+
+	def write_snapshot(self, path):
+		#JSON has no infinity, so the open-ended bucket is written as null
+		snapshot = json.loads(json.dumps(self.snapshot()).replace('Infinity', 'null'))
+		tmp = path + '.tmp'
+		with open(tmp, 'w', encoding='utf-8') as f:
+			json.dump(snapshot, f, indent=1)
+		os.replace(tmp, path)
+
+	def start_snapshots(self, path, interval=Consts.METRICS['snapshot_interval']):
+		#Write a snapshot to path every interval seconds (and once more on stop_snapshots) from a daemon thread
+		self.stop_snapshots()
+		stop = threading.Event()
+
+		def loop():
+			while not stop.wait(interval):
+				self.write_snapshot(path)
+			self.write_snapshot(path)
+
+		thread = threading.Thread(target=loop, daemon=True)
+		thread.start()
+		self._snapshots = (stop, thread)
+
+	def stop_snapshots(self):
+		if self._snapshots is not None:
+			stop, thread = self._snapshots
+			stop.set()
+			thread.join()
+			self._snapshots = None
+
+	def serve(self, port=Consts.METRICS['port'], host='127.0.0.1'):
+		#Serve prometheus() at http://host:port/metrics (and snapshot() at /metrics.json) from a daemon thread
+		metrics = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.startswith('/metrics.json'):
+					body, kind = json.dumps(metrics.snapshot()).replace('Infinity', 'null').encode('utf-8'), 'application/json'
+				elif self.path.startswith('/metrics'):
+					body, kind = metrics.prometheus().encode('utf-8'), 'text/plain; version=0.0.4'
+				else:
+					self.send_error(404)
+					return
+				self.send_response(200)
+				self.send_header('Content-Type', kind)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass
+
+		self.stop_serving()
+		self._server = ThreadingHTTPServer((host, port), Handler)
+		self._server.daemon_threads = True
+		threading.Thread(target=self._server.serve_forever, daemon=True).start()
+		return self._server.server_address[1]
+
+	def stop_serving(self):
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+METRICS = Metrics()
+
+#stage -> {thread id -> cProfile.Profile}, for the stages being profiled
+_profiles = {}
+_profile_lock = threading.Lock()
+_profile_local = threading.local()
+_profile_directory = [None]
+
+def enable_profiling(stages=('crawl', 'request', 'parse', 'db_flush'), directory='profiles'):
+	with _profile_lock:
+		_profiles.clear()
+		for stage in stages:
+			_profiles[stage] = {}
+		_profile_directory[0] = directory
+
+def disable_profiling():
+	with _profile_lock:
+		_profiles.clear()
+
+@contextmanager
+def profile(stage):
+	#Profile the with block if stage is being profiled.  Stages nest: a thread can only run one profiler at a time, so
+	#the enclosing stage's profiler is paused while an inner stage runs and resumed when it ends.  Each stage's profile
+	#therefore holds its own time, less the time spent in the stages inside it.
+	if stage not in _profiles:
+		yield
+		return
+	with _profile_lock:
+		profiler = _profiles.get(stage, {}).setdefault(threading.get_ident(), cProfile.Profile())
+	stack = _profile_local.__dict__.setdefault('stack', [])
+	if stack:
+		stack[-1].disable()
+	try:
+		profiler.enable()
+	except ValueError:
+		#Python 3.12+ allows only one active profiler per process; let this block run unprofiled
+		_resume(stack)
+		yield
+		return
+	stack.append(profiler)
+	try:
+		yield
+	finally:
+		profiler.disable()
+		stack.pop()
+		_resume(stack)
+
+def _resume(stack):
+	if stack:
+		try:
+			stack[-1].enable()
+		except ValueError:
+			pass
+
+def profiled(stage):
+	#Decorator form of profile(stage)
+	def decorator(f):
+		@functools.wraps(f)
+		def wrapper(*args, **kwargs):
+			with profile(stage):
+				return f(*args, **kwargs)
+		return wrapper
+	return decorator
+
+def dump_profiles():
+	#Write <directory>/<stage>.prof for every stage that collected anything.  Returns the paths written.
+	paths = []
+	with _profile_lock:
+		directory = _profile_directory[0]
+		stages = dict((stage, list(by_thread.values())) for stage, by_thread in _profiles.items())
+	for stage, profilers in stages.items():
+		stats = None
+		for profiler in profilers:
+			try:
+				stats = pstats.Stats(profiler) if stats is None else stats.add(profiler)
+			except TypeError:
+				#A profiler that never ran has no stats
+				continue
+		if stats is None:
+			continue
+		os.makedirs(directory, exist_ok=True)
+		path = os.path.join(directory, stage + '.prof')
+		stats.dump_stats(path)
+		paths.append(path)
+	return paths
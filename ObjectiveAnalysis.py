@@ -0,0 +1,91 @@
+import RiotConstants as Consts
+import numpy as np
+
+#Win probability given an objective, by tier, for every objective at once.
+#
+#The average tier of each match is computed by the database in one grouped pass over summonersjctmatches and comes
+#back joined to the match row, so there is one query in total rather than one per match.  Everything after that is
+#NumPy over whole columns.
+
+OBJECTIVES = ('firstDrag', 'firstBaron', 'herald', 'firstTurret', 'firstBlood', 'firstInhib')
+
+#For the objectives stored as a plain team 200 boolean, False can also mean nobody took it.  For these two we can tell
+#the difference from the kill counts, so (red column, blue column) says where to look.
+_TAKEN_FROM_COUNTS = {'firstTurret':('redTowers', 'blueTowers'), 'firstInhib':('redInhibs', 'blueInhibs')}
+
+def _tier_case():
+	#SQL expression turning a tier name into its number (NULL for unranked/unknown)
+	return 'CASE tier ' + ' '.join("WHEN '" + tier + "' THEN " + str(value) for tier, value in Consts.TIER_VALUES.items() if value is not None) + ' END'
+
+def load_matches(conn, min_ranked=Consts.MIN_RANKED_PLAYERS):
+	#One row per match with at least min_ranked ranked players: its average tier, the winner and every objective column.
+	#Returns a dict of NumPy arrays.  Booleans come back as floats with NaN for NULL.
+	#The query is plain SQL with no parameters, so it runs the same on MySQL and on the embedded engines of
+	#Storage.AnalyticsStore.  The average is taken here rather than in SQL, where integer division differs between them.
+	columns = ['matchId', 'tierSum', 'ranked', 'win'] + list(OBJECTIVES) + ['redTowers', 'blueTowers', 'redInhibs', 'blueInhibs']
+	sql = ('SELECT m.matchId, t.tier_sum, t.ranked, m.win, ' + ', '.join('m.' + c for c in columns[4:]) +
+		' FROM matches m JOIN (SELECT matchId, region, SUM(' + _tier_case() + ') AS tier_sum, COUNT(' + _tier_case() + ') AS ranked FROM summonersjctmatches GROUP BY matchId, region) t ON t.matchId = m.matchId AND t.region = m.region' +
+		' WHERE t.ranked >= ' + str(int(min_ranked)))
+	cur = conn.cursor()
+	cur.execute(sql)
+	rows = cur.fetchall()
+	cur.close()
+	data = np.array(rows, dtype=float).reshape(len(rows), len(columns))
+	matches = {c:data[:, i] for i, c in enumerate(columns)}
+	matches['matchTier'] = matches.pop('tierSum')/matches.pop('ranked')
+	return matches
+
+def tier_buckets(matchTier):
+	#The tier number each match belongs to: a gold match has 2.5 < tier < 3.5.  Matches sitting exactly on a boundary
+	#belong to neither tier and get 0.
+	nearest = np.rint(matchTier)
+	return np.where(np.abs(matchTier - nearest) < 0.5, nearest, 0).astype(np.int64)
+
+def objective_takers(matches, objective):
+	#Which team took the objective in each match: 200, 100, or 0 if nobody did
+	value = matches[objective]
+	if objective in _TAKEN_FROM_COUNTS:
+		red, blue = _TAKEN_FROM_COUNTS[objective]
+		taken = (matches[red] + matches[blue]) > 0
+	else:
+		taken = ~np.isnan(value)
+	#True means team 200 took it
+	return np.where(taken, np.where(value == 1, 200, 100), 0)
+
+def winners(matches):
+	#win is True when team 200 won
+	return np.where(matches['win'] == 1, 200, 100)
+
+def objective_outcomes(matches, objective):
+	#(taken, taker_won) boolean arrays: whether anybody took the objective, and whether the team that took it won
+	takers = objective_takers(matches, objective)
+	taken = takers != 0
+	return taken, taken & (takers == winners(matches))
+
+def probability_frame(objectives, counts):
+	#counts[objective] = (matches, taken, taker_won), each an array indexed by tier number.  Returns the tidy frame.
+	#pandas is only imported here: the crawler imports this module (through ObjectiveCube) but never builds a frame.
+	import pandas as pd
+	records = []
+	for objective in objectives:
+		match_counts, taken_counts, won_counts = counts[objective]
+		for tier, value in Consts.TIER_VALUES.items():
+			if value is None:
+				continue
+			records.append((objective, tier, int(match_counts[value]), int(taken_counts[value]), int(won_counts[value]), won_counts[value]/float(taken_counts[value]) if taken_counts[value] else np.nan))
+	return pd.DataFrame.from_records(records, columns=['objective', 'tier', 'matches', 'taken', 'taker_won', 'win_probability'])
+
+def win_probabilities(conn, objectives=OBJECTIVES, min_ranked=Consts.MIN_RANKED_PLAYERS):
+	#Tidy frame with one row per (objective, tier): the number of matches at that tier, how many had the objective
+	#taken, how many of those the taking team won, and the resulting probability of winning given the objective.
+	matches = load_matches(conn, min_ranked)
+	buckets = tier_buckets(matches['matchTier'])
+	n_buckets = max(value for value in Consts.TIER_VALUES.values() if value is not None) + 1
+
+	#Counting is a bincount over the tier buckets, so every objective costs a few passes over its column
+	match_counts = np.bincount(buckets, minlength=n_buckets)
+	counts = {}
+	for objective in objectives:
+		taken, taker_won = objective_outcomes(matches, objective)
+		counts[objective] = (match_counts, np.bincount(buckets, weights=taken, minlength=n_buckets), np.bincount(buckets, weights=taker_won, minlength=n_buckets))
+	return probability_frame(objectives, counts)
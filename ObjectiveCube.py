@@ -0,0 +1,164 @@
+import RiotConstants as Consts
+import numpy as np
+from ObjectiveAnalysis import OBJECTIVES, load_matches, objective_takers, probability_frame, tier_buckets, winners
+
+#Aggregates for the objective analyses that are kept up to date at ingest time instead of recomputed per query.
+#	match_tiers: the tier of every match (sum and count of its ranked players' tiers, and the tier bucket that gives),
+#	             keyed by matchId and region like the matches table
+#	objective_counts: the number of matches for every (tier bucket, objective, team that took it, team that won)
+#WriteBuffer passes every match it writes to add(), and calls write() inside its flush transaction, so the counters are
+#committed together with the matches they count and stay current while a crawl runs.  Win probabilities are then read
+#off a few hundred counter rows (win_probabilities) instead of a scan of the matches.  rebuild() recomputes both
+#tables from matches and summonersjctmatches, for backfilling an existing database.
+
+TABLES_SQL = (
+"""CREATE TABLE IF NOT EXISTS match_tiers (
+	matchId BIGINT NOT NULL,
+	region VARCHAR(8) NOT NULL DEFAULT 'na1',
+	tierSum INT NOT NULL,
+	ranked TINYINT NOT NULL,
+	tierBucket TINYINT NOT NULL,
+	PRIMARY KEY (matchId, region),
+	KEY region_bucket_idx (region, tierBucket)
+)""",
+"""CREATE TABLE IF NOT EXISTS objective_counts (
+	tierBucket TINYINT NOT NULL,
+	objective VARCHAR(16) NOT NULL,
+	taker SMALLINT NOT NULL,
+	winner SMALLINT NOT NULL,
+	matches BIGINT NOT NULL,
+	PRIMARY KEY (tierBucket, objective, taker, winner)
+)""")
+
+#Column order of the rows built for Consts.SQL['insert_match'] (see MatchRecord.match_row)
+MATCH_COLUMNS = ('matchId', 'duration', 'season', 'version', 'firstDrag', 'firstBaron', 'herald', 'firstInhib', 'firstTurret', 'firstBlood', 'redDrags', 'redBarons', 'redTowers', 'redInhibs', 'blueDrags', 'blueBarons', 'blueTowers', 'blueInhibs', 'win')
+
+def _tier_sql():
+	return 'CASE j.tier ' + ' '.join("WHEN '" + tier + "' THEN " + str(value) for tier, value in Consts.TIER_VALUES.items() if value is not None) + ' END'
+
+def count_rows(matches, buckets, objectives=OBJECTIVES):
+	#Rows for Consts.SQL['increment_objective_count'] from a dict of match columns and their tier buckets.
+	#Matches without a tier (bucket 0) aren't counted.
+	rows = []
+	has_tier = buckets > 0
+	won_by = winners(matches)[has_tier]
+	for objective in objectives:
+		keys = np.stack([buckets[has_tier], objective_takers(matches, objective)[has_tier], won_by], axis=1)
+		if len(keys) == 0:
+			continue
+		unique, counts = np.unique(keys, axis=0, return_counts=True)
+		rows.extend((int(k[0]), objective, int(k[1]), int(k[2]), int(c)) for k, c in zip(unique, counts))
+	return rows
+
+def ensure_tables(conn):
+	#Create the tables if needed, and backfill them the first time they are used on a database that already has matches
+	cur = conn.cursor()
+	for sql in TABLES_SQL:
+		cur.execute(sql)
+	cur.execute('SELECT 1 FROM match_tiers LIMIT 1')
+	empty = cur.fetchone() is None
+	cur.execute('SELECT 1 FROM matches LIMIT 1')
+	have_matches = cur.fetchone() is not None
+	cur.close()
+	conn.commit()
+	if empty and have_matches:
+		rebuild(conn)
+
+def rebuild(conn):
+	#Recompute match_tiers and objective_counts from scratch, in one transaction
+	cur = conn.cursor()
+	try:
+		cur.execute('DELETE FROM match_tiers')
+		cur.execute('DELETE FROM objective_counts')
+		#Bucket n holds the matches with n - 0.5 < tier < n + 0.5; matches with too few ranked players get bucket 0
+		cur.execute('INSERT INTO match_tiers (matchId, region, tierSum, ranked, tierBucket) SELECT t.matchId, t.region, t.tierSum, t.ranked, CASE WHEN t.ranked >= %s AND ABS(t.tierSum/t.ranked - ROUND(t.tierSum/t.ranked)) < 0.5 THEN ROUND(t.tierSum/t.ranked) ELSE 0 END FROM (SELECT j.matchId, j.region, COALESCE(SUM(' + _tier_sql() + '), 0) AS tierSum, COUNT(' + _tier_sql() + ') AS ranked FROM summonersjctmatches j JOIN matches m ON m.matchId = j.matchId AND m.region = j.region GROUP BY j.matchId, j.region) t', (Consts.MIN_RANKED_PLAYERS,))
+		matches = load_matches(conn)
+		rows = count_rows(matches, tier_buckets(matches['matchTier']))
+		if rows:
+			cur.executemany(Consts.SQL['increment_objective_count'], rows)
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		raise
+	finally:
+		cur.close()
+
+def win_probabilities(conn, objectives=OBJECTIVES):
+	#Same frame as ObjectiveAnalysis.win_probabilities, read from the counters
+	n_buckets = max(value for value in Consts.TIER_VALUES.values() if value is not None) + 1
+	counts = dict((objective, (np.zeros(n_buckets), np.zeros(n_buckets), np.zeros(n_buckets))) for objective in objectives)
+	cur = conn.cursor()
+	cur.execute('SELECT tierBucket, objective, taker, winner, matches FROM objective_counts')
+	for bucket, objective, taker, winner, n in cur.fetchall():
+		if objective not in counts or bucket >= n_buckets:
+			continue
+		match_counts, taken_counts, won_counts = counts[objective]
+		#Every match has exactly one row per objective, so summing over takers and winners counts each match once
+		match_counts[bucket] += n
+		if taker != 0:
+			taken_counts[bucket] += n
+			if taker == winner:
+				won_counts[bucket] += n
+	cur.close()
+	return probability_frame(objectives, counts)
+
+class ObjectiveCube(object):
+	#The ingest-time half: WriteBuffer's staging area for the matches in its current batch, which all come from region
+
+	def __init__(self, region=Consts.REGIONS['north_america']):
+		self.region = region
+		#(match row, sum of ranked tiers, number of ranked players)
+		self.pending = []
+
+	def add(self, match_row, jct_rows):
+		tiers = [Consts.TIER_VALUES.get(row[6]) for row in jct_rows]
+		ranked = [t for t in tiers if t is not None]
+		self.pending.append((match_row, sum(ranked), len(ranked)))
+
+	def clear(self):
+		self.pending = []
+
+	def write(self, cur):
+		#Runs inside WriteBuffer.flush, in the same transaction as the match rows
+		if not self.pending:
+			return
+
+		tierSum = np.array([p[1] for p in self.pending], dtype=float)
+		ranked = np.array([p[2] for p in self.pending], dtype=float)
+		buckets = np.where(ranked >= Consts.MIN_RANKED_PLAYERS, tier_buckets(tierSum/np.maximum(ranked, 1)), 0)
+
+		#Only matches that are new to match_tiers get counted.  A plain read drops the matches that are there already (a
+		#locking read would take gap locks on the keys that aren't, which two writers can both hold and then deadlock on),
+		#and the rest go in with one multi-row INSERT IGNORE, in matchId order so that two writers with overlapping batches
+		#don't wait on each other in a cycle.  If the insert still skips some, another writer committed them in between;
+		#only then is the insert undone and redone a row at a time, where rowcount tells which rows were new.
+		first = {}
+		for i in sorted(range(len(self.pending)), key=lambda i: self.pending[i][0][0]):
+			first.setdefault(self.pending[i][0][0], i)
+		cur.execute('SELECT matchId FROM match_tiers WHERE region = %s AND matchId IN (' + ','.join(['%s']*len(first)) + ')', [self.region] + list(first))
+		for row in cur.fetchall():
+			first.pop(row[0], None)
+		candidates = list(first.values())
+		tier_rows = [(self.pending[i][0][0], self.region, self.pending[i][1], self.pending[i][2], int(buckets[i])) for i in candidates]
+		if not tier_rows:
+			return
+		cur.execute('SAVEPOINT match_tiers')
+		cur.executemany(Consts.SQL['insert_match_tier'], tier_rows)
+		if cur.rowcount == len(tier_rows):
+			inserted = candidates
+		else:
+			cur.execute('ROLLBACK TO SAVEPOINT match_tiers')
+			inserted = []
+			for i, row in zip(candidates, tier_rows):
+				cur.execute(Consts.SQL['insert_match_tier'], row)
+				if cur.rowcount == 1:
+					inserted.append(i)
+		if not inserted:
+			return
+		new = [self.pending[i][0] for i in inserted]
+		new_buckets = [buckets[i] for i in inserted]
+
+		matches = dict((c, np.array([row[i] for row in new], dtype=float)) for i, c in enumerate(MATCH_COLUMNS) if c != 'version')
+		rows = count_rows(matches, np.array(new_buckets, dtype=np.int64))
+		if rows:
+			cur.executemany(Consts.SQL['increment_objective_count'], rows)
@@ -0,0 +1,160 @@
+import RiotConstants as Consts
+import asyncio
+import re
+import threading
+import time
+from Metrics import METRICS
+
+#Riot limits requests per API key on two levels, both enforced separately for every region:
+#	application limits, shared by every call made with the key (e.g. 20 per second and 100 per 2 minutes)
+#	method limits, one set per endpoint (e.g. match_info has its own allowance)
+#Each limit is a (count, seconds) window, and every response reports the current limits and usage in the
+#X-App-Rate-Limit(-Count) and X-Method-Rate-Limit(-Count) headers.  A 429 also carries Retry-After.
+#
+#RateLimiter keeps one token bucket per window, for every region and every (region, endpoint), starting from the
+#defaults in RiotConstants.RATE_LIMITS and adopting whatever the headers say afterwards.  A request has to take a token
+#from every bucket that applies to it.  All state sits behind one lock that is only held for bookkeeping (never while
+#sleeping), so the same limiter can be shared by threads and by asyncio tasks.
+
+#Match an api_url (as built from the RiotConstants.URL templates) back to the endpoint it was built from
+_ENDPOINT_PATTERNS = []
+for _endpoint, _template in Consts.URL.items():
+	if _endpoint == 'base':
+		continue
+	_regex = re.sub(r'\\\{version\\\}', '[^/]+', re.escape(_template))
+	_regex = re.sub(r'\\\{\w+\\\}', '([^/?]+)', _regex)
+	_ENDPOINT_PATTERNS.append((_endpoint, re.compile('^' + _regex + '$')))
+
+def endpoint_of(api_url):
+	#Returns (endpoint name, path parameter) for an api_url, or (None, None) if it doesn't match any known endpoint
+	for endpoint, pattern in _ENDPOINT_PATTERNS:
+		m = pattern.match(api_url)
+		if m is not None:
+			return endpoint, m.group(1) if pattern.groups else None
+	return None, None
+
+#Parse a header value like '20:1,100:120' into [(20, 1), (100, 120)]
+def parse_limits(value):
+	limits = []
+	for item in value.split(','):
+		count, seconds = item.strip().split(':')
+		limits.append((int(count), int(seconds)))
+	return limits
+
+class TokenBucket(object):
+	#limit tokens per `per` seconds, refilled continuously
+
+	def __init__(self, limit, per):
+		self.limit = limit
+		self.per = per
+		self.rate = float(limit)/per
+		self.tokens = float(limit)
+		self.last = time.monotonic()
+
+	def refill(self, now):
+		self.tokens = min(self.limit, self.tokens + (now - self.last)*self.rate)
+		self.last = now
+
+	def wait_time(self, now):
+		#Seconds until a whole token is available (0 if one is available right now)
+		self.refill(now)
+		if self.tokens >= 1:
+			return 0.0
+		return (1 - self.tokens)/self.rate
+
+	def take(self):
+		self.tokens -= 1
+
+	def sync(self, used):
+		#The server told us how many requests it has counted in the current window.  Never trust it to give tokens
+		#back (requests of ours may still be in flight), only to take them away.
+		self.tokens = min(self.tokens, float(self.limit - used))
+
+class RateLimiter(object):
+
+	#One limiter per API key, so every RiotAPI object using the same key shares the same budget
+	_shared = {}
+	_shared_lock = threading.Lock()
+
+	@classmethod
+	def shared(cls, api_key):
+		with cls._shared_lock:
+			if api_key not in cls._shared:
+				cls._shared[api_key] = cls()
+			return cls._shared[api_key]
+
+	def __init__(self, app_limits=Consts.RATE_LIMITS['app'], method_limits=Consts.RATE_LIMITS['method']):
+		self.app_limits = app_limits
+		self.method_limits = method_limits
+		self._lock = threading.Lock()
+		#region -> [TokenBucket], (region, endpoint) -> [TokenBucket]
+		self._app = {}
+		self._method = {}
+		#Same keys as above -> monotonic time before which nothing may be sent (set from Retry-After)
+		self._blocked_until = {}
+		#Total time callers have spent waiting for a token
+		self.time_waited = 0.0
+
+	def _buckets(self, table, key, limits):
+		if key not in table:
+			table[key] = [TokenBucket(limit, per) for limit, per in limits]
+		return table[key]
+
+	def _try_acquire(self, region, endpoint):
+		#Either take a token from every bucket and return 0, or take nothing and return how long to wait before trying again
+		#(which the caller is about to sleep, so it is added to time_waited while we hold the lock)
+		now = time.monotonic()
+		with self._lock:
+			app_key = region
+			method_key = (region, endpoint)
+			buckets = self._buckets(self._app, app_key, self.app_limits) + self._buckets(self._method, method_key, self.method_limits.get(endpoint, []))
+			wait = max([b.wait_time(now) for b in buckets] + [self._blocked_until.get(app_key, 0) - now, self._blocked_until.get(method_key, 0) - now, 0.0])
+			if wait > 0:
+				self.time_waited += wait
+				return wait
+			for b in buckets:
+				b.take()
+			return 0.0
+
+	def acquire(self, region, endpoint):
+		#Block the calling thread until a request to endpoint in region is allowed
+		while True:
+			wait = self._try_acquire(region, endpoint)
+			if wait == 0:
+				return
+			METRICS.inc('rate_limit_wait_seconds_total', wait, region=region)
+			time.sleep(wait)
+
+	async def acquire_async(self, region, endpoint):
+		#Same as acquire, but yields to the event loop instead of blocking it
+		while True:
+			wait = self._try_acquire(region, endpoint)
+			if wait == 0:
+				return
+			METRICS.inc('rate_limit_wait_seconds_total', wait, region=region)
+			await asyncio.sleep(wait)
+
+	def update(self, region, endpoint, response):
+		#Adjust the buckets to what the server says about the limits and our usage of them
+		headers = response.headers
+		with self._lock:
+			for table, key, limit_header, count_header in ((self._app, region, 'X-App-Rate-Limit', 'X-App-Rate-Limit-Count'), (self._method, (region, endpoint), 'X-Method-Rate-Limit', 'X-Method-Rate-Limit-Count')):
+				if limit_header in headers:
+					limits = parse_limits(headers[limit_header])
+					current = table.get(key, [])
+					if sorted(limits) != sorted((b.limit, b.per) for b in current):
+						table[key] = [TokenBucket(limit, per) for limit, per in limits]
+				if count_header in headers and key in table:
+					used = dict((per, count) for count, per in parse_limits(headers[count_header]))
+					for b in table[key]:
+						if b.per in used:
+							b.sync(used[b.per])
+
+			if response.status_code == 429:
+				#Retry-After is missing when the 429 comes from the underlying service rather than our key; back off a second in that case
+				retry_after = float(headers.get('Retry-After', 1))
+				if headers.get('X-Rate-Limit-Type') == 'application':
+					key = region
+				else:
+					key = (region, endpoint)
+				self._blocked_until[key] = max(self._blocked_until.get(key, 0), time.monotonic() + retry_after)
@@ -0,0 +1,97 @@
+import RiotConstants as Consts
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+#Crawls several regions at the same time.
+#
+#Riot's rate limits are per region, so a key that crawls NA and then EUW leaves one region's budget idle the whole
+#time.  RegionScheduler runs one populate_matches_from_summoners per region side by side, each with its own RiotAPI
+#(same key, and the same RateLimiter, which keeps separate buckets for every region) and its own DB connection.
+#Every region waits only on its own limits, so each region added adds its full request budget.
+#
+#Every row the crawler writes is tagged with its region (summoners, matches, summonersjctmatches and the derived tables
+#all get a region column, see ensure_region_columns), and each region samples only its own summoners.  Ids are only
+#unique within a region, so the region is also part of the primary keys: an EUW match with the same matchId as an NA
+#one is a different match, not a duplicate for INSERT IGNORE to drop.
+
+#Tables that get a region column, any index that goes with it, their primary key, and the column whose latest value is
+#kept when rows collide on the new key (None if they can't).  Rows from before the column existed came from the NA
+#crawl, so that is the default.
+REGION_COLUMNS = (
+	('summoners', None, ('summonerId', 'region'), 'revisionDate'),
+	('matches', 'KEY region_idx (region)', ('matchId', 'region'), None),
+	('summonersjctmatches', None, ('summonerId', 'matchId', 'region'), None),
+	('summoner_sample', 'KEY region_rnd_idx (region, rnd)', ('accountId', 'region'), None),
+	('match_tiers', 'KEY region_bucket_idx (region, tierBucket)', ('matchId', 'region'), None)
+)
+
+def ensure_region_columns(conn):
+	#Add the region column to the tables that don't have it yet, and region to their primary keys
+	cur = conn.cursor()
+	cur.execute("SELECT TABLE_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME = 'region'")
+	have = set(row[0] for row in cur.fetchall())
+	cur.execute('SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()')
+	tables = set(row[0] for row in cur.fetchall())
+	cur.execute("SELECT TABLE_NAME FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = DATABASE() AND CONSTRAINT_NAME = 'PRIMARY' AND COLUMN_NAME = 'region'")
+	keyed = set(row[0] for row in cur.fetchall())
+	for table, index, key, latest in REGION_COLUMNS:
+		if table not in tables:
+			continue
+		if table not in have:
+			cur.execute('ALTER TABLE ' + table + " ADD COLUMN region VARCHAR(8) NOT NULL DEFAULT '" + Consts.REGIONS['north_america'] + "'" + (', ADD ' + index if index else ''))
+		if table not in keyed:
+			_rekey(cur, table, key, latest)
+	cur.close()
+	conn.commit()
+
+def _rekey(cur, table, key, latest):
+	#Move table to a new primary key.  The old keys could be wider than the new one (the old summoners key was every
+	#column, and the old seed loader wrote a summoner once per revisionDate), so the rows are copied into a table with the
+	#new key by INSERT IGNORE, latest first, which keeps one row per key, and the copy is swapped in.
+	new, old = table + '_rekey', table + '_prekey'
+	cur.execute('DROP TABLE IF EXISTS ' + new)
+	cur.execute('CREATE TABLE ' + new + ' LIKE ' + table)
+	cur.execute('ALTER TABLE ' + new + ' DROP PRIMARY KEY, ADD PRIMARY KEY (' + ', '.join(key) + ')')
+	cur.execute('INSERT IGNORE INTO ' + new + ' SELECT * FROM ' + table + (' ORDER BY ' + latest + ' DESC' if latest else ''))
+	cur.execute('RENAME TABLE ' + table + ' TO ' + old + ', ' + new + ' TO ' + table)
+	cur.execute('DROP TABLE ' + old)
+
+class RegionScheduler(object):
+
+	def __init__(self, api, regions=tuple(Consts.REGIONS.values())):
+		#api is a RiotAPI; the crawl in each region uses a copy of it for that region
+		self.apis = dict((region, api if region == api.region else api.for_region(region)) for region in regions)
+		self.results = {}
+
+	def _crawl(self, region, sumNo, matchNo, options):
+		#Each region keeps its own checkpoint file
+		if options.get('checkpoint') is not None:
+			options = dict(options, checkpoint=options['checkpoint'] + '.' + region)
+		start = time.time()
+		try:
+			result = self.apis[region].populate_matches_from_summoners(sumNo, matchNo, **options)
+		except Exception as e:
+			print('The crawl in ' + region + ' failed: ' + repr(e))
+			result = {'region':region, 'summoners':0, 'matches':0, 'seconds':time.time() - start, 'error':repr(e)}
+		self.results[region] = result
+		return result
+
+	def run(self, sumNo, matchNo, **options):
+		#Crawl sumNo summoners and matchNo of their matches in every region at once.  options are passed on to
+		#populate_matches_from_summoners.  Returns report().
+		#Migrate the schema before the region threads start, so they never ALTER the same tables at once
+		next(iter(self.apis.values())).ensure_schema()
+		with ThreadPoolExecutor(len(self.apis)) as pool:
+			futures = [pool.submit(self._crawl, region, sumNo, matchNo, options) for region in self.apis]
+			for future in futures:
+				future.result()
+		report = self.report()
+		print(report.to_string())
+		return report
+
+	def report(self):
+		#Throughput per region: summoners crawled, matches written, seconds taken and matches written per second
+		import pandas as pd
+		frame = pd.DataFrame([self.results[region] for region in self.apis if region in self.results], columns=['region', 'summoners', 'matches', 'seconds'])
+		frame['matches_per_second'] = frame['matches']/frame['seconds'].where(frame['seconds'] > 0)
+		return frame.set_index('region')
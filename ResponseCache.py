@@ -0,0 +1,118 @@
+import RiotConstants as Consts
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+#Cache for API responses that sits under RiotAPI._request.  Two tiers:
+#	a bounded in-memory LRU of recent responses
+#	an optional directory of zlib-compressed bodies, which survives between runs
+#How long a response stays valid depends on its endpoint (Consts.CACHE_TTL).  Finished matches and their timelines
+#never change, so those are kept forever; summoners and matchlists do change, so they only live for a short while.
+#Only 200 responses are cached.
+
+class CachedResponse(object):
+	#Just enough of requests.Response for the code that reads API responses
+
+	def __init__(self, content, status_code=200):
+		self.content = content
+		self.status_code = status_code
+		self.headers = {}
+		self.from_cache = True
+
+	def json(self):
+		return json.loads(self.content.decode('utf-8'))
+
+class ResponseCache(object):
+
+	def __init__(self, directory=None, max_entries=2000, ttl=Consts.CACHE_TTL):
+		self.directory = directory
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		#key -> (expiry time or None, body)
+		self._memory = OrderedDict()
+		self.hits = {'memory':0, 'disk':0}
+		self.misses = 0
+		self.stores = 0
+		if directory is not None:
+			os.makedirs(directory, exist_ok=True)
+
+	def stats(self):
+		with self._lock:
+			return {'memory_hits':self.hits['memory'], 'disk_hits':self.hits['disk'], 'misses':self.misses, 'stores':self.stores, 'entries':len(self._memory)}
+
+	def _ttl(self, endpoint):
+		#None means never expire, 0 means don't cache at all.  Unknown endpoints aren't cached.
+		return self.ttl.get(endpoint, 0)
+
+	def _key(self, region, api_url, params):
+		return region + '/' + api_url + ('?' + '&'.join(k + '=' + str(v) for k, v in sorted(params.items())) if params else '')
+
+	def _path(self, endpoint, key):
+		return os.path.join(self.directory, endpoint, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.z')
+
+	def get(self, region, endpoint, api_url, params={}):
+		#Returns a CachedResponse, or None if there is nothing valid cached
+		ttl = self._ttl(endpoint)
+		if ttl == 0:
+			return None
+		key = self._key(region, api_url, params)
+		now = time.time()
+
+		with self._lock:
+			entry = self._memory.get(key)
+			if entry is not None:
+				if entry[0] is None or entry[0] > now:
+					self._memory.move_to_end(key)
+					self.hits['memory'] += 1
+					return CachedResponse(entry[1])
+				del self._memory[key]
+
+		if self.directory is not None:
+			path = self._path(endpoint, key)
+			try:
+				#The file's mtime is when it was stored
+				stored = os.path.getmtime(path)
+				if ttl is None or stored + ttl > now:
+					with open(path, 'rb') as f:
+						content = zlib.decompress(f.read())
+					with self._lock:
+						self.hits['disk'] += 1
+						self._remember(key, None if ttl is None else stored + ttl, content)
+					return CachedResponse(content)
+			except (OSError, zlib.error):
+				pass
+
+		with self._lock:
+			self.misses += 1
+		return None
+
+	def put(self, region, endpoint, api_url, params, response):
+		ttl = self._ttl(endpoint)
+		if ttl == 0 or response.status_code != 200:
+			return
+		key = self._key(region, api_url, params)
+		content = response.content
+		with self._lock:
+			self.stores += 1
+			self._remember(key, None if ttl is None else time.time() + ttl, content)
+
+		if self.directory is not None:
+			path = self._path(endpoint, key)
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			#Write to a temporary name and rename, so a reader (or a crash) never sees half a file
+			tmp = path + '.' + str(threading.get_ident()) + '.tmp'
+			with open(tmp, 'wb') as f:
+				f.write(zlib.compress(content, 6))
+			os.replace(tmp, path)
+
+	def _remember(self, key, expires, content):
+		#Caller holds the lock
+		self._memory[key] = (expires, content)
+		self._memory.move_to_end(key)
+		while len(self._memory) > self.max_entries:
+			self._memory.popitem(last=False)
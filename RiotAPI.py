@@ -1,55 +1,108 @@
 import RiotConstants as Consts
-import ChampStaticData as ChampData
-import tensorflow as tf
-import numpy as np
+from AsyncCrawler import AsyncCrawler
+from RateLimiter import RateLimiter, endpoint_of
+from ResponseCache import ResponseCache
+from WriteBuffer import WriteBuffer
+from SeedReader import iter_matches, seed_files, seed_summoner_rows
+from CrawlFrontier import CrawlFrontier, SeenMatches
+from SummonerSampler import SummonerSampler
+from CrawlScheduler import CrawlScheduler, ranked_share, record_yield
+from ObjectiveAnalysis import OBJECTIVES
+import ObjectiveCube
+from MatchRecords import MatchRecord, parse_match
+from RegionScheduler import RegionScheduler, ensure_region_columns
+from Metrics import METRICS, profile, profiled
+from Storage import MySQLStorage
 import requests
+from requests.adapters import HTTPAdapter
 import pymysql
-import json
-import pandas as pd
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from warnings import filterwarnings
 filterwarnings('ignore', category = pymysql.Warning)
-import matplotlib.pyplot as plt 
-import seaborn as sns 
+
+#Only what the HTTP client and the crawler need is imported here, so a crawl worker starts quickly (see crawl.py).
+#The analyses import their modules (and with them pandas, matplotlib and TensorFlow) inside the methods that use them.
+
+def _normalize_name(name):
+	#Summoner names are unique ignoring case and spaces
+	return name.replace(' ', '').lower()
 
 class RiotAPI(object):
 
-	def __init__(self, api_key, region=Consts.REGIONS['north_america']):
+	def __init__(self, api_key, region=Consts.REGIONS['north_america'], base_url=Consts.URL['base'], rate_limiter=None, pool_size=10, timeout=Consts.HTTP_TIMEOUT, cache=None, db=Consts.DB, analytics=None):
 		self.api_key = api_key
 		self.region = region
-
-	#Define the decorator for the request function that limits the rate of API queries
-	def RateLimited(maxPerSecond):
-		minInterval = 1.0 / float(maxPerSecond)
-		def decorate(func):
-			lastTimeCalled = [0.0]
-			def rateLimitedFunction(*args,**kargs):
-				elapsed = time.clock() - lastTimeCalled[0]
-				leftToWait = minInterval - elapsed
-				if leftToWait>0:
-					time.sleep(leftToWait)
-				ret = func(*args,**kargs)
-				lastTimeCalled[0] = time.clock()
-				return ret
-			return rateLimitedFunction
-		return decorate
-
-	#Implement the decorator on _request 
-	@RateLimited(500/10/60)
+		#base_url can be pointed at a local stand-in server (see RiotStub.py) instead of the live API
+		self.base_url = base_url
+		#Rate limits belong to the API key, so by default every RiotAPI object with the same key shares one limiter
+		self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.shared(api_key)
+		#(connect, read) timeouts in seconds for every request
+		self.timeout = timeout
+		#Responses are cached per endpoint (see ResponseCache.py).  Pass ResponseCache(directory) to keep them between runs.
+		self.cache = cache if cache is not None else ResponseCache()
+		#pymysql.connect arguments for the database.  Connections come from a pool shared by every RiotAPI object with the same settings (see Storage.py).
+		self.db = db
+		self.storage = MySQLStorage.shared(db)
+		#A Storage.AnalyticsStore to run the aggregate analyses on instead of MySQL, or None.  See sync_analytics.
+		self.analytics = analytics
+		#The bot lane network and its matchup table, once loaded (see lane_model and lane_matchups)
+		self._lane_model = None
+		self._lane_matchups = None
+		#When each of the two was last checked against the data (time.monotonic())
+		self._lane_checked = {'model':0.0, 'matchups':0.0}
+
+		#One persistent session per RiotAPI object.  Connections are kept alive and reused between requests instead of
+		#paying for a new TCP+TLS handshake every call, and the key goes in a header so there is no params dict to build.
+		self.session = requests.Session()
+		self.session.headers.update({'X-Riot-Token':api_key, 'Accept-Encoding':'gzip, deflate', 'Connection':'keep-alive'})
+		self._mount(pool_size)
+
+	def _mount(self, pool_size):
+		#pool_size is the number of connections kept open per host.  It should be at least the number of threads sharing this object.
+		self.pool_size = pool_size
+		adapter = HTTPAdapter(pool_connections=len(Consts.REGIONS), pool_maxsize=pool_size)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+
+	#Every request waits for the rate limiter, and every response is fed back into it so it can follow the limits in the headers.
+	#429s are retried (the limiter holds us back for Retry-After) up to Consts.MAX_RETRIES times.
 	def _request(self,api_url, params={}):
-		args = {'api_key':self.api_key}
-		for key,value in params.items():
-			if key not in args:
-				args[key] = value
-		response = requests.get(
-			Consts.URL['base'].format(
-				proxy=self.region,
-				region=self.region,
-				url=api_url
-				),
-			params=args
-			)
+		return self._counted_request(api_url, params)[0]
+
+	#(response, number of requests actually sent): 0 for a ResponseCache hit, more than 1 if 429s were retried.  The crawler
+	#counts its API calls with this, the same way AsyncCrawler._get does.
+	def _counted_request(self, api_url, params={}):
+		endpoint = endpoint_of(api_url)[0]
+		cached = self.cache.get(self.region, endpoint, api_url, params)
+		if cached is not None:
+			METRICS.inc('riot_cache_hits_total', region=self.region, endpoint=endpoint)
+			return cached, 0
+		for attempt in range(Consts.MAX_RETRIES + 1):
+			self.rate_limiter.acquire(self.region, endpoint)
+			response = self._send(api_url, params, endpoint)
+			if response.status_code != 429:
+				break
+		return response, attempt + 1
+
+	#Send one request without waiting for the rate limiter.  Callers must have acquired a token first.
+	def _send(self, api_url, params={}, endpoint=None):
+		start = time.perf_counter()
+		with profile('request'):
+			response = self.session.get(
+				self.base_url.format(
+					proxy=self.region,
+					region=self.region,
+					url=api_url
+					),
+				params=params or None,
+				timeout=self.timeout
+				)
+		METRICS.observe('riot_request_seconds', time.perf_counter() - start, region=self.region, endpoint=endpoint)
+		METRICS.inc('riot_responses_total', region=self.region, endpoint=endpoint, status=response.status_code)
+		self.rate_limiter.update(self.region, endpoint, response)
+		self.cache.put(self.region, endpoint, api_url, params, response)
 		return response
 
 	def get_summoner_by_name(self,name):
@@ -60,11 +113,7 @@ class RiotAPI(object):
 		return self._request(api_url).json()
 
 	def get_summoner_matches_by_id(self,accountID):
-		api_url = Consts.URL['match_list'].format(
-			version=Consts.API_VERSIONS['summoner'],
-			accountId=accountID
-			)
-		return self._request(api_url)
+		return self._request(self._matchlist_url(accountID))
 
 	def get_game_ids_by_name(self,name):
 		gameIDs = []
@@ -76,26 +125,68 @@ class RiotAPI(object):
 		return gameIDs
 
 	def write_summoner_to_db(self,name):
-		#Conect to DB
-		
-		conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data')
-		cur = conn.cursor()
+		#One name at a time; see write_summoners_to_db
+		return self.write_summoners_to_db([name])
+
+	def write_summoners_to_db(self, names, concurrency=8, flush_size=Consts.WRITE_BUFFER['flush_size'], chunk_size=Consts.NAME_CHUNK_SIZE):
+		#Look up a list (or any iterable) of summoner names and add them to the summoners table, and to summoner_sample so the crawler can pick them.
+		#It works in three steps:
+			#1. Drop repeated names, and names already in the summoners table for this region.  Names are compared the way Riot does it: ignoring case and spaces.
+			#2. Resolve the rest, up to concurrency at a time.  Every request waits on the shared rate limiter, like the rest of the crawler.
+			#3. Write the summoners found in batches of flush_size rows over one pooled connection.
+		#A name that can't be resolved (unknown name, error response, failed request) is recorded and skipped; the rest of the batch carries on.
+		#Returns {'added': number written, 'existing': names already in the table, 'failed': {name: status code or error}}.
 
-		#This stuff was important before I learned about INSERT IGNORE.  I'm keeping it here for future ref.
-		#sql1 = "SELECT name from summoners where name=%s"
-		#n = cur.execute(sql1, (name))
-
-		#Get JSON data
-		summoner = self.get_summoner_by_name(name)
-		#Construct the insert statement (Table summoners has a primary key built into all columns to prevent duplicates)
-		sql = "INSERT IGNORE INTO summoners (name, id_no, accountId, revisionDate) VALUES (%s,%s,%s,%s)"
-		#Execute the insert
-		cur.execute(sql, (name, summoner['id'], summoner['accountId'], summoner['revisionDate'])) 
-		conn.commit()
-		
-		#Close the connection
+		#STEP 1: {
+		unique = {}
+		for name in names:
+			unique.setdefault(_normalize_name(name), name)
+
+		conn = self._connect()
+		self._ensure_schema(conn)
+		cur = conn.cursor()
+		known = set()
+		keys = list(unique)
+		for i in range(0, len(keys), chunk_size):
+			chunk = keys[i:i+chunk_size]
+			#Normalized on the DB side the same way as _normalize_name, so 'Foo Bar' in the table matches 'foobar' here
+			cur.execute("SELECT username FROM summoners WHERE region = %s AND LOWER(REPLACE(username, ' ', '')) IN (" + ','.join(['%s']*len(chunk)) + ')', [self.region] + chunk)
+			known.update(_normalize_name(row[0]) for row in cur.fetchall())
 		cur.close()
-		conn.close()
+		existing = [name for key, name in unique.items() if key in known]
+		pending = [name for key, name in unique.items() if key not in known]
+		# }
+
+		#STEP 2 and 3: {
+		def lookup(name):
+			try:
+				return self._request(Consts.URL['summoner_by_name'].format(version=Consts.API_VERSIONS['summoner'], names=name))
+			except requests.RequestException as e:
+				return e
+
+		if self.pool_size < concurrency:
+			self._mount(concurrency)
+		failed = {}
+		added = 0
+		try:
+			with WriteBuffer(conn, flush_size=flush_size, region=self.region) as buffer, ThreadPoolExecutor(concurrency) as executor:
+				for name, response in zip(pending, executor.map(lookup, pending)):
+					if isinstance(response, Exception):
+						failed[name] = repr(response)
+						continue
+					if response.status_code != 200:
+						failed[name] = response.status_code
+						continue
+					summoner = response.json()
+					buffer.add('insert_named_summoner', (summoner['id'], summoner['accountId'], summoner['name'], summoner['revisionDate'], self.region))
+					buffer.add('upsert_sample', (summoner['accountId'], None, self.region))
+					added += 1
+		finally:
+			conn.close()
+		# }
+
+		print('Added ' + str(added) + ' summoners, ' + str(len(existing)) + ' were already known and ' + str(len(failed)) + ' could not be found.')
+		return {'added':added, 'existing':existing, 'failed':failed}
 
 	def get_warding_data_histogram(self, accountID, matchID):
 		#This function displays a histogram of wards placed throughout a match, together with important objective timers.
@@ -105,6 +196,9 @@ class RiotAPI(object):
 			#Search all instances of events in the timeline JSON file for type="WARD_PLACED" by "creatorId='summoner' "
 		#Once all the instances of a given summoner creating a ward have been gathered, we place them on a histogram in 2 minute bins
 
+		import matplotlib.pyplot as plt
+		import pandas as pd
+
 		creatorId = 0
 		
 		#URLS to request:
@@ -215,517 +309,587 @@ class RiotAPI(object):
 
 		plt.show()
 
-	def populate_summoners_from_seed(self,file_input):
+	def ingest_timelines(self, matchIds, directory=Consts.TIMELINE_STORE['directory'], concurrency=8, part_size=Consts.TIMELINE_STORE['part_size']):
+		#Fetch the match and timeline of every match in matchIds that isn't stored yet, and add their events to the
+		#columnar store in directory, in this region's part of it (see TimelineStore.py).  Returns the number of matches added.
+		from TimelineStore import TimelineWriter
+		writer = TimelineWriter(directory, self.region)
+		todo = [m for m in dict.fromkeys(matchIds) if m not in writer.stored]
+
+		def fetch(matchId):
+			#Skip the match if either request comes back with anything but a 200
+			match_api = self._request(self._match_url(matchId))
+			if match_api.status_code != 200:
+				return None
+			timeline_api = self._request(self._timeline_url(matchId))
+			if timeline_api.status_code != 200:
+				return None
+			return match_api.json(), timeline_api.json()
+
+		added = 0
+		with ThreadPoolExecutor(max_workers=concurrency) as pool:
+			for result in pool.map(fetch, todo):
+				if result is None:
+					continue
+				if writer.add(*result):
+					added += 1
+				if len(writer) >= part_size:
+					writer.flush()
+		writer.flush()
+		return added
+
+	def warding_profiles(self, accountIds, matchNo=100, directory=Consts.TIMELINE_STORE['directory'], processes=None, bin_minutes=2, export_dir=None):
+		#Batch version of get_warding_data_histogram: ward placement histograms by ward type and elite monster timings over
+		#the last matchNo games of every player in accountIds.  Missing timelines are fetched into the store first, then the
+		#analysis runs on a process pool (see WardAnalysis.py).  Returns (ward_counts, timings) DataFrames, and if export_dir
+		#is given also saves one histogram per player there, without opening any windows.
+		matchIds = []
+		for accountId in accountIds:
+			match_api_response = self.get_summoner_matches_by_id(accountId)
+			if match_api_response.status_code != 200:
+				continue
+			matchIds.extend(match['gameId'] for match in match_api_response.json()['matches'][:matchNo])
+		self.ingest_timelines(matchIds, directory)
+
+		from WardAnalysis import export_figures, warding_analysis
+		ward_counts, timings = warding_analysis(directory, accountIds=accountIds, matchIds=matchIds, bin_minutes=bin_minutes, processes=processes, region=self.region)
+		if export_dir is not None:
+			export_figures(ward_counts, timings, export_dir)
+		return ward_counts, timings
+
+	def populate_summoners_from_seed(self,file_input, flush_size=Consts.WRITE_BUFFER['flush_size']):
 		#file_input should be a string which points to the file directory containing the match seed data provided at:
 			#https://s3-us-west-1.amazonaws.com/riot-developer-portal/seed-data/matches10.json OR
 			#https://s3-us-west-1.amazonaws.com/riot-developer-portal/seed-data/matches1.json
-		with open(file_input,encoding='utf-8') as seed_json:
-			#Load in the JSON data
-			seed = json.load(seed_json)
-	
-			#Open the connection to the mysql server
-			conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data')
-			cur = conn.cursor()
-
-			#For each match in the database, record the summoner information of the participants, together with the corresponding relevant match information
-			for match in seed['matches']:
-				#Insert the data into the summoners table
-				for participant in match['participantIdentities']:
-					summoners_sql = "INSERT IGNORE INTO summoners (summonerId, accountId, username, revisionDate) VALUES (%s,%s,%s,%s)"
-					
-					#There is a stupid formatting error in the data, whereby a players accountId is encoded in their match history from the 29th character onwards, or the 28th
-					#depending on whether or not the server that stores that information is labelled as NA1 or NA.  We need to account for this.
-					if participant['player']['matchHistoryUri'][0:28] == '/v1/stats/player_history/NA1':
-						accId = int(participant['player']['matchHistoryUri'][29:])
-					elif participant['player']['matchHistoryUri'][0:28] == '/v1/stats/player_history/NA/':
-						accId = int(participant['player']['matchHistoryUri'][28:])
-					else:
-						continue
-
-					#Execute and commit the insert query	
-					cur.execute(summoners_sql, (participant['player']['summonerId'], accId, participant['player']['summonerName'], match['matchCreation'])) 
-					conn.commit()
-
-				
-
-			#Close the connection
-			cur.close()
-			conn.close()						
-	
+		#It can also be a directory of seed files or a glob pattern.  The files are streamed one match at a time (see SeedReader.py),
+		#so memory use doesn't grow with the file and rows start going into the DB straight away.
+
+		#Open the connection to the mysql server
+		conn = self._connect()
+		self._ensure_schema(conn)
+
+		#For each match in the seed data, record the summoner information of the participants
+		with WriteBuffer(conn, flush_size=flush_size, region=self.region) as buffer:
+			for path in seed_files(file_input):
+				for match in iter_matches(path):
+					for row in seed_summoner_rows(match):
+						buffer.add('insert_seed_summoner', row + (self.region,))
+						#The seed data has no tier for the participant
+						buffer.add('upsert_sample', (row[1], None, self.region))
 
+		#Close the connection
+		conn.close()
 
-	def populate_matches_from_summoners(self, sumNo, matchNo):
+	@profiled('crawl')
+	def populate_matches_from_summoners(self, sumNo, matchNo, concurrency=None, flush_size=Consts.WRITE_BUFFER['flush_size'], flush_interval=Consts.WRITE_BUFFER['flush_interval'], checkpoint=None, tiers=None, prioritize=False):
 	#This function is a spider that crawls the riot servers to populate our MySQL server.  It works by:
-		#1. Select approximately sumNo summoners at random from the summoners table
+		#1. Select sumNo summoners at random from the summoners table
 			#This turnes out to be surprisingly tricky when the number of entries in the summoners table gets large. See http://www.rndblog.com/how-to-select-random-rows-in-mysql/ for an explanation.
+			#SummonerSampler does it with an index range scan on a random key instead of a full scan.  If tiers is given, the sample is split evenly between those tiers.
 		#2. Pick out matchNo of each of their matches, again at random
 		#3	a) Insert the summoners from those matches into the summoners table
 		#	b) Add the match to the matches table
 		#	c) Update the junction table
-
-		#STEP 1: {
+		#If concurrency is given, steps 2 and 3 are handed to the asyncio crawler, which keeps up to concurrency requests in flight and does the DB writes in a separate writer stage.
+		#Either way, rows are written in batches of flush_size rows (or every flush_interval seconds), one transaction per batch.
+		#Matches already in the matches table are skipped before any request is made for them (see CrawlFrontier.py).
+		#If checkpoint is a file path, the summoners still to crawl are saved there after every batch.  If that file exists when
+		#the crawl starts, the crawl resumes from it instead of sampling new summoners.
+		#With prioritize=True step 1 picks the summoners we expect the most new matches from, and they are crawled best first (see CrawlScheduler.py).
+		#Step 2 then only takes ranked Summoner's Rift games (Consts.RANKED_QUEUES).
+		#Every summoner crawled adds to their yield history, and the new matches written per API call is kept in the crawl_yield_per_request metric.
 
 		#Connect to the DB
-		conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data', charset='utf8')
-		cur = conn.cursor()
+		conn = self._connect()
+		frontier = CrawlFrontier(checkpoint) if checkpoint is not None else None
+		self._ensure_schema(conn)
+		sampler = SummonerSampler(conn)
+
+		if frontier is not None and len(frontier) > 0:
+			accountIds = frontier.pending
+			matchNo = frontier.matchNo
+			print('Resuming the crawl with ' + str(len(accountIds)) + ' summoners left.')
+		else:
+			#STEP 1: {
+			if prioritize:
+				accountIds = CrawlScheduler(conn, self.region).next(sumNo, tiers=tiers)
+			elif tiers is not None:
+				accountIds = sampler.sample_by_tier(sumNo, tiers, region=self.region)
+			else:
+				accountIds = sampler.sample(sumNo, region=self.region)
+			if frontier is not None:
+				frontier.start(accountIds, matchNo)
+
+			print('We are going to fetch the records from ' + str(len(accountIds)) + ' summoners! Beginning now.')
+			# }
+
+		seen = SeenMatches.from_db(conn, region=self.region)
+		queues = Consts.RANKED_QUEUES if prioritize else None
+		start = time.time()
+
+		if concurrency is not None:
+			conn.close()
+			crawler = AsyncCrawler(self, concurrency=concurrency, flush_size=flush_size, flush_interval=flush_interval)
+			stats = crawler.run(accountIds, matchNo, seen=seen, frontier=frontier, queues=queues)
+			matches, requests_made = stats['written'], stats['requests']
+		else:
+			#STEP 2: {
+			buffer = WriteBuffer(conn, flush_size=flush_size, flush_interval=flush_interval, on_flush=frontier.checkpoint if frontier is not None else None, region=self.region)
+			count = 0
+			requests_made = 0
+			new_matches = 0
+			for accountId in accountIds:
+				if count % 100 == 0:
+					print('Progress: ' + str(count) + ' records')
+				count+=1
+				requests, written, rankedShare = self._crawl_summoner(accountId, matchNo, buffer, seen, queues)
+				requests_made += requests
+				new_matches += written
+				METRICS.inc('crawl_summoners_total', region=self.region)
+				record_yield(self.region, requests, new_matches, requests_made)
+				buffer.add('mark_crawled', (int(time.time()*1000), written, rankedShare, accountId, self.region))
+				#Only recorded in the checkpoint once the buffer has committed this summoner's matches
+				if frontier is not None:
+					frontier.done(accountId)
+
+			buffer.close()
+			conn.close()
+			matches = buffer.matches_written
+			# }
+
+		if frontier is not None:
+			frontier.finish()
+		#A summary, for reporting throughput (see RegionScheduler.py)
+		self._matches_written()
+		return {'region':self.region, 'summoners':len(accountIds), 'matches':matches, 'requests':requests_made, 'yield_per_request':matches/float(requests_made) if requests_made else None, 'seconds':time.time() - start}
+
+	def _crawl_summoner(self, accountId, matchNo, buffer, seen, queues=None):
+		#Returns (API calls made, matches added to buffer, share of ranked games in the matchlist or None).  Responses
+		#answered by the ResponseCache are not API calls.
+		match_api_response, requests = self._counted_request(self._matchlist_url(accountId))
+		written = 0
+		
+		#Go to the next summoner if the match list response code is not 200
+		if match_api_response.status_code != 200:
+			return requests, written, None
+		else:
+			matchJSON = match_api_response.json()
 
-		#Find the number of summoners in our table, fix a desired number of summoners to select, then figure out the threshhold probability 
-		query_result = cur.execute('SELECT COUNT(*) FROM summoners')
-		NumSumRows = float(cur.fetchone()[0])
-		P = sumNo/NumSumRows
+		M = self._select_matches(matchJSON, matchNo, queues)
 
-		#Select sumNo rows from summoners at random
-		sql = 'SELECT accountId FROM summoners WHERE RAND() <= ' +  str(P)
-		accountIds = cur.execute(sql)
-		L = cur.fetchall()
+		for match in M:	
+			#Don't spend a request on a match we already have
+			if not seen.claim(match['gameId']):
+				continue
 
-		print('We are going to fetch the records from ' + str(len(L)) + ' summoners! Beginning now.')
-		# }
+			api_query, sent = self._counted_request(self._match_url(match['gameId']))
+			requests += sent
+			
+			if api_query.status_code == 200:
+				#Check that the match was played on Summoner's rift, mapId = 11
+				record = parse_match(api_query.content, mapId=11)
+				if record is None:
+					#Move to the next match if it is a game other than Summoner's rift.
+					continue
 
-		#STEP 2: {
-		count = 0
-		for i in L:
-			if count % 100 == 0:
-				print('Progress: ' + str(count) + ' records')
-			count+=1
-			accountId = i[0]
-			match_api_response = self.get_summoner_matches_by_id(accountId)
+				buffer.add_match(record.rows())
+				written += 1
+				METRICS.inc('crawl_matches_total', region=self.region)
 			
-			#Go to the next summoner if the match list response code is not 200
-			if match_api_response.status_code != 200:
-				continue
+			#If the API request code is anything but a 200 then just move along to the next query
 			else:
-				matchJSON = match_api_response.json()
+				seen.release(match['gameId'])
+				continue	
+
+		return requests, written, ranked_share(matchJSON)
+
+	def refresh_summoners(self, sumNo=None, accountIds=None, concurrency=8, max_matches=Consts.REFRESH['max_matches'], flush_size=Consts.WRITE_BUFFER['flush_size']):
+	#Incremental version of populate_matches_from_summoners: fetches only the games played since the last refresh.
+		#Every summoner has a high-water mark, lastMatchTime in summoner_sample, which is the timestamp of the newest game we've seen in their matchlist.
+		#1. Look the summoner up by accountId.  If they have a mark and their revisionDate hasn't changed since the last refresh, they haven't played: skip them.
+		#2. Otherwise ask for their matchlist from the mark on only (beginTime), a page at a time (beginIndex/endIndex).  A summoner without a mark gets
+		#   Consts.REFRESH['first_pages'] pages of their most recent games looked at, and has a mark from then on.
+		#3. Fetch the matches we don't have yet (up to max_matches per summoner, or all of them if it is None; for a summoner without a mark, the
+		#   newest max_matches of the pages) and write them as the crawler does, then move the mark and
+		#   the stored revisionDate forward.  If anything failed for a summoner their mark stays where it was, so the next refresh tries again.
+		#Steady state that is one request per summoner, plus one matchlist page and the new matches for those who have played.
+		#The summoners are accountIds if given, or else sumNo summoners of this region sampled at random.  Up to concurrency summoners are refreshed at once.
+		conn = self._connect()
+		self._ensure_schema(conn)
+		sampler = SummonerSampler(conn)
+		if accountIds is None:
+			accountIds = sampler.sample(sumNo, region=self.region)
+		accountIds = list(accountIds)
+		state = sampler.refresh_state(accountIds, region=self.region)
+		seen = SeenMatches.from_db(conn, region=self.region)
+
+		def refresh(accountId):
+			revisionDate, mark = state.get(accountId, (None, None))
+			try:
+				return self._refresh_summoner(accountId, revisionDate, mark, seen, max_matches)
+			except requests.RequestException as e:
+				print('Refreshing ' + str(accountId) + ' failed: ' + repr(e))
+				return None
+
+		if self.pool_size < concurrency:
+			self._mount(concurrency)
+		start = time.time()
+		summary = {'region':self.region, 'summoners':len(accountIds), 'unchanged':0, 'refreshed':0, 'failed':0, 'matches':0}
+		try:
+			with WriteBuffer(conn, flush_size=flush_size, region=self.region) as buffer, ThreadPoolExecutor(concurrency) as executor:
+				for accountId, result in zip(accountIds, executor.map(refresh, accountIds)):
+					METRICS.inc('crawl_summoners_total', region=self.region)
+					if result is None:
+						summary['failed'] += 1
+						continue
+					revisionDate, mark, records = result
+					if records is None:
+						summary['unchanged'] += 1
+						METRICS.inc('refresh_unchanged_total', region=self.region)
+					else:
+						summary['refreshed'] += 1
+						for record in records:
+							buffer.add_match(record.rows())
+						METRICS.inc('crawl_matches_total', len(records), region=self.region)
+					buffer.add('mark_refreshed', (int(time.time()*1000), mark, len(records) if records is not None else 0, accountId, self.region))
+					buffer.add('update_revision', (revisionDate, accountId, self.region))
+			summary['matches'] = buffer.matches_written
+		finally:
+			conn.close()
+		summary['seconds'] = time.time() - start
+		self._matches_written()
+		print('Refreshed ' + str(summary['refreshed']) + ' summoners (' + str(summary['matches']) + ' new matches), ' + str(summary['unchanged']) + ' had not played and ' + str(summary['failed']) + ' failed.')
+		return summary
+
+	def _refresh_summoner(self, accountId, revisionDate, mark, seen, max_matches):
+		#(revisionDate, new mark, MatchRecords of the new matches) for one summoner.  The records are None if the summoner
+		#hasn't played since the last refresh.  Returns None if the refresh failed; the summoner is left as it was.
+		summoner_api = self._request(self._summoner_url(accountId))
+		if summoner_api.status_code != 200:
+			return None
+		latest = summoner_api.json()['revisionDate']
+		if mark is not None and latest == revisionDate:
+			return latest, mark, None
 
-			#First throw away any matches played before season 6
-			tempM = [x for x in matchJSON['matches'] if x['season'] >= 6]
+		#STEP 2: {
+		page_size = Consts.REFRESH['page_size']
+		params = {'beginTime':mark + 1} if mark is not None else {}
+		new = []
+		beginIndex = 0
+		while mark is not None or beginIndex < Consts.REFRESH['first_pages']*page_size:
+			params.update(beginIndex=beginIndex, endIndex=beginIndex + page_size)
+			matchlist_api = self._request(self._matchlist_url(accountId), params)
+			#The API answers 404 when there are no games in the range
+			if matchlist_api.status_code == 404:
+				break
+			if matchlist_api.status_code != 200:
+				return None
+			page = matchlist_api.json()
+			new.extend(page['matches'])
+			beginIndex += page_size
+			if len(page['matches']) < page_size or beginIndex >= page.get('totalGames', 0):
+				break
+		# }
 
-			#I need to select matchNo of these entries at random.
-			
-			sumMatchNo = len(tempM)
-			#If there are no matches played after season 6 then I'll get a divide by zero error
-			if sumMatchNo == 0:
+		#STEP 3: {
+		#Oldest first, so that with max_matches a long backlog is worked through over several refreshes.  A summoner without
+		#a mark has no backlog: their first refresh only fetches the newest max_matches games and puts the mark after the
+		#whole page, so it costs no more than a later one.
+		new.sort(key=lambda match: match['timestamp'])
+		left_over = mark is not None and max_matches is not None and len(new) > max_matches
+		if left_over:
+			new = new[:max_matches]
+		elif mark is None and max_matches is not None and len(new) > max_matches:
+			new = new[len(new) - max_matches:]
+		records = []
+		for match in new:
+			if match['season'] < 6 or not seen.claim(match['gameId']):
 				continue
+			api_query = self._request(self._match_url(match['gameId']))
+			if api_query.status_code != 200:
+				seen.release(match['gameId'])
+				#Keep the old mark and revisionDate so the summoner is tried again next time
+				return revisionDate, mark, records
+			#Summoner's rift only, mapId = 11
+			record = parse_match(api_query.content, mapId=11)
+			if record is not None:
+				records.append(record)
+		# }
 
-			matchProb = min(matchNo, sumMatchNo)/sumMatchNo
-			#Now select approximately matchNo matches from the list of matches the summoner has played since season 6
-			M = [x for x in tempM if random.random() <= matchProb]
-
-			for match in M:	
-				#Match information
-				api_url1 = Consts.URL['match_info'].format(
-					version=Consts.API_VERSIONS['summoner'],
-					matchId=match['gameId']
-					) 
-				api_query = self._request(api_url1)
-				gameJSON = api_query.json()
-				
-				if api_query.status_code == 200:
-					#Check that the match was played on Summoner's rift, mapId = 11
-					if gameJSON['mapId'] != 11:
-						#Move to the next match if it is a game other than Summoner's rift.
-						continue
+		newest = max([match['timestamp'] for match in new] + ([mark] if mark is not None else []), default=None)
+		#With games left over, the old revisionDate is kept so the summoner isn't skipped before they're fetched
+		return (revisionDate if left_over else latest), newest, records
+
+	def for_region(self, region):
+		#A RiotAPI for another region with the same key, settings, rate limiter and cache.  The limiter and cache keep
+		#everything per region, so the two objects never compete for a rate limit.
+		return self.__class__(self.api_key, region=region, base_url=self.base_url, rate_limiter=self.rate_limiter, pool_size=self.pool_size, timeout=self.timeout, cache=self.cache, db=self.db, analytics=self.analytics)
+
+	def crawl_regions(self, regions, sumNo, matchNo, **options):
+		#populate_matches_from_summoners in every region at once, one worker per region (see RegionScheduler.py).
+		#Returns the throughput report.
+		return RegionScheduler(self, regions).run(sumNo, matchNo, **options)
+
+	def _connect(self):
+		#A pooled connection; close() returns it to the pool
+		return self.storage.connect()
+
+	def _analytics_connect(self):
+		#Where the aggregate analyses read from: the analytics store if there is one, MySQL otherwise
+		if self.analytics is not None:
+			return self.analytics.connect()
+		return self._connect()
+
+	def ensure_schema(self):
+		#Run the schema migrations now rather than on first use
+		conn = self._connect()
+		try:
+			self._ensure_schema(conn)
+		finally:
+			conn.close()
+
+	def _ensure_schema(self, conn):
+		#The migrations every entry point needs: region columns and keys, summoner_sample and the objective cube tables.
+		#They run once per database per process: RiotAPI objects with the same DB settings share a storage, so the first
+		#one here migrates while any others wait, and after that this is just a flag check.
+		with self.storage.schema_lock:
+			if self.storage.schema_ready:
+				return
+			ensure_region_columns(conn)
+			SummonerSampler(conn).ensure_table()
+			ObjectiveCube.ensure_tables(conn)
+			self.storage.schema_ready = True
+
+	def sync_analytics(self, full=False):
+		#Copy the matches the analytics store doesn't have yet from MySQL (see Storage.AnalyticsStore.sync).  full=True
+		#starts the copy over, which is needed after validate_matches_table.  Returns the number of matches copied.
+		conn = self._connect()
+		try:
+			with METRICS.time('analysis_seconds', analysis='sync_analytics'):
+				copied = self.analytics.sync(conn, full=full)
+		finally:
+			conn.close()
+		#The lane model and matchups are checked against the data the next time they're used
+		self._lane_model = None
+		self._lane_matchups = None
+		return copied
+
+	def _matches_written(self):
+		#Check the lane model and matchups against the data the next time they're used, rather than waiting for
+		#Consts.LANE_MODEL['recheck_interval'] to run out
+		self._lane_checked = {'model':0.0, 'matchups':0.0}
+
+	def _lane_recheck_due(self, which):
+		return time.monotonic() - self._lane_checked[which] >= Consts.LANE_MODEL['recheck_interval']
+
+	def _summoner_url(self, accountId):
+		return Consts.URL['summoner_by_account'].format(
+			version=Consts.API_VERSIONS['summoner'],
+			accountId=accountId
+			)
 
-					#Update the summoners table with new entries from this game
-					for participant in gameJSON['participantIdentities']:
-						summoners_sql = "INSERT IGNORE INTO summoners (summonerId, accountId, username) VALUES (%s,%s,%s)"
-						#Execute and commit the insert query	
-						cur.execute(summoners_sql, (participant['player']['summonerId'], participant['player']['accountId'], participant['player']['summonerName'])) 
-						conn.commit()
-
-					match_sql = "INSERT IGNORE INTO matches (matchId, duration, season, version, firstDrag, firstBaron, herald, firstInhib, firstTurret, firstBlood, redDrags, redBarons, redTowers, redInhibs, blueDrags, blueBarons, blueTowers, blueInhibs, win) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"
-					#Build the insert query for the match table
-
-					#Determine who got first drag, baron, herald, etc.  We use the convention that team 200 := True and team 100 := False, while neither := None
-					if gameJSON['teams'][1]['firstBaron'] == True:
-						fB = True 
-					elif gameJSON['teams'][0]['firstBaron'] == True:
-						fB = False
-					else:
-						fB = None
-					if gameJSON['teams'][1]['firstDragon'] == True:
-						fD = True
-					elif gameJSON['teams'][0]['firstDragon'] == True:
-						fD = False
-					else:
-						fD = None
-					if gameJSON['teams'][1]['firstRiftHerald'] == True:
-						H = True
-					elif gameJSON['teams'][0]['firstRiftHerald'] == True:
-						H = False
-					else:
-						H = None
-	
-					#Determine who won the game
-					#If team 200 won the game
-					if  gameJSON['teams'][1]['win'] == 'Win':
-						W = True
-					#If not, then team 100 won
-					else:
-						W = False
-
-					cur.execute(match_sql, (gameJSON['gameId'], gameJSON['gameDuration'], gameJSON['seasonId'], gameJSON['gameVersion'], fD, fB, H, gameJSON['teams'][1]['firstInhibitor'], gameJSON['teams'][1]['firstTower'], gameJSON['teams'][1]['firstBlood'], gameJSON['teams'][0]['dragonKills'], gameJSON['teams'][0]['baronKills'], gameJSON['teams'][0]['towerKills'], gameJSON['teams'][0]['inhibitorKills'], gameJSON['teams'][1]['dragonKills'], gameJSON['teams'][1]['baronKills'], gameJSON['teams'][1]['towerKills'], gameJSON['teams'][1]['inhibitorKills'], W))
-					conn.commit()
-					
-					for participant in gameJSON['participantIdentities']:
-						#Update the junction table
-						summonerjctmatch_sql = "INSERT IGNORE INTO summonersjctmatches (summonerId, matchId, champId, team, lane, role, tier) VALUES (%s, %s,%s,%s,%s,%s,%s)"
-						participantId = participant['participantId']-1
-						cur.execute(summonerjctmatch_sql, (participant['player']['summonerId'], gameJSON['gameId'], gameJSON['participants'][participantId]['championId'], gameJSON['participants'][participantId]['teamId'], gameJSON['participants'][participantId]['timeline']['lane'] , gameJSON['participants'][participantId]['timeline']['role'], gameJSON['participants'][participantId]['highestAchievedSeasonTier']))
-						conn.commit()
-
-				
-				#If the API request code is anything but a 200 then just move along to the next query
-				else:
-					continue	
+	def _matchlist_url(self, accountId):
+		return Consts.URL['match_list'].format(
+			version=Consts.API_VERSIONS['summoner'],
+			accountId=accountId
+			)
 
-		# }
+	def _match_url(self, matchId):
+		return Consts.URL['match_info'].format(
+			version=Consts.API_VERSIONS['summoner'],
+			matchId=matchId
+			)
+
+	def _timeline_url(self, matchId):
+		return Consts.URL['timeline'].format(
+			version=Consts.API_VERSIONS['summoner'],
+			matchId=matchId
+			)
+
+	def _select_matches(self, matchJSON, matchNo, queues=None):
+		#First throw away any matches played before season 6 (and, if queues is given, games from other queues)
+		tempM = [x for x in matchJSON['matches'] if x['season'] >= 6 and (queues is None or x.get('queue') in queues)]
+
+		#I need to select matchNo of these entries at random.
+		sumMatchNo = len(tempM)
+		#If there are no matches played after season 6 then I'll get a divide by zero error
+		if sumMatchNo == 0:
+			return []
+
+		matchProb = min(matchNo, sumMatchNo)/sumMatchNo
+		#Now select approximately matchNo matches from the list of matches the summoner has played since season 6
+		return [x for x in tempM if random.random() <= matchProb]
+
+	def _match_rows(self, gameJSON):
+		#Turn a decoded match_info response into the rows we store: (summoner rows, the match row, junction table rows).
+		#The crawlers parse the response body straight into a MatchRecord instead (see MatchRecords.py).
+		return MatchRecord(gameJSON).rows()
 
 #		print(accoundIds)
 	
 #I had originally written this method when I had thought there was some problem with the code that recorded summoners into the junction table.  I was finding that there were fewer
 #than 10 summoners per match. The problem was that I forgot to only record data from matches played on summoners rift (whoops).  I am keeping this function in case I need it
 #at some point in the future.
-	def validate_matches_table(self):
-		offset = 300;
+	def validate_matches_table(self, concurrency=8, chunk_size=Consts.VALIDATE_CHUNK_SIZE):
 		#This function goes through the whole matches table and makes sure that all the summoners who played in a match are recorded in summonersjctmatches.  If for some reason (connection error, etc.) a summoner is not recorded, this will fix it.
-		conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data', charset='utf8')
-		cur = conn.cursor()	
-		count_query = 'SELECT count(*) FROM matches'
-		cur.execute(count_query)
-		match_count = cur.fetchone()[0]
-		print(match_count)
-
-		while offset < match_count: #replace w match_count
-			matches_query = 'SELECT matchId FROM matches LIMIT 100 OFFSET ' + str(offset)
-			cur.execute(matches_query)
-			matchIds = cur.fetchall()
-
-			for row in matchIds:
-				Id = row[0]
-				#For each match, check that there are 10 recorded summoners.
-				cur.execute('SELECT summonerId FROM summonersjctmatches WHERE matchId = ' + str(Id))
-				results = cur.fetchall()
-				if len(results) == 10:
-					#We have found 10 summoners recorded for the given match Id, as expected.  Go to the next row
-					continue
-				else:
-					#Otherwise, we found a match with fewer than 10 summoners recorded. Find the missing one and record their info.
-
-					#Indicate the match with the record issue
-					print('There was a problem with match ' + str(Id) + '.  Correcting the issue now...')
-					
-					#Make a set containing all the recorded summonerIds for this match
-					set_of_records = set()
-					for rows in results:
-						set_of_records.add(rows[0])
-					print(set_of_records) 
-					#Now make a set containing all the summonerIds from the match data
-					api_url1 = Consts.URL['match_info'].format(
-						version=Consts.API_VERSIONS['summoner'],
-						matchId=Id
-						) 
-					api_query = self._request(api_url1)
-					if api_query.status_code != 200:
-						print('There was a problem.  API returned status code ' + str(api_query.status_code))
-						return
-
-					gameJSON = api_query.json()
-
-					set_of_sumIds = set()
-					for participant in gameJSON['participantIdentities']:
-						print(gameJSON['participantIdentities'])
-						#If the participant is not recorded, add them to our records
-						if participant['player']['summonerId'] not in set_of_records:
-							print('Found missing summoner! Adding '+participant['player']['summonerId']+' to match number ' + str(Id))
-							summonerjctmatch_sql = "INSERT IGNORE INTO summonersjctmatches (summonerId, matchId, champId, team, lane, role, tier) VALUES (%s, %s,%s,%s,%s,%s,%s)"
-							participantId = gameJSON['participantIdentities']['participantId']-1
-							cur.execute(summonerjctmatch_sql, (participant['summonerId'], Id, gameJSON['participants'][participantId]['championId'], gameJSON['participants'][participantId]['teamId'], gameJSON['participants'][participantId]['timeline']['lane'] , gameJSON['participants'][participantId]['timeline']['role'], gameJSON['participants'][participantId]['highestAchievedSeasonTier']))
-							conn.commit()
-						else:
-							continue
-			offset += 100
-			print(offset)
-
-
-
-	def win_probability_with_objective_by_tier(self,objective):
-	#This function queries our match database to determine what is the probability of winning the game if you get first drag, baron, tower, or blood.
-	#objective is a string with values: 'Dragon', 'Baron', 'Blood', or 'Tower'
-	#We separate the results by tier.  Tier is 'Bronze', 'Silver', 'Gold', 'Platinum', 'Diamond', 'Master', 'Challenger'
-
-		#List of stuff I need to accomplish:
-			#1. Calculate the average tier of the players in a given match
-			#2. From those matches, select those where objective = True.
-
-		tier_dict = {'UNRANKED':None, 'BRONZE':1, 'SILVER':2,'GOLD':3,'PLATINUM':4,'DIAMOND':5,'MASTER':6,'CHALLENGER':7}
-		#Later, we will store results of a computation in here.
-		win_probability_dict = {}
-
-		conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data', charset='utf8')
+		#It works in two passes:
+			#1. Walk the matches table in primary key order, chunk_size matches at a time (keyset pagination, so every chunk is an index range rather than an OFFSET scan),
+			#   and find the matches in each chunk with fewer than 10 junction rows with one grouped LEFT JOIN.
+			#2. Re-fetch only those matches, up to concurrency at a time, and insert their junction rows in batches.  INSERT IGNORE skips the rows we already have.
+		#Only this object's region is checked, since the matches of other regions have to be fetched from their own servers.
+		conn = self._connect()
 		cur = conn.cursor()
 
-		cur.execute('SELECT count(*) from matches')
-		num_matches = cur.fetchone()[0]
-
-		df = pd.DataFrame(index = (0,num_matches), columns=('matchId','matchTier',objective,'win') )
-		df_row_counter = 0
-
-		matches_sql = 'SELECT matchId, ' + objective + ', win FROM matches'
-		cur.execute(matches_sql)
-		matchIds = cur.fetchall()
-		match_counter=0
+		#STEP 1: {
+		broken = []
+		last_matchId = -1
+		while True:
+			#Upper end of the next chunk
+			cur.execute('SELECT MAX(matchId) FROM (SELECT matchId FROM matches WHERE region = %s AND matchId > %s ORDER BY matchId LIMIT %s) AS chunk', (self.region, last_matchId, chunk_size))
+			upper = cur.fetchone()[0]
+			if upper is None:
+				break
+			cur.execute('SELECT m.matchId FROM matches m LEFT JOIN summonersjctmatches j ON j.matchId = m.matchId AND j.region = m.region WHERE m.region = %s AND m.matchId > %s AND m.matchId <= %s GROUP BY m.matchId HAVING COUNT(j.matchId) < 10', (self.region, last_matchId, upper))
+			broken.extend(row[0] for row in cur.fetchall())
+			last_matchId = upper
+		cur.close()
 
-		for m in matchIds:
-			match_counter+=1
-			#include some output to have an idea of progress
-			if match_counter % 100 == 0:
-				print(match_counter)
+		print('Found ' + str(len(broken)) + ' matches with missing summoners.  Correcting them now...')
+		# }
 
-			matchId = m[0]
-			cur.execute('SELECT tier FROM summonersjctmatches WHERE matchId = ' + str(matchId))
-			tiers = cur.fetchall()
-			
-			#Initialize some variables used for computing the average tier of players in a match
-			counter = 0
-			match_tier=0
-
-			#Find the sum of the tiers of the ranked players in the given match
-			for t in tiers:
-				t2 = t[0]
-				if tier_dict[t2] != None:
-					counter+=1
-					match_tier += tier_dict[t2]
-				else:
+		#STEP 2: {
+		#A match that can't be fetched is reported and skipped, so one connection error doesn't end the whole run
+		def fetch(Id):
+			try:
+				return self._request(self._match_url(Id))
+			except requests.RequestException as e:
+				return e
+
+		if self.pool_size < concurrency:
+			self._mount(concurrency)
+		repaired = 0
+		with WriteBuffer(conn) as buffer, ThreadPoolExecutor(concurrency) as executor:
+			for Id, api_query in zip(broken, executor.map(fetch, broken)):
+				if isinstance(api_query, Exception):
+					print('There was a problem with match ' + str(Id) + ': ' + repr(api_query))
 					continue
+				if api_query.status_code != 200:
+					print('There was a problem with match ' + str(Id) + '.  API returned status code ' + str(api_query.status_code))
+					continue
+				for row in parse_match(api_query.content).jct_rows():
+					buffer.add('insert_jct', row + (self.region,))
+				repaired += 1
+		#The repaired matches were put in their tier buckets from the junction rows they had when they were written, so
+		#recount the objective aggregates now that they have all ten
+		if repaired:
+			ObjectiveCube.rebuild(conn)
+		conn.close()
+		# }
 
-			#Here is the average tier of the ranked players in the match.  We are going to insist that we know the ranks of at least 3 players in the match. 
-			if counter < 4:
-				continue
-			else:
-				match_tier = match_tier/counter 
-				who_got_objective = m[1]
-				winner = m[2]
-
-				df.loc[df_row_counter] = [matchId, match_tier, who_got_objective, winner]
-				df_row_counter +=1
-
-		#Now we run some statistical analysis on our dataframe.  
-		for tier in tier_dict:
-			#Skip unranked...
-			if tier == 'UNRANKED':
-				continue
-			#Here we select the upper and lower bounds for the tier value of a match.  For example, a gold match has 2.5 < tier < 3.5.
-			lower_bound = tier_dict[tier]-0.5
-			upper_bound = tier_dict[tier]+0.5
+		print('Repaired ' + str(repaired) + ' matches.')
+		self._matches_written()
+		return repaired
 
+	def win_probability_with_objective_by_tier(self,objective):
+	#This function queries our match database to determine what is the probability of winning the game if you get first drag, baron, tower, or blood.
+	#objective is the name of the column in matches: 'firstDrag', 'firstBaron', 'herald', 'firstTurret', 'firstBlood' or 'firstInhib'
+	#We separate the results by tier.  Tier is 'Bronze', 'Silver', 'Gold', 'Platinum', 'Diamond', 'Master', 'Challenger'
+	#The work is done by win_probabilities_by_tier, which computes every objective at once; this plots the one asked for.
 
-			#Select those matches played at the specified tier and store the result in a dataframe
-			matches_by_tier_df = df.loc[ (df['matchTier'] < upper_bound) & (df['matchTier'] > lower_bound) ]
+		import matplotlib.pyplot as plt
 
-			#Total number of matches played at a given tier		
-			matches_by_tier_count = matches_by_tier_df.shape[0]
-			print(matches_by_tier_count)
-			#Total number of matches at a given tier where the objective was taken by team 200 AND team 200 won
-			matches_by_tier_with_obj_and_win_count = matches_by_tier_df.loc[(matches_by_tier_df[objective]==True) & (matches_by_tier_df['win']==True)].shape[0]
-			print(matches_by_tier_with_obj_and_win_count)
+		results = self.win_probabilities_by_tier([objective])
+		results = results.loc[results['taken'] > 0]
 
-			#Probability of taking the objective and winning
-			if matches_by_tier_count == 0:
-				P_obj_and_win = 0
-				continue
-			else:
-				P_obj_and_win = matches_by_tier_with_obj_and_win_count / matches_by_tier_count 
-
-			#Probability of taking the objective is equal to half the probability that the objective gets taken at all
-			P_obj = matches_by_tier_df.loc[ matches_by_tier_df[objective] != None ].shape[0] / matches_by_tier_count / 2
-			#The overall conditional probability that you win, given that you took an objective is given by:
-			P = P_obj_and_win/P_obj
-			win_probability_dict.update({tier:P})
-
-		#Return the probability of winning if team 200 is playing a match at a given tier and takes some objective first:
-		#return 'If your team gets ' + objective + ' then your probability of winning is ' +str(P_obj_and_win/P_obj*100)+'%'
-		plt.bar(range(len(win_probability_dict)), win_probability_dict.values(), align='center')
-		plt.xticks(range(len(win_probability_dict)), win_probability_dict.keys())
+		#Plot the probability of winning if your team is playing a match at a given tier and takes the objective first:
+		plt.bar(range(len(results)), results['win_probability'].values, align='center')
+		plt.xticks(range(len(results)), results['tier'].values)
 		plt.show()
 
 		return plt
 
+	def win_probabilities_by_tier(self, objectives=OBJECTIVES, scan=False):
+	#Returns a DataFrame with one row per (objective, tier): the number of matches, the number where the objective was taken,
+	#the number of those won by the team that took it, and win_probability = taker_won/taken.
+	#The tier of a match is the average tier of its ranked players; matches need at least Consts.MIN_RANKED_PLAYERS ranked players to count.
+	#By default the answer is read from the counters the crawler keeps up to date (see ObjectiveCube.py), which is a lookup of a few
+	#hundred rows.  scan=True recomputes it from the matches instead (one aggregate query and a few vectorized passes, see ObjectiveAnalysis.py).
+	#With an analytics store the counters (which live in MySQL) aren't used: the scan runs on the store.
+		from ObjectiveAnalysis import win_probabilities
+		if self.analytics is not None:
+			scan = True
+		conn = self._analytics_connect() if scan else self._connect()
+		try:
+			with METRICS.time('analysis_seconds', analysis='win_probabilities_scan' if scan else 'win_probabilities'):
+				if scan:
+					return win_probabilities(conn, objectives)
+				self._ensure_schema(conn)
+				return ObjectiveCube.win_probabilities(conn, objectives)
+		finally:
+			conn.close()
+
+	def rebuild_objective_cube(self):
+		#Recompute the per-match tiers and objective counters from everything in the DB
+		conn = self._connect()
+		try:
+			self._ensure_schema(conn)
+			ObjectiveCube.rebuild(conn)
+		finally:
+			conn.close()
+
+	def lane_model(self, retrain=False):
+		#The bot lane network, trained on the current data.  It is loaded from Consts.LANE_MODEL['path'] if the saved model
+		#matches the data in the DB (retrained and saved otherwise), and kept in memory after that.  The kept model is
+		#checked against the data again every Consts.LANE_MODEL['recheck_interval'] seconds, and after this object has
+		#written matches, so a long-running process doesn't keep serving a stale one.
+		if retrain or self._lane_model is None or self._lane_recheck_due('model'):
+			from LaneModel import cached_model, is_current, snapshot_version
+			conn = self._analytics_connect()
+			try:
+				if retrain or self._lane_model is None or not is_current(self._lane_model.version, snapshot_version(conn)):
+					self._lane_model = cached_model(conn, retrain=retrain)
+			finally:
+				conn.close()
+			self._lane_checked['model'] = time.monotonic()
+		return self._lane_model
+
+	def lane_matchups(self, rebuild=False):
+		#The precomputed recommendations for every opponent lane.  Loaded from Consts.LANE_MATCHUPS['path'] unless the number
+		#of qualifying matches has moved by more than Consts.LANE_MATCHUPS['stale_fraction'] since it was built, in which
+		#case it is rebuilt.  Kept in memory after that, so lookups don't touch the DB, and checked again on the same
+		#schedule as lane_model.
+		if rebuild or self._lane_matchups is None or self._lane_recheck_due('matchups'):
+			from LaneModel import cached_matchups, qualifying_matches
+			conn = self._analytics_connect()
+			try:
+				if rebuild or self._lane_matchups is None or self._lane_matchups.is_stale(qualifying_matches(conn)):
+					self._lane_matchups = cached_matchups(conn, rebuild=rebuild)
+					#A rebuild may have retrained the network
+					self._lane_model = None
+			finally:
+				conn.close()
+			self._lane_checked['matchups'] = time.monotonic()
+		return self._lane_matchups
+
+	def find_best_bot_lane_duos(self, opponents):
+		#INPUTS:
+			#opponents is a list of (support, adc) pairs of champion names from the 14 in-meta supports and ADCs
+		#OUTPUTS: the best (adc, support) lane to play against each pair, looked up in the matchup table
+		with METRICS.time('analysis_seconds', analysis='bot_lane_duos'):
+			return self.lane_matchups().best_duos(opponents)
+
+	def rank_bot_lane_duos(self, support, adc, top=5):
+		#The top duos against the opponent (support, adc) with their scores, best first
+		return self.lane_matchups().recommend(support, adc, top)
+
 	def find_best_bot_lane_duo(self,champId1,champId2):
 		#INPUTS:
 			#champId1 is a string containing the name of one of the 14 in-meta support champions
 			#champId2 is a string containing the name of one of the 14 in-meta ADC champions
 
-		#These dictionaries associate champ names to the categorical positions they indicate in the training data
-		support_dict = {'Zyra':0, 'Bard':1,'Braum':2,'Soraka':3,'Leona':4, 'Janna':5,'Nami':6,'Karma':7,'Lulu':8,'Morgana':9,'Sona':10,'Blitzcrank':11,'Rakan':12,'Thresh':13}
-		inverted_support_dict = {value:key for key,value in support_dict.items()}
-		adc_dict = {'Caitlyn':0,'Xayah':1,'Lucian':2,'Draven':3,'Jinx':4, 'Vayne':5, 'Twitch':6, 'Ashe':7, 'Ezreal':8,'MissFortune':9,'Jhin':10,'Varus':11,'Tristana':12,'KogMaw':13}
-		inverted_adc_dict = {value:key for key,value in adc_dict.items()}
-
-		product_dict = {support_champ: {adc_champ: adc_dict[adc_champ]+ 14*support_dict[support_champ] for adc_champ in adc_dict} for support_champ in support_dict}
-		inverted_product_dict = {i: (inverted_adc_dict[i%14],inverted_support_dict[int(i/14)]) for i in range(14*14)}
-
-		
-		conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data', charset='utf8')
-		cur = conn.cursor()	
-		cur.execute('SELECT * FROM meta_champs')
-
-		#This dictionary associates champ names to their champIds
-		meta_champs = {champ[0]:champ[1] for champ in cur.fetchall()}
-
-		def get_data_from_db():
-
-			#INPUTS: None
-			#OUTPUTS: Numpy Arrays, bx and by, consisting of all training data.  The training data are as follows: 
-
-			#The array bx[j] is a 28x1 np array.  The first 14 entries indicate the support player of the losing team; the next 14 entries indicate the ADC of the losing team.
-			#The array by[j] is 196x1 np array, and represents the collection of ADC/support pairs (ordered lexicographically by support > adc)
-
-			#Connect to the database
-			conn = pymysql.connect(host='127.0.0.1', user='jmracek', passwd='', db='league_data', charset='utf8')
-			cur = conn.cursor()	
-			
-			#SELECT all the matches in the DB such that all 4 champs in the bottom lane are in-meta.  Separate these by winners and losers.
-			support_winners_query = "SELECT T.matchId, T.champId FROM (SELECT * FROM summonersjctmatches WHERE lane = \'BOTTOM\' AND matchId IN (SELECT matchId FROM summonersjctmatches WHERE lane=\'BOTTOM\' AND CASE WHEN role=\'DUO_SUPPORT\' THEN champId IN (SELECT champId FROM meta_supports) WHEN role=\'DUO_CARRY\' THEN champId IN (SELECT champId FROM meta_adc) END GROUP BY matchId HAVING count(*) = 4)) AS T LEFT JOIN matches ON T.matchId = matches.matchId WHERE T.team = CASE WHEN matches.win = 1 THEN 200 ELSE 100 END AND T.role=\'DUO_SUPPORT\' ORDER BY matchId;"
-			support_losers_query = "SELECT T.matchId, T.champId FROM (SELECT * FROM summonersjctmatches WHERE lane = \'BOTTOM\' AND matchId IN (SELECT matchId FROM summonersjctmatches WHERE lane=\'BOTTOM\' AND CASE WHEN role=\'DUO_SUPPORT\' THEN champId IN (SELECT champId FROM meta_supports) WHEN role=\'DUO_CARRY\' THEN champId IN (SELECT champId FROM meta_adc) END GROUP BY matchId HAVING count(*) = 4)) AS T LEFT JOIN matches ON T.matchId = matches.matchId WHERE T.team = CASE WHEN matches.win = 1 THEN 100 ELSE 200 END AND T.role=\'DUO_SUPPORT\' ORDER BY matchId;"
-
-			adc_winners_query = "SELECT T.matchId, T.champId FROM (SELECT * FROM summonersjctmatches WHERE lane = \'BOTTOM\' AND matchId IN (SELECT matchId FROM summonersjctmatches WHERE lane=\'BOTTOM\' AND CASE WHEN role=\'DUO_SUPPORT\' THEN champId IN (SELECT champId FROM meta_supports) WHEN role=\'DUO_CARRY\' THEN champId IN (SELECT champId FROM meta_adc) END GROUP BY matchId HAVING count(*) = 4)) AS T LEFT JOIN matches ON T.matchId = matches.matchId WHERE T.team = CASE WHEN matches.win = 1 THEN 200 ELSE 100 END AND T.role=\'DUO_CARRY\' ORDER BY matchId;"
-			adc_losers_query = "SELECT T.matchId, T.champId FROM (SELECT * FROM summonersjctmatches WHERE lane = \'BOTTOM\' AND matchId IN (SELECT matchId FROM summonersjctmatches WHERE lane=\'BOTTOM\' AND CASE WHEN role=\'DUO_SUPPORT\' THEN champId IN (SELECT champId FROM meta_supports) WHEN role=\'DUO_CARRY\' THEN champId IN (SELECT champId FROM meta_adc) END GROUP BY matchId HAVING count(*) = 4)) AS T LEFT JOIN matches ON T.matchId = matches.matchId WHERE T.team = CASE WHEN matches.win = 1 THEN 100 ELSE 200 END AND T.role=\'DUO_CARRY\' ORDER BY matchId;"
-
-			cur.execute(support_winners_query)
-			winning_support_list = np.array(cur.fetchall())
-			cur.execute(support_losers_query)
-			losing_support_list = np.array(cur.fetchall())
-			cur.execute(adc_winners_query)
-			winning_carry_list = np.array(cur.fetchall())
-			cur.execute(adc_losers_query)
-			losing_carry_list = np.array(cur.fetchall())
-
-			bx = np.zeros( (int(len(losing_support_list)), 28) )
-			by = np.zeros( (int(len(winning_support_list)), 196) )
-			index = 0
-			
-			for sup_win, sup_lose, adc_win, adc_lose in zip(winning_support_list, losing_support_list, winning_carry_list, losing_carry_list):
-
-				#Record the losing support and adc
-				bx[index][support_dict[meta_champs[sup_lose[1]]]] = 1
-				bx[index][14+adc_dict[meta_champs[adc_lose[1]]]] = 1
-
-				#Record the winning support and adc
-				by[index][product_dict[meta_champs[sup_win[1]]][meta_champs[adc_win[1]]]] = 1
-
-				#Count
-				index += 1
-
-			return bx, by
-
-
-
 		#This function inputs your bot lane opponents, and outputs the best possible lane to play against them
-		#The 'best' lane is determined by training a neural network against win/loss data.  We only consider the 14 in meta supports and 14 in meta ADCs.
-
-		#The input to the neural network is an array of length #adc + #support champs.  The elements of the array represent categorical variables that describe the losing team's
-		#champions.  An entry of the input array is 0 if the champ was not part of the losing team, and is equal to 1 if the champ was a part of the losing team.  The output of the
-		#neural network is an array of length 14*14 
-
-		#The neural network is trained on a sample of about 20000 games played
-
-		#I am using code from: https://github.com/aymericdamien/TensorFlow-Examples/blob/master/examples/3_NeuralNetworks/multilayer_perceptron.py
-		#in order to get myself in a position where I can get familiar with tensorflow.
-
-		def train_lane_nn():
-
-			# Parameters
-			learning_rate = 0.001
-			training_epochs = 15
-			batch_size = 100
-			display_step = 1
-
-			# Network Parameters
-			n_hidden_1 = 100 # 1st layer number of features
-			n_hidden_2 = 100 # 2nd layer number of features
-			n_input = 28 # 14 supports and 14 ADCs from the losing team
-			n_classes = 196 # 14 supports x 14 adcs = 196 possible pairs of ADC/support combos
-
-			# tf Graph input
-			x = tf.placeholder("float", [None, n_input])
-			y = tf.placeholder("float", [None, n_classes])
-
-			# Create model with 2 hidden layers and an output layer
-			def multilayer_perceptron(x, weights, biases):
-	    		# Hidden layer with RELU activation
-				layer_1 = tf.add(tf.matmul(x, weights['h1']), biases['b1'])
-				layer_1 = tf.nn.relu(layer_1)
-				# Hidden layer with RELU activation
-				layer_2 = tf.add(tf.matmul(layer_1, weights['h2']), biases['b2'])
-				layer_2 = tf.nn.relu(layer_2)
-				# Output layer with linear activation.  This has been changed from the sourcecode to add a softmax to the output layer
-				out_layer = tf.matmul(layer_2, weights['out']) + biases['out']
-				return out_layer
-	    	# Store layers weight & bias, randomly initialized.
-			weights = {
-			    'h1': tf.Variable(tf.random_normal([n_input, n_hidden_1])),
-			    'h2': tf.Variable(tf.random_normal([n_hidden_1, n_hidden_2])),
-			    'out': tf.Variable(tf.random_normal([n_hidden_2, n_classes]))
-			}
-			biases = {
-			    'b1': tf.Variable(tf.random_normal([n_hidden_1])),
-			    'b2': tf.Variable(tf.random_normal([n_hidden_2])),
-			    'out': tf.Variable(tf.random_normal([n_classes]))
-			}
-
-			# Construct model
-			pred = multilayer_perceptron(x, weights, biases)
-
-			# Define loss and optimizer
-			cost = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits=pred, labels=y))
-			optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(cost)
-
-			# Initializing the variables
-			init = tf.global_variables_initializer()
-
-			# Launch the graph
-			with tf.Session() as sess:
-				sess.run(init)
-				data, labels = get_data_from_db()
-
-				training_data = data[:int(0.8*len(data))]
-				training_labels = labels[:int(0.8*len(labels))]
-
-				testing_data = data[int(0.8*len(data)):]
-				testing_labels = labels[int(0.8*len(labels)):]
-
-			    # Training cycle
-				for epoch in range(training_epochs):
-					avg_cost = 0.
-					total_batch = int(len(training_data)/100) #Number of games, divided by number of matches per training batch
-
-			        #Randomize the data
-					np.random.shuffle(training_data)
-
-			        # Loop over all batches
-					for i in range(total_batch):
-						batch_x, batch_y = training_data[i*100:(i+1)*100], training_labels[i*100:(i+1)*100]
-						# Run optimization op (backprop) and cost op (to get loss value)
-						_, c = sess.run([optimizer, cost], feed_dict={x: batch_x, y: batch_y})
-						# Compute average loss
-						avg_cost += c / total_batch
-					# Display logs per epoch step
-					if epoch % display_step == 0:
-						print("Epoch:", '%04d' % (epoch+1), "cost=", \
-							"{:.9f}".format(avg_cost))
-				print("Optimization Finished!")
-
-				# Test model
-				correct_prediction = tf.equal(tf.argmax(pred, 1), tf.argmax(y, 1))
-				# Calculate accuracy
-				#accuracy = tf.reduce_mean(tf.cast(correct_prediction, "float"))
-				#print("Accuracy:", accuracy.eval({x: testing_data, y: testing_labels}))
-
-				prediction = tf.argmax(pred,1)
-				out = prediction.eval({x: np.array([1 if i in set([support_dict[champId1], adc_dict[champId2]+14]) else 0 for i in range(28)]).reshape( (1,28) ) })
-				print('The best lane against ' + champId1 + ' and ' + champId2 + ' is:' )
-				print(inverted_product_dict[out[0]])
-				#print('The best lane against ' + champId1 + ' and ' + champId2 + ' is '#)
-
-		train_lane_nn()
\ No newline at end of file
+		#The 'best' lane is determined by a neural network trained against win/loss data (see LaneModel.py).  We only consider the 14 in meta supports and 14 in meta ADCs.
+		best = self.find_best_bot_lane_duos([(champId1, champId2)])[0]
+		print('The best lane against ' + champId1 + ' and ' + champId2 + ' is:' )
+		print(best)
+		return best
@@ -1,5 +1,6 @@
 URL = {	'base':'https://{proxy}.api.riotgames.com/lol/{url}', 
 		'summoner_by_name':'summoner/v{version}/summoners/by-name/{names}',
+		'summoner_by_account':'summoner/v{version}/summoners/by-account/{accountId}',
 		'match_list':'match/v{version}/matchlists/by-account/{accountId}',
 		'match_info':'match/v{version}/matches/{matchId}',
 		'timeline':'match/v{version}/timelines/by-match/{matchId}',
@@ -9,7 +10,156 @@ URL = {	'base':'https://{proxy}.api.riotgames.com/lol/{url}',
 API_VERSIONS = {'summoner':'3'
 }
 
+#Platform ids, which are also the hosts of the regional API servers (na1.api.riotgames.com, ...)
 REGIONS = {
 	'north_america':'na1',
-	'europe_west':'euw'
-}
\ No newline at end of file
+	'europe_west':'euw1'
+}
+
+#Connection settings for the MySQL database everything is stored in (passed to pymysql.connect)
+DB = {
+	'host':'127.0.0.1',
+	'user':'jmracek',
+	'passwd':'',
+	'db':'league_data',
+	'charset':'utf8'
+}
+
+#Most connections the pool keeps open to that database when they are idle (see Storage.py)
+DB_POOL_SIZE = 10
+
+#Starting rate limits as (requests, seconds) windows.  These are only a first guess: RateLimiter replaces them with
+#whatever the X-App-Rate-Limit and X-Method-Rate-Limit headers report once the first response comes back.
+RATE_LIMITS = {
+	'app':[(10, 1), (500, 600)],
+	'method':{}
+}
+
+#How many times _request retries a 429 (after waiting out Retry-After) before handing the 429 back to the caller
+MAX_RETRIES = 3
+
+#(connect, read) timeouts in seconds for API requests
+HTTP_TIMEOUT = (3.05, 10)
+
+#How long ResponseCache keeps a response for each endpoint, in seconds.  None means forever (a finished match never
+#changes), 0 means never cache.
+CACHE_TTL = {
+	'summoner_by_name':3600,
+	'summoner_by_account':600,
+	'match_list':600,
+	'match_info':None,
+	'timeline':None,
+	'featured_games':0
+}
+
+#WriteBuffer flushes once flush_size rows are waiting or flush_interval seconds have passed since the last flush
+WRITE_BUFFER = {
+	'flush_size':2000,
+	'flush_interval':5.0,
+	#Times a flush is retried when MySQL picks it as a deadlock victim (concurrent region crawls and refreshes)
+	'deadlock_retries':3
+}
+
+#How the crawler remembers which matches we already have.  With bloom=True it uses a Bloom filter with the given false
+#positive rate instead of a set, which takes far less memory but skips that fraction of new matches.
+SEEN_MATCHES = {
+	'bloom':False,
+	'error_rate':0.001
+}
+
+#Staleness buckets (days since a summoner was last crawled) for SummonerSampler.sample_by_staleness
+STALENESS_DAYS = (30, 7, 1)
+
+#Incremental refresh (see RiotAPI.refresh_summoners): matchlist entries requested per page (the API allows at most 100),
+#how many pages are looked at for a summoner that has no high-water mark yet, and the most new games fetched per
+#summoner in one refresh
+REFRESH = {
+	'page_size':100,
+	'first_pages':1,
+	'max_matches':10
+}
+
+#Ranked queues on Summoner's Rift (solo/duo and flex).  The prioritized crawl only requests these games.
+RANKED_QUEUES = (420, 440)
+
+#Scoring for the prioritized crawl (see CrawlScheduler.py): candidates sampled per summoner crawled, the staleness
+#time scale in days, the weight (in crawls) of the prior on a summoner's yield, and the most a tier coverage gap can
+#multiply a score by
+SCHEDULER = {
+	'candidates':5,
+	'staleness_days':7.0,
+	'prior_crawls':1.0,
+	'max_tier_boost':4.0
+}
+
+#Number of matches validate_matches_table checks per query
+VALIDATE_CHUNK_SIZE = 10000
+
+#Number of names (write_summoners_to_db) or accountIds (SummonerSampler.refresh_state) looked up per IN (...) query
+NAME_CHUNK_SIZE = 1000
+
+#Numbers used to average the tiers of the players in a match.  Unranked players don't count towards the average.
+TIER_VALUES = {'UNRANKED':None, 'BRONZE':1, 'SILVER':2, 'GOLD':3, 'PLATINUM':4, 'DIAMOND':5, 'MASTER':6, 'CHALLENGER':7}
+
+#A match only gets a tier if we know the tiers of at least this many of its players
+MIN_RANKED_PLAYERS = 4
+
+#The saved bot lane network (see LaneModel.py), and how far the number of qualifying matches can move (as a fraction of
+#the number it was trained on) before it is retrained
+LANE_MODEL = {
+	'path':'models/lane_model.npz',
+	'stale_fraction':0.05,
+	#Seconds a loaded model (and matchup table) is used before it is checked against the data again
+	'recheck_interval':600
+}
+
+#The precomputed recommendations for every opponent bot lane (see LaneModel.MatchupTable), and how far the number of
+#qualifying matches (all four bot laners in-meta) can move, as a fraction, before the table is rebuilt
+LANE_MATCHUPS = {
+	'path':'models/lane_matchups.npz',
+	'stale_fraction':0.05
+}
+
+#Where flattened timeline events are kept (see TimelineStore.py), and how many matches go into each part file
+TIMELINE_STORE = {
+	'directory':'timelines',
+	'part_size':1000
+}
+
+#Instrumentation (see Metrics.py): the default port of the /metrics endpoint, how often start_snapshots writes, and the
+#bucket bounds (seconds) of the latency histograms
+METRICS = {
+	'port':9102,
+	'snapshot_interval':10.0,
+	'latency_buckets':(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+}
+
+#Insert statements shared by the crawler paths (sync and async) so that both write identical rows
+SQL = {
+	'insert_seed_summoner':'INSERT IGNORE INTO summoners (summonerId, accountId, username, revisionDate, region) VALUES (%s,%s,%s,%s,%s)',
+	#Summoners looked up by name (see RiotAPI.write_summoners_to_db)
+	'insert_named_summoner':'INSERT IGNORE INTO summoners (summonerId, accountId, username, revisionDate, region) VALUES (%s,%s,%s,%s,%s)',
+	#The crawler's rows carry the region they were fetched from as their last value (see WriteBuffer.add_match)
+	'insert_summoner':'INSERT IGNORE INTO summoners (summonerId, accountId, username, region) VALUES (%s,%s,%s,%s)',
+	'insert_match':'INSERT IGNORE INTO matches (matchId, duration, season, version, firstDrag, firstBaron, herald, firstInhib, firstTurret, firstBlood, redDrags, redBarons, redTowers, redInhibs, blueDrags, blueBarons, blueTowers, blueInhibs, win, region) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)',
+	'insert_jct':'INSERT IGNORE INTO summonersjctmatches (summonerId, matchId, champId, team, lane, role, tier, region) VALUES (%s, %s,%s,%s,%s,%s,%s,%s)',
+	#summoner_sample upkeep (see SummonerSampler.py)
+	'upsert_sample':'INSERT INTO summoner_sample (accountId, tier, region, rnd) VALUES (%s,%s,%s,RAND()) ON DUPLICATE KEY UPDATE tier = COALESCE(VALUES(tier), tier)',
+	#Every crawl of a summoner also adds to their yield history (new matches written, share of ranked games in their
+	#matchlist), which the CrawlScheduler scores them by
+	'mark_crawled':'UPDATE summoner_sample SET lastCrawled = %s, crawls = crawls + 1, newMatches = newMatches + %s, rankedShare = COALESCE(%s, rankedShare) WHERE accountId = %s AND region = %s',
+	#Incremental refresh state: the newest match timestamp seen in a summoner's matchlist, and their revisionDate
+	'mark_refreshed':'UPDATE summoner_sample SET lastCrawled = %s, lastMatchTime = %s, crawls = crawls + 1, newMatches = newMatches + %s WHERE accountId = %s AND region = %s',
+	'update_revision':'UPDATE summoners SET revisionDate = %s WHERE accountId = %s AND region = %s',
+	#Objective aggregates (see ObjectiveCube.py)
+	'insert_match_tier':'INSERT IGNORE INTO match_tiers (matchId, region, tierSum, ranked, tierBucket) VALUES (%s,%s,%s,%s,%s)',
+	'increment_objective_count':'INSERT INTO objective_counts (tierBucket, objective, taker, winner, matches) VALUES (%s,%s,%s,%s,%s) ON DUPLICATE KEY UPDATE matches = matches + VALUES(matches)'
+}
+
+#The local copy of the tables the aggregate analyses read (see Storage.AnalyticsStore): where it is kept, which engine
+#keeps it ('duckdb' or 'sqlite'; None picks DuckDB when it is installed) and how many matches are copied per query
+ANALYTICS = {
+	'path':'analytics.db',
+	'engine':None,
+	'chunk_size':10000
+}
@@ -0,0 +1,242 @@
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from RateLimiter import endpoint_of
+
+#A local stand-in for the Riot API that replays fixture JSON, so the crawler can be exercised without an API key.
+#The fixture directory is laid out by endpoint:
+#	<fixture_dir>/summoner_by_name/<name>.json
+#	<fixture_dir>/summoner_by_account/<accountId>.json
+#	<fixture_dir>/match_list/<accountId>.json
+#	<fixture_dir>/match_info/<matchId>.json
+#	<fixture_dir>/timeline/<matchId>.json
+#Anything without a fixture gets a 404, the same as asking the real API for a match that doesn't exist.
+#Matchlists honour beginTime/endTime and beginIndex/endIndex like the real endpoint: newest game first, and a 404 when
+#no games are in range.
+#
+#For benchmarks the stub can also behave more like the real thing: latency adds that many seconds to every response,
+#and a throttle_rate fraction of requests (chosen by a seeded RNG, so runs are repeatable) get a 429 with Retry-After
+#retry_after seconds instead of their fixture.
+#
+#Usage:
+#	stub = RiotStub('fixtures')
+#	stub.start()
+#	api = RiotAPI(key, base_url=stub.base_url)
+#	...
+#	stub.stop()
+
+class RiotStub(object):
+
+	def __init__(self, fixture_dir, host='127.0.0.1', port=0, latency=0.0, throttle_rate=0.0, retry_after=1, seed=0):
+		self.fixture_dir = fixture_dir
+		self.latency = latency
+		self.throttle_rate = throttle_rate
+		self.retry_after = retry_after
+		self._rng = random.Random(seed)
+		#Number of requests served, by endpoint.  Handy for checking how many API calls a run would have cost.
+		self.counts = {}
+		#Number of 429s sent
+		self.throttled = 0
+		self._lock = threading.Lock()
+		self.server = ThreadingHTTPServer((host, port), self._handler())
+		self.server.daemon_threads = True
+		self._thread = None
+
+	@property
+	def base_url(self):
+		host, port = self.server.server_address[:2]
+		return 'http://' + host + ':' + str(port) + '/lol/{url}'
+
+	def start(self):
+		self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+		if self._thread is not None:
+			self._thread.join()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+
+	def lookup(self, path, query=''):
+		#Returns (status, body) for a request path and query string
+		endpoint, key = endpoint_of(path[len('/lol/'):]) if path.startswith('/lol/') else (None, None)
+		if endpoint is not None:
+			with self._lock:
+				self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+			fixture = os.path.join(self.fixture_dir, endpoint, str(key) + '.json')
+			if os.path.isfile(fixture):
+				with open(fixture, 'rb') as f:
+					body = f.read()
+				if endpoint == 'match_list' and query:
+					body = _matchlist_range(body, parse_qs(query))
+				if body is not None:
+					return 200, body
+		return 404, json.dumps({'status':{'message':'Data not found', 'status_code':404}}).encode('utf-8')
+
+	def _throttle(self):
+		#True if this request should get a 429
+		if self.throttle_rate <= 0:
+			return False
+		with self._lock:
+			if self._rng.random() < self.throttle_rate:
+				self.throttled += 1
+				return True
+		return False
+
+	def _handler(self):
+		stub = self
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+			#Headers and body go out in separate writes; with Nagle on, every kept-alive request would stall on a delayed ACK
+			disable_nagle_algorithm = True
+
+			def do_GET(self):
+				if stub.latency > 0:
+					time.sleep(stub.latency)
+				if stub._throttle():
+					body = json.dumps({'status':{'message':'Rate limit exceeded', 'status_code':429}}).encode('utf-8')
+					self.send_response(429)
+					self.send_header('Retry-After', str(stub.retry_after))
+					self.send_header('X-Rate-Limit-Type', 'method')
+					self.send_header('Content-Type', 'application/json;charset=utf-8')
+					self.send_header('Content-Length', str(len(body)))
+					self.end_headers()
+					self.wfile.write(body)
+					return
+				path, _, query = self.path.partition('?')
+				status, body = stub.lookup(path, query)
+				self.send_response(status)
+				self.send_header('Content-Type', 'application/json;charset=utf-8')
+				#Compress like the real API does when the client asks for it
+				if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+					body = gzip.compress(body, 5)
+					self.send_header('Content-Encoding', 'gzip')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				pass
+		return Handler
+
+def _matchlist_range(body, query):
+	#The part of a matchlist fixture selected by the query parameters, or None if that is empty
+	matchlist = json.loads(body)
+	matches = sorted(matchlist['matches'], key=lambda match: match['timestamp'], reverse=True)
+	if 'beginTime' in query:
+		matches = [match for match in matches if match['timestamp'] >= int(query['beginTime'][0])]
+	if 'endTime' in query:
+		matches = [match for match in matches if match['timestamp'] <= int(query['endTime'][0])]
+	beginIndex = int(query.get('beginIndex', [0])[0])
+	endIndex = int(query.get('endIndex', [beginIndex + 100])[0])
+	page = matches[beginIndex:endIndex]
+	if not page:
+		return None
+	return json.dumps({'matches':page, 'startIndex':beginIndex, 'endIndex':beginIndex + len(page), 'totalGames':len(matches)}).encode('utf-8')
+
+#Write a self-consistent set of synthetic fixtures: summoners, their matchlists, and the matches/timelines those point to.
+#Only the fields this project reads are filled in.  The summoner accountIds are returned so they can be loaded into a test DB.
+def write_synthetic_fixtures(fixture_dir, summoners=50, matches_per_summoner=20, seed=0):
+	rng = random.Random(seed)
+	for endpoint in ('summoner_by_name', 'summoner_by_account', 'match_list', 'match_info', 'timeline'):
+		os.makedirs(os.path.join(fixture_dir, endpoint), exist_ok=True)
+
+	def dump(endpoint, key, obj):
+		with open(os.path.join(fixture_dir, endpoint, str(key) + '.json'), 'w', encoding='utf-8') as f:
+			json.dump(obj, f)
+
+	accountIds = [200000 + i for i in range(summoners)]
+	tiers = ['UNRANKED', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'DIAMOND', 'MASTER', 'CHALLENGER']
+	lanes = [('TOP','SOLO'), ('JUNGLE','NONE'), ('MIDDLE','SOLO'), ('BOTTOM','DUO_CARRY'), ('BOTTOM','DUO_SUPPORT')]
+	matchId = 2500000000
+
+	for accountId in accountIds:
+		summoner = {'id':accountId + 1000000, 'accountId':accountId, 'name':'summoner' + str(accountId), 'revisionDate':1500000000000 + accountId, 'summonerLevel':30, 'profileIconId':0}
+		dump('summoner_by_name', summoner['name'], summoner)
+		dump('summoner_by_account', accountId, summoner)
+
+		matchlist = []
+		for j in range(matches_per_summoner):
+			matchId += 1
+			timestamp = 1500000000000 + matchId
+			#Mostly ranked solo/flex, with some normals and ARAMs (the Howling Abyss games, mapId 12, that the crawler drops)
+			queue = rng.choice([420, 420, 440, 400, 450])
+			matchlist.append({'gameId':matchId, 'platformId':'NA1', 'champion':rng.randint(1, 500), 'queue':queue, 'season':rng.choice([5, 7, 8, 9]), 'timestamp':timestamp, 'role':'SOLO', 'lane':'MID'})
+
+			#Put the crawled summoner in the match along with nine others drawn from the same pool
+			players = [accountId] + rng.sample([a for a in accountIds if a != accountId] or [accountId], min(9, max(len(accountIds) - 1, 1)))
+			while len(players) < 10:
+				players.append(900000 + rng.randint(0, 10**6))
+			blue_wins = rng.random() < 0.5
+			teams = []
+			for teamId, won in ((100, blue_wins), (200, not blue_wins)):
+				teams.append({'teamId':teamId, 'win':'Win' if won else 'Fail', 'firstBlood':False, 'firstTower':False, 'firstInhibitor':False, 'firstBaron':False, 'firstDragon':False, 'firstRiftHerald':False, 'towerKills':rng.randint(0, 11), 'inhibitorKills':rng.randint(0, 3), 'baronKills':rng.randint(0, 2), 'dragonKills':rng.randint(0, 4)})
+			for objective in ('firstBlood', 'firstTower', 'firstInhibitor', 'firstBaron', 'firstDragon', 'firstRiftHerald'):
+				taker = rng.choice([0, 1, None])
+				if taker is not None:
+					teams[taker][objective] = True
+
+			identities = []
+			participants = []
+			for p, player in enumerate(players):
+				lane, role = lanes[p % 5]
+				identities.append({'participantId':p + 1, 'player':{'summonerId':player + 1000000, 'accountId':player, 'summonerName':'summoner' + str(player), 'matchHistoryUri':'/v1/stats/player_history/NA1/' + str(player), 'platformId':'NA1'}})
+				participants.append({'participantId':p + 1, 'teamId':100 if p < 5 else 200, 'championId':rng.randint(1, 500), 'highestAchievedSeasonTier':rng.choice(tiers), 'timeline':{'lane':lane, 'role':role}})
+
+			dump('match_info', matchId, {'gameId':matchId, 'platformId':'NA1', 'mapId':12 if queue == 450 else 11, 'queueId':queue, 'seasonId':9, 'gameVersion':'7.10.187.9675', 'gameDuration':rng.randint(1200, 2700), 'gameCreation':timestamp, 'teams':teams, 'participants':participants, 'participantIdentities':identities})
+
+			frames = []
+			for minute in range(30):
+				events = []
+				for k in range(rng.randint(0, 4)):
+					events.append({'type':'WARD_PLACED', 'timestamp':minute*60000 + rng.randint(0, 59999), 'creatorId':rng.randint(1, 10), 'wardType':rng.choice(['YELLOW_TRINKET', 'SIGHT_WARD', 'CONTROL_WARD', 'BLUE_TRINKET'])})
+				if minute in (8, 15, 22):
+					events.append({'type':'ELITE_MONSTER_KILL', 'timestamp':minute*60000 + 30000, 'killerId':rng.randint(1, 10), 'monsterType':'DRAGON', 'monsterSubType':rng.choice(['EARTH_DRAGON', 'AIR_DRAGON', 'FIRE_DRAGON', 'WATER_DRAGON'])})
+				if minute == 12:
+					events.append({'type':'ELITE_MONSTER_KILL', 'timestamp':minute*60000 + 30000, 'killerId':rng.randint(1, 10), 'monsterType':'RIFTHERALD'})
+				if minute == 27:
+					events.append({'type':'ELITE_MONSTER_KILL', 'timestamp':minute*60000 + 30000, 'killerId':rng.randint(1, 10), 'monsterType':'BARON_NASHOR'})
+				events.sort(key=lambda e: e['timestamp'])
+				frames.append({'timestamp':minute*60000, 'events':events, 'participantFrames':{}})
+			dump('timeline', matchId, {'frames':frames, 'frameInterval':60000})
+
+		dump('match_list', accountId, {'matches':matchlist, 'startIndex':0, 'endIndex':len(matchlist), 'totalGames':len(matchlist)})
+
+	return accountIds
+
+#Write a seed file in the format of Riot's seed data (matches1.json ...) with the participants of the synthetic matches in
+#fixture_dir, for benchmarking populate_summoners_from_seed.  Returns the number of matches written.
+def write_synthetic_seed(fixture_dir, path):
+	count = 0
+	with open(path, 'w', encoding='utf-8') as out:
+		out.write('{"matches": [')
+		for name in sorted(os.listdir(os.path.join(fixture_dir, 'match_info'))):
+			with open(os.path.join(fixture_dir, 'match_info', name), encoding='utf-8') as f:
+				match = json.load(f)
+			seed_match = {'matchId':match['gameId'], 'matchCreation':match['gameCreation'], 'participantIdentities':[{'participantId':i['participantId'], 'player':{'summonerId':i['player']['summonerId'], 'summonerName':i['player']['summonerName'], 'matchHistoryUri':i['player']['matchHistoryUri']}} for i in match['participantIdentities']]}
+			out.write((', ' if count else '') + json.dumps(seed_match))
+			count += 1
+		out.write(']}')
+	return count
+
+if __name__ == '__main__':
+	#python RiotStub.py <fixture_dir> [port]
+	stub = RiotStub(sys.argv[1], port=int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+	print('Serving ' + sys.argv[1] + ' at ' + stub.base_url)
+	try:
+		stub.server.serve_forever()
+	except KeyboardInterrupt:
+		stub.server.server_close()
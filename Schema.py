@@ -0,0 +1,68 @@
+#The tables the crawler and analyses read and write, for setting up a fresh database (a new install, or the throwaway
+#databases the benchmarks use).  CREATE TABLE IF NOT EXISTS, so it is safe to run against an existing database.
+#The derived tables (summoner_sample, match_tiers, objective_counts) are created by their own modules on first use.
+#summonerIds, accountIds and matchIds are only unique within a region, so region is part of every primary key.
+
+TABLES_SQL = (
+"""CREATE TABLE IF NOT EXISTS summoners (
+	summonerId BIGINT NOT NULL,
+	accountId BIGINT NULL,
+	username VARCHAR(32) NULL,
+	revisionDate BIGINT NULL,
+	region VARCHAR(8) NOT NULL DEFAULT 'na1',
+	PRIMARY KEY (summonerId, region),
+	KEY accountId_idx (accountId)
+)""",
+"""CREATE TABLE IF NOT EXISTS matches (
+	matchId BIGINT NOT NULL,
+	duration INT NULL,
+	season INT NULL,
+	version VARCHAR(32) NULL,
+	firstDrag BOOLEAN NULL,
+	firstBaron BOOLEAN NULL,
+	herald BOOLEAN NULL,
+	firstInhib BOOLEAN NULL,
+	firstTurret BOOLEAN NULL,
+	firstBlood BOOLEAN NULL,
+	redDrags INT NULL,
+	redBarons INT NULL,
+	redTowers INT NULL,
+	redInhibs INT NULL,
+	blueDrags INT NULL,
+	blueBarons INT NULL,
+	blueTowers INT NULL,
+	blueInhibs INT NULL,
+	win BOOLEAN NULL,
+	region VARCHAR(8) NOT NULL DEFAULT 'na1',
+	PRIMARY KEY (matchId, region),
+	KEY region_idx (region)
+)""",
+"""CREATE TABLE IF NOT EXISTS summonersjctmatches (
+	summonerId BIGINT NOT NULL,
+	matchId BIGINT NOT NULL,
+	champId INT NULL,
+	team SMALLINT NULL,
+	lane VARCHAR(16) NULL,
+	role VARCHAR(16) NULL,
+	tier VARCHAR(16) NULL,
+	region VARCHAR(8) NOT NULL DEFAULT 'na1',
+	PRIMARY KEY (summonerId, matchId, region),
+	KEY matchId_idx (matchId, region)
+)""",
+"""CREATE TABLE IF NOT EXISTS meta_champs (
+	champId INT NOT NULL PRIMARY KEY,
+	name VARCHAR(32) NOT NULL
+)""",
+"""CREATE TABLE IF NOT EXISTS meta_supports (
+	champId INT NOT NULL PRIMARY KEY
+)""",
+"""CREATE TABLE IF NOT EXISTS meta_adc (
+	champId INT NOT NULL PRIMARY KEY
+)""")
+
+def create_tables(conn):
+	cur = conn.cursor()
+	for sql in TABLES_SQL:
+		cur.execute(sql)
+	cur.close()
+	conn.commit()
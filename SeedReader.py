@@ -0,0 +1,111 @@
+import glob
+import json
+import os
+
+#Streaming reader for the Riot seed data files (matches1.json ... matches10.json), which look like
+#	{"matches": [ {match}, {match}, ... ]}
+#The files are far too big to json.load in one go, so iter_matches reads them in chunks and decodes one match at a
+#time out of the "matches" array.  Memory use is bounded by the chunk size plus the size of one match, no matter how
+#large the file is.
+
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+
+class _Stream(object):
+	#A text buffer over a file that refills on demand and forgets what has been consumed
+
+	def __init__(self, f, chunk_size):
+		self.f = f
+		self.chunk_size = chunk_size
+		self.buf = ''
+		self.pos = 0
+		self.eof = False
+
+	def more(self):
+		#Read another chunk.  Returns False at end of file.
+		if self.eof:
+			return False
+		chunk = self.f.read(self.chunk_size)
+		if not chunk:
+			self.eof = True
+			return False
+		#Drop the consumed part of the buffer before growing it
+		self.buf = self.buf[self.pos:] + chunk
+		self.pos = 0
+		return True
+
+	def peek(self):
+		#Next non-whitespace character (without consuming it), or '' at end of file
+		while True:
+			while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+				self.pos += 1
+			if self.pos < len(self.buf):
+				return self.buf[self.pos]
+			if not self.more():
+				return ''
+
+	def expect(self, c):
+		if self.peek() != c:
+			raise ValueError('Malformed seed file: expected ' + repr(c) + ' at ' + repr(self.buf[self.pos:self.pos + 40]))
+		self.pos += 1
+
+	def value(self):
+		#Decode one complete JSON value, reading more of the file until it is all there
+		self.peek()
+		while True:
+			try:
+				obj, end = _decoder.raw_decode(self.buf, self.pos)
+			except ValueError:
+				if self.more():
+					continue
+				raise
+			#A number (or true/false/null) that runs to the end of the buffer may continue in the next chunk
+			if end == len(self.buf) and self.more():
+				continue
+			self.pos = end
+			return obj
+
+def iter_matches(path, chunk_size=CHUNK_SIZE):
+	#Yield the matches in a seed file one at a time
+	with open(path, encoding='utf-8') as f:
+		stream = _Stream(f, chunk_size)
+		stream.expect('{')
+		while stream.peek() != '}':
+			key = stream.value()
+			stream.expect(':')
+			if key != 'matches':
+				#Skip anything else at the top level
+				stream.value()
+			else:
+				stream.expect('[')
+				while stream.peek() != ']':
+					yield stream.value()
+					if stream.peek() == ',':
+						stream.pos += 1
+				stream.expect(']')
+			if stream.peek() == ',':
+				stream.pos += 1
+
+def seed_files(file_input):
+	#file_input can be a single seed file, a directory of them, or a glob pattern like 'seed/matches*.json'
+	if os.path.isdir(file_input):
+		return sorted(glob.glob(os.path.join(file_input, '*.json')))
+	if os.path.isfile(file_input):
+		return [file_input]
+	return sorted(glob.glob(file_input))
+
+def seed_summoner_rows(match):
+	#Rows for Consts.SQL['insert_seed_summoner'] from one seed match
+	for participant in match['participantIdentities']:
+		#There is a stupid formatting error in the data, whereby a players accountId is encoded in their match history from the 29th character onwards, or the 28th
+		#depending on whether or not the server that stores that information is labelled as NA1 or NA.  We need to account for this.
+		if participant['player']['matchHistoryUri'][0:28] == '/v1/stats/player_history/NA1':
+			accId = int(participant['player']['matchHistoryUri'][29:])
+		elif participant['player']['matchHistoryUri'][0:28] == '/v1/stats/player_history/NA/':
+			accId = int(participant['player']['matchHistoryUri'][28:])
+		else:
+			continue
+
+		yield (participant['player']['summonerId'], accId, participant['player']['summonerName'], match['matchCreation'])
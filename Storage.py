@@ -0,0 +1,210 @@
+import RiotConstants as Consts
+import numpy as np
+import pymysql
+import sqlite3
+import threading
+
+#Where the data lives.
+#
+#The crawler's reads and writes go to MySQL through MySQLStorage.  Its connect() hands out connections from a pool
+#instead of opening a new one every time, and close() gives them back, so code written against plain pymysql
+#connections (conn = ...; ...; conn.close()) gets pooling without any changes.  RiotAPI objects with the same DB
+#settings share one pool (MySQLStorage.shared).
+#
+#The aggregate analyses (win probabilities by tier, the bot lane training data) only read matches,
+#summonersjctmatches and the meta champion tables, and spend their time in full scans and GROUP BYs over them.
+#AnalyticsStore keeps a local copy of just those tables in an embedded database: DuckDB, a columnar engine, when it
+#is installed, and SQLite otherwise.  Either way the scans run in-process with no server or network in between, and
+#once the copy exists the analyses (and tests of them) don't need MySQL at all.  sync() brings the copy up to date
+#by copying only the matches it doesn't have yet.
+
+class PooledConnection(object):
+	#Stands in for a pymysql connection from a ConnectionPool.  close() hands it back to the pool instead of closing it.
+
+	def __init__(self, pool, conn):
+		self._pool = pool
+		self._conn = conn
+
+	def __getattr__(self, name):
+		return getattr(self._conn, name)
+
+	def close(self):
+		if self._conn is not None:
+			self._pool.put(self._conn)
+			self._conn = None
+
+class ConnectionPool(object):
+
+	def __init__(self, connect, size=Consts.DB_POOL_SIZE):
+		#connect opens a new connection.  At most size idle connections are kept; any more are closed when returned.
+		self._connect = connect
+		self.size = size
+		self._idle = []
+		self._lock = threading.Lock()
+
+	def get(self):
+		with self._lock:
+			conn = self._idle.pop() if self._idle else None
+		if conn is not None:
+			#The server drops connections that sit idle for longer than wait_timeout
+			try:
+				conn.ping(reconnect=True)
+			except pymysql.Error:
+				conn = None
+		if conn is None:
+			conn = self._connect()
+		return PooledConnection(self, conn)
+
+	def put(self, conn):
+		#Whatever the borrower left uncommitted is rolled back, so the next one starts clean
+		try:
+			conn.rollback()
+		except pymysql.Error:
+			conn.close()
+			return
+		with self._lock:
+			if len(self._idle) < self.size:
+				self._idle.append(conn)
+				return
+		conn.close()
+
+	def close(self):
+		with self._lock:
+			idle, self._idle = self._idle, []
+		for conn in idle:
+			conn.close()
+
+class MySQLStorage(object):
+
+	_shared = {}
+	_shared_lock = threading.Lock()
+
+	@classmethod
+	def shared(cls, db=Consts.DB):
+		#One storage (and so one pool) per set of connection settings
+		key = tuple(sorted(db.items()))
+		with cls._shared_lock:
+			if key not in cls._shared:
+				cls._shared[key] = cls(db)
+			return cls._shared[key]
+
+	def __init__(self, db=Consts.DB, pool_size=Consts.DB_POOL_SIZE):
+		#db is the pymysql.connect arguments
+		self.db = db
+		self.pool = ConnectionPool(lambda: pymysql.connect(**db), pool_size)
+		#Set once the schema migrations have run against this database (see RiotAPI._ensure_schema)
+		self.schema_lock = threading.Lock()
+		self.schema_ready = False
+
+	def connect(self):
+		return self.pool.get()
+
+	def close(self):
+		self.pool.close()
+
+#The tables AnalyticsStore copies, with the columns the analyses use and their primary keys.  Only the copied ones are
+#listed; the types are ones both DuckDB and SQLite understand.
+ANALYTICS_TABLES = (
+	('matches', (('matchId', 'BIGINT'), ('duration', 'INTEGER'), ('season', 'INTEGER'), ('version', 'VARCHAR'),
+		('firstDrag', 'SMALLINT'), ('firstBaron', 'SMALLINT'), ('herald', 'SMALLINT'), ('firstInhib', 'SMALLINT'), ('firstTurret', 'SMALLINT'), ('firstBlood', 'SMALLINT'),
+		('redDrags', 'INTEGER'), ('redBarons', 'INTEGER'), ('redTowers', 'INTEGER'), ('redInhibs', 'INTEGER'),
+		('blueDrags', 'INTEGER'), ('blueBarons', 'INTEGER'), ('blueTowers', 'INTEGER'), ('blueInhibs', 'INTEGER'),
+		('win', 'SMALLINT'), ('region', 'VARCHAR')), ('matchId', 'region')),
+	('summonersjctmatches', (('summonerId', 'BIGINT'), ('matchId', 'BIGINT'), ('champId', 'INTEGER'), ('team', 'SMALLINT'),
+		('lane', 'VARCHAR'), ('role', 'VARCHAR'), ('tier', 'VARCHAR'), ('region', 'VARCHAR')), ('matchId', 'summonerId', 'region')),
+	('meta_champs', (('champId', 'INTEGER'), ('name', 'VARCHAR')), ('champId',)),
+	('meta_supports', (('champId', 'INTEGER'),), ('champId',)),
+	('meta_adc', (('champId', 'INTEGER'),), ('champId',))
+)
+
+#Copied match by match (see AnalyticsStore.sync); the rest are small and copied whole
+_PER_MATCH = ('matches', 'summonersjctmatches')
+
+def _columns(table):
+	return [name for name, kind in dict((t, columns) for t, columns, key in ANALYTICS_TABLES)[table]]
+
+def _by_region(rows):
+	#{region: array of matchIds} from (region, matchId) rows
+	matchIds = {}
+	for region, matchId in rows:
+		matchIds.setdefault(region, []).append(matchId)
+	return dict((region, np.array(ids, dtype=np.int64)) for region, ids in matchIds.items())
+
+def default_engine():
+	try:
+		import duckdb
+		return 'duckdb'
+	except ImportError:
+		return 'sqlite'
+
+class AnalyticsStore(object):
+
+	def __init__(self, path=Consts.ANALYTICS['path'], engine=Consts.ANALYTICS['engine']):
+		self.path = path
+		self.engine = engine if engine is not None else default_engine()
+
+	def connect(self):
+		#A DB-API connection to the store.  The analyses only use cursor(), execute, fetchone/fetchall/fetchmany and close.
+		if self.engine == 'duckdb':
+			import duckdb
+			return duckdb.connect(self.path)
+		return sqlite3.connect(self.path)
+
+	def _insert(self, conn, table, rows):
+		if not rows:
+			return
+		columns = _columns(table)
+		if self.engine == 'duckdb':
+			#DuckDB inserts a whole frame much faster than it runs executemany
+			import pandas as pd
+			conn.register('_rows', pd.DataFrame.from_records(list(rows), columns=columns))
+			conn.execute('INSERT OR IGNORE INTO ' + table + ' SELECT * FROM _rows')
+			conn.unregister('_rows')
+		else:
+			conn.executemany('INSERT OR IGNORE INTO ' + table + ' (' + ', '.join(columns) + ') VALUES (' + ', '.join(['?']*len(columns)) + ')', rows)
+
+	def ensure_tables(self, conn):
+		for table, columns, key in ANALYTICS_TABLES:
+			conn.execute('CREATE TABLE IF NOT EXISTS ' + table + ' (' + ', '.join(name + ' ' + kind for name, kind in columns) + ', PRIMARY KEY (' + ', '.join(key) + '))')
+
+	def sync(self, source, full=False, chunk_size=Consts.ANALYTICS['chunk_size']):
+		#Bring the store up to date with source, a connection to the MySQL database.  Returns the number of matches copied.
+		#Matches don't arrive in matchId order, so the new ones are found by comparing the matchIds on both sides, region
+		#by region (matchIds are only unique within one), and only their rows (and those of their junction rows) are read
+		#from MySQL.  The meta tables are replaced whole.
+		#Junction rows that validate_matches_table adds to old matches aren't picked up this way; sync with full=True
+		#after a repair to start the copy over.
+		conn = self.connect()
+		try:
+			conn.execute('BEGIN TRANSACTION')
+			self.ensure_tables(conn)
+			if full:
+				for table, columns, key in ANALYTICS_TABLES:
+					conn.execute('DELETE FROM ' + table)
+
+			cur = source.cursor()
+			cur.execute('SELECT region, matchId FROM matches')
+			theirs = _by_region(cur.fetchall())
+			ours = _by_region(conn.execute('SELECT region, matchId FROM matches').fetchall())
+			copied = 0
+
+			for region, matchIds in theirs.items():
+				new = np.setdiff1d(matchIds, ours.get(region, np.zeros(0, dtype=np.int64)))
+				copied += len(new)
+				for i in range(0, len(new), chunk_size):
+					chunk = [int(matchId) for matchId in new[i:i+chunk_size]]
+					for table in _PER_MATCH:
+						cur.execute('SELECT ' + ', '.join(_columns(table)) + ' FROM ' + table + ' WHERE region = %s AND matchId IN (' + ','.join(['%s']*len(chunk)) + ')', [region] + chunk)
+						self._insert(conn, table, cur.fetchall())
+
+			for table, columns, key in ANALYTICS_TABLES:
+				if table in _PER_MATCH:
+					continue
+				cur.execute('SELECT ' + ', '.join(_columns(table)) + ' FROM ' + table)
+				conn.execute('DELETE FROM ' + table)
+				self._insert(conn, table, cur.fetchall())
+			cur.close()
+			conn.commit()
+		finally:
+			conn.close()
+		return copied
@@ -0,0 +1,171 @@
+import RiotConstants as Consts
+import random
+import time
+
+#Random samples of summoners without scanning the summoners table.
+#
+#'SELECT accountId FROM summoners WHERE RAND() <= P' has to evaluate RAND() for every row, so every crawl pays a full
+#table scan.  Instead, every summoner gets a row in summoner_sample with a random key rnd, uniform on [0, 1), that is
+#indexed.  A sample of k summoners is then the k rows that follow a random point u in rnd order: an index range scan
+#of k rows, whatever the size of the table.  Because the keys are independent and uniform, those k rows are a uniform
+#random k-subset.  Sampled rows get fresh keys straight away, so the next sample doesn't overlap with this one.
+#
+#summoner_sample also keeps each summoner's most recent tier, their region and the time we last crawled them, so samples
+#can be restricted to (or stratified by) tier or staleness using the (tier, rnd) index, and to one region using the
+#(region, rnd) index.  lastMatchTime is the high-water mark of the incremental refresh (see RiotAPI.refresh_summoners):
+#the timestamp of the newest game we have seen in the summoner's matchlist.  crawls, newMatches and rankedShare are the
+#summoner's yield history for the prioritized crawl (see CrawlScheduler.py).
+#
+#The table is maintained at ingest time (WriteBuffer adds a row for every summoner it writes, and the crawler marks
+#summoners as crawled), and rebuild() backfills it from the summoners table.
+
+SAMPLE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS summoner_sample (
+	accountId BIGINT NOT NULL,
+	tier VARCHAR(16) NULL,
+	rnd DOUBLE NOT NULL,
+	lastCrawled BIGINT NULL,
+	lastMatchTime BIGINT NULL,
+	crawls INT NOT NULL DEFAULT 0,
+	newMatches INT NOT NULL DEFAULT 0,
+	rankedShare FLOAT NULL,
+	region VARCHAR(8) NOT NULL DEFAULT 'na1',
+	PRIMARY KEY (accountId, region),
+	KEY rnd_idx (rnd),
+	KEY tier_rnd_idx (tier, rnd),
+	KEY region_rnd_idx (region, rnd)
+)"""
+
+#Columns added to summoner_sample after it was first released, for upgrading existing tables
+ADDED_COLUMNS = (
+	('lastMatchTime', 'BIGINT NULL'),
+	('crawls', 'INT NOT NULL DEFAULT 0'),
+	('newMatches', 'INT NOT NULL DEFAULT 0'),
+	('rankedShare', 'FLOAT NULL')
+)
+
+TIERS = ('BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'DIAMOND', 'MASTER', 'CHALLENGER')
+
+class SummonerSampler(object):
+
+	def __init__(self, conn):
+		self.conn = conn
+
+	def ensure_table(self):
+		#Create summoner_sample if needed, and fill it the first time it is used on an existing database
+		cur = self.conn.cursor()
+		cur.execute(SAMPLE_TABLE_SQL)
+		cur.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'summoner_sample'")
+		have = set(row[0] for row in cur.fetchall())
+		missing = [column + ' ' + kind for column, kind in ADDED_COLUMNS if column not in have]
+		if missing:
+			cur.execute('ALTER TABLE summoner_sample ' + ', '.join('ADD COLUMN ' + c for c in missing))
+		cur.execute('SELECT 1 FROM summoner_sample LIMIT 1')
+		empty = cur.fetchone() is None
+		cur.close()
+		self.conn.commit()
+		if empty:
+			self.rebuild()
+
+	def rebuild(self):
+		#Backfill summoner_sample from summoners.  Tier is taken from each summoner's most recent junction table row.
+		#This is a full scan, but it only has to run once; after that the table is kept current at ingest time.
+		cur = self.conn.cursor()
+		cur.execute("INSERT INTO summoner_sample (accountId, tier, region, rnd) SELECT s.accountId, (SELECT j.tier FROM summonersjctmatches j WHERE j.summonerId = s.summonerId AND j.region = s.region ORDER BY j.matchId DESC LIMIT 1), s.region, RAND() FROM summoners s WHERE s.accountId IS NOT NULL ON DUPLICATE KEY UPDATE tier = COALESCE(VALUES(tier), summoner_sample.tier)")
+		self.conn.commit()
+		cur.close()
+
+	def sample(self, k, tiers=None, stale_before=None, crawled_since=None, region=None):
+		#Exactly k accountIds chosen uniformly at random (fewer only if fewer than k summoners qualify).
+		#tiers restricts the sample to summoners whose latest tier is in tiers.
+		#stale_before (epoch milliseconds) restricts it to summoners never crawled, or last crawled before then.
+		#crawled_since restricts it to summoners crawled at or after then.
+		#region restricts it to summoners from that region (a Consts.REGIONS value).
+		conditions = []
+		args = []
+		if region is not None:
+			conditions.append('region = %s')
+			args.append(region)
+		if tiers is not None:
+			conditions.append('tier IN (' + ','.join(['%s']*len(tiers)) + ')')
+			args.extend(tiers)
+		if stale_before is not None:
+			conditions.append('(lastCrawled IS NULL OR lastCrawled < %s)')
+			args.append(stale_before)
+		if crawled_since is not None:
+			conditions.append('lastCrawled >= %s')
+			args.append(crawled_since)
+		where = ''.join(' AND ' + c for c in conditions)
+
+		cur = self.conn.cursor()
+		u = random.random()
+		#Take the k rows after u, wrapping around to the start of the key range if there aren't enough
+		cur.execute('SELECT accountId, region FROM summoner_sample WHERE rnd >= %s' + where + ' ORDER BY rnd LIMIT %s', [u] + args + [k])
+		rows = list(cur.fetchall())
+		if len(rows) < k:
+			cur.execute('SELECT accountId, region FROM summoner_sample WHERE rnd < %s' + where + ' ORDER BY rnd LIMIT %s', [u] + args + [k - len(rows)])
+			rows.extend(cur.fetchall())
+
+		#Give the sampled rows new keys, so the next sample starting near u doesn't pick them again.  Only those rows: the
+		#same accountId in another region is another summoner.
+		if rows:
+			cur.executemany('UPDATE summoner_sample SET rnd = RAND() WHERE accountId = %s AND region = %s', [tuple(row) for row in rows])
+			self.conn.commit()
+		cur.close()
+		return [row[0] for row in rows]
+
+	def refresh_state(self, accountIds, region=Consts.REGIONS['north_america'], chunk_size=Consts.NAME_CHUNK_SIZE):
+		#{accountId: (revisionDate, lastMatchTime)} for the incremental refresh.  Either can be None: revisionDate if we
+		#never looked the summoner up, lastMatchTime if they have never been refreshed.
+		state = {}
+		cur = self.conn.cursor()
+		for i in range(0, len(accountIds), chunk_size):
+			chunk = list(accountIds[i:i+chunk_size])
+			cur.execute('SELECT ss.accountId, s.revisionDate, ss.lastMatchTime FROM summoner_sample ss LEFT JOIN summoners s ON s.accountId = ss.accountId AND s.region = ss.region WHERE ss.region = %s AND ss.accountId IN (' + ','.join(['%s']*len(chunk)) + ')', [region] + chunk)
+			for accountId, revisionDate, lastMatchTime in cur.fetchall():
+				state[accountId] = (revisionDate, lastMatchTime)
+		cur.close()
+		return state
+
+	def sample_stratified(self, k, strata):
+		#strata is a list of (weight, filters) pairs, where filters are keyword arguments for sample().  k is split between
+		#the strata in proportion to their weights.  A stratum with fewer summoners than its share gives what it has, and
+		#the rest of its share is split between the others, so fewer than k come back only if fewer than k qualify in all.
+		#Returns one combined list of accountIds.
+		accountIds = []
+		taken = set()
+		counts = [0]*len(strata)
+		exhausted = set()
+		while len(accountIds) < k:
+			remaining = [i for i in range(len(strata)) if i not in exhausted]
+			if not remaining:
+				break
+			need = k - len(accountIds)
+			total = float(sum(strata[i][0] for i in remaining))
+			for j, i in enumerate(remaining):
+				weight, filters = strata[i]
+				#Hand the rounding remainder to the last stratum so the total comes to k
+				n = k - len(accountIds) if j == len(remaining) - 1 else min(k - len(accountIds), int(round(need*weight/total)))
+				if n <= 0:
+					continue
+				#Ask for the ones this stratum already gave as well, since a new sample can pick them again
+				new = [a for a in self.sample(n + counts[i], **filters) if a not in taken][:n]
+				taken.update(new)
+				accountIds.extend(new)
+				counts[i] += len(new)
+				if len(new) < n:
+					exhausted.add(i)
+		return accountIds
+
+	def sample_by_tier(self, k, tiers=TIERS, region=None):
+		#Equal numbers of summoners from each tier, so the rarer tiers are as well covered as the common ones
+		return self.sample_stratified(k, [(1, {'tiers':[tier], 'region':region}) for tier in tiers])
+
+	def sample_by_staleness(self, k, days=Consts.STALENESS_DAYS, region=None):
+		#Equal numbers of summoners from each staleness bucket.  With days = (30, 7, 1) the buckets are: not crawled for
+		#30 days or never crawled, last crawled 7-30 days ago, 1-7 days ago, and within the last day.
+		now = int(time.time()*1000)
+		cutoffs = [now - d*86400000 for d in sorted(days, reverse=True)]
+		strata = [(1, {'stale_before':cutoffs[0], 'region':region})]
+		for older, newer in zip(cutoffs, cutoffs[1:] + [None]):
+			strata.append((1, {'crawled_since':older, 'stale_before':newer, 'region':region}))
+		return self.sample_stratified(k, strata)
@@ -0,0 +1,259 @@
+import RiotConstants as Consts
+import numpy as np
+import pandas as pd
+import glob
+import json
+import os
+
+#Timeline events flattened into typed columns on disk, so ward and objective analyses scan arrays instead of walking
+#timeline JSON one match at a time.
+#
+#Every region has a store of its own, in <directory>/<region>, since matchIds are only unique within a region.  Every
+#event type in EVENT_TYPES gets its own table there, stored as a directory of .npz parts:
+#	<directory>/<region>/<event type>/part-000001.npz, part-000002.npz, ...
+#with one array per column.  Every table has the columns
+#	matchId (int64), timestamp (int32, ms), participantId (int8), accountId (int64), teamId (int16)
+#for the participant doing the event (creatorId for wards, killerId otherwise; 0, 0 and 0 when it was a minion/tower),
+#plus the columns listed for its type.  String columns are stored as int16 codes into a vocabulary kept in
+#<directory>/<region>/vocab.json (-1 when the event doesn't have the field).  <directory>/<region>/matches holds the
+#matchIds stored, so ingestion can skip them.  A store from before the split (tables directly in <directory>) came from
+#the NA crawl, and is moved into <directory>/na1 the first time it is opened.
+#
+#TimelineWriter collects matches and writes a part per batch, with the same part number in every table, so part n of
+#each table covers the matches in part n of the match list.  The match list part is written last, and a part only
+#counts once it is there: the parts a crashed flush leaves behind are never read, and are removed by the next flush.
+#TimelineStore loads the parts of a table once and answers queries by account, match and time range with boolean masks
+#over whole columns.
+
+#event type: (key of the acting participant, ((column, 'str' or 'int'), ...))
+EVENT_TYPES = {
+	'WARD_PLACED':('creatorId', (('wardType', 'str'),)),
+	'WARD_KILL':('killerId', (('wardType', 'str'),)),
+	'ELITE_MONSTER_KILL':('killerId', (('monsterType', 'str'), ('monsterSubType', 'str'))),
+	'BUILDING_KILL':('killerId', (('buildingType', 'str'), ('towerType', 'str'), ('laneType', 'str'), ('teamId', 'int'))),
+	'CHAMPION_KILL':('killerId', (('victimId', 'int'),))
+}
+
+COMMON_COLUMNS = (('matchId', np.int64), ('timestamp', np.int32), ('participantId', np.int8), ('accountId', np.int64), ('teamId', np.int16))
+
+def _columns(event_type):
+	#(name, dtype) of every column of an event table.  A type's own teamId (the team that lost a building) is stored as
+	#victimTeamId so that it doesn't clash with the acting participant's team.
+	columns = list(COMMON_COLUMNS)
+	for column, kind in EVENT_TYPES[event_type][1]:
+		columns.append(('victimTeamId' if column == 'teamId' else column, np.int16 if kind == 'str' or column == 'teamId' else np.int32))
+	return columns
+
+def _table_dir(directory, table):
+	return os.path.join(directory, table.lower())
+
+def region_dir(directory, region):
+	#The store of one region, after moving an old single-region store into the NA one
+	legacy = [name for name in ['vocab.json'] + [table.lower() for table in list(EVENT_TYPES) + ['matches']] if os.path.exists(os.path.join(directory, name))]
+	if legacy:
+		target = os.path.join(directory, Consts.REGIONS['north_america'])
+		os.makedirs(target, exist_ok=True)
+		for name in legacy:
+			os.replace(os.path.join(directory, name), os.path.join(target, name))
+	return os.path.join(directory, region)
+
+class TimelineWriter(object):
+	#Flattens matches of one region into column lists and writes them out as one part per table on flush()
+
+	def __init__(self, directory=Consts.TIMELINE_STORE['directory'], region=Consts.REGIONS['north_america']):
+		self.directory = region_dir(directory, region)
+		self.vocab = _load_vocab(self.directory)
+		#Matches already in this region's store (or in this batch), which add() skips
+		self.stored = set(_read_parts(_table_dir(self.directory, 'matches'), (('matchId', np.int64),))['matchId'].tolist())
+		self._codes = dict((column, {s:i for i, s in enumerate(strings)}) for column, strings in self.vocab.items())
+		self.clear()
+
+	def clear(self):
+		self.rows = dict((event_type, dict((c, []) for c, dtype in _columns(event_type))) for event_type in EVENT_TYPES)
+		self.matchIds = []
+
+	def _code(self, column, value):
+		if value is None:
+			return -1
+		codes = self._codes.setdefault(column, {})
+		if value not in codes:
+			codes[value] = len(codes)
+			self.vocab.setdefault(column, []).append(value)
+		return codes[value]
+
+	def add(self, matchJSON, timelineJSON):
+		#Match the participantIds to accountIds and teams once, then walk the events a single time.  Returns False (and
+		#adds nothing) if the match is already stored.
+		matchId = matchJSON['gameId']
+		if matchId in self.stored:
+			return False
+		self.stored.add(matchId)
+		accounts = {0:0}
+		teams = {0:0}
+		for i in matchJSON['participantIdentities']:
+			accounts[i['participantId']] = i['player'].get('accountId', 0)
+		for p in matchJSON['participants']:
+			teams[p['participantId']] = p['teamId']
+
+		for frame in timelineJSON['frames']:
+			for event in frame['events']:
+				spec = EVENT_TYPES.get(event['type'])
+				if spec is None:
+					continue
+				who_key, extra = spec
+				rows = self.rows[event['type']]
+				who = event.get(who_key, 0)
+				rows['matchId'].append(matchId)
+				rows['timestamp'].append(event['timestamp'])
+				rows['participantId'].append(who)
+				rows['accountId'].append(accounts.get(who, 0))
+				rows['teamId'].append(teams.get(who, 0))
+				for column, kind in extra:
+					if kind == 'str':
+						rows[column].append(self._code(column, event.get(column)))
+					else:
+						rows['victimTeamId' if column == 'teamId' else column].append(event.get(column, 0))
+		self.matchIds.append(matchId)
+		return True
+
+	def __len__(self):
+		return len(self.matchIds)
+
+	def flush(self):
+		#Write everything added since the last flush as a new part of each table
+		if not self.matchIds:
+			return
+		os.makedirs(self.directory, exist_ok=True)
+		_remove_uncommitted(self.directory)
+		#One part number for every table, past any part of any table
+		name = 'part-%06d.npz' % (max([int(name[5:11]) for table in list(EVENT_TYPES) + ['matches'] for name in _part_names(_table_dir(self.directory, table))] or [0]) + 1)
+		#The vocabulary goes first, so no part ever refers to a code that isn't saved
+		_atomic_write(os.path.join(self.directory, 'vocab.json'), lambda f: json.dump(self.vocab, f), 'w')
+		for event_type, rows in self.rows.items():
+			_write_part(_table_dir(self.directory, event_type), name, dict((c, np.array(rows[c], dtype=dtype)) for c, dtype in _columns(event_type)))
+		#The match list is written last: a match only counts as stored once all its events are
+		_write_part(_table_dir(self.directory, 'matches'), name, {'matchId':np.array(self.matchIds, dtype=np.int64)})
+		self.clear()
+
+def _load_vocab(directory):
+	path = os.path.join(directory, 'vocab.json')
+	if os.path.isfile(path):
+		with open(path, encoding='utf-8') as f:
+			return json.load(f)
+	return {}
+
+def _atomic_write(path, write, mode):
+	tmp = path + '.tmp'
+	with open(tmp, mode) as f:
+		write(f)
+	os.replace(tmp, path)
+
+def _write_part(table_dir, name, columns):
+	os.makedirs(table_dir, exist_ok=True)
+	_atomic_write(os.path.join(table_dir, name), lambda f: np.savez(f, **columns), 'wb')
+
+def _part_names(table_dir):
+	return sorted(os.path.basename(p) for p in glob.glob(os.path.join(table_dir, 'part-*.npz')))
+
+def _committed_parts(directory, table):
+	#Paths of the parts of a table whose flush finished (the ones with a match list part)
+	committed = set(_part_names(_table_dir(directory, 'matches')))
+	return [os.path.join(_table_dir(directory, table), name) for name in _part_names(_table_dir(directory, table)) if name in committed]
+
+def _remove_uncommitted(directory):
+	#Delete the event parts of a flush that never wrote its match list part
+	committed = set(_part_names(_table_dir(directory, 'matches')))
+	for event_type in EVENT_TYPES:
+		for name in _part_names(_table_dir(directory, event_type)):
+			if name not in committed:
+				os.remove(os.path.join(_table_dir(directory, event_type), name))
+
+def _read_parts(table_dir, columns, parts=None, matchIds=None):
+	#Concatenate the given parts of a table (all of them by default) into one array per column.  With matchIds (an
+	#int64 array), only the rows of those matches are kept, part by part as they are read.
+	if parts is None:
+		parts = sorted(glob.glob(os.path.join(table_dir, 'part-*.npz')))
+	arrays = dict((c, []) for c, dtype in columns)
+	for path in parts:
+		with np.load(path) as f:
+			keep = np.isin(f['matchId'], matchIds) if matchIds is not None else slice(None)
+			for c, dtype in columns:
+				arrays[c].append(f[c][keep])
+	return dict((c, np.concatenate(arrays[c]) if arrays[c] else np.zeros(0, dtype=dtype)) for c, dtype in columns)
+
+class TimelineStore(object):
+	#The timelines of one region
+
+	def __init__(self, directory=Consts.TIMELINE_STORE['directory'], region=Consts.REGIONS['north_america']):
+		self.directory = region_dir(directory, region)
+		#Tables are read on first use and kept, keyed by the number of parts they had
+		self._tables = {}
+
+	def vocab(self):
+		return _load_vocab(self.directory)
+
+	def _table(self, table, columns):
+		table_dir = _table_dir(self.directory, table)
+		parts = _committed_parts(self.directory, table)
+		cached = self._tables.get(table)
+		if cached is None or cached[0] != len(parts):
+			cached = (len(parts), _read_parts(table_dir, columns, parts))
+			self._tables[table] = cached
+		return cached[1]
+
+	def matchIds(self):
+		return self._table('matches', (('matchId', np.int64),))['matchId']
+
+	def events(self, event_type, accountIds=None, matchIds=None, start=None, end=None):
+		#Columns of the events of event_type, restricted to the given accounts and matches and to start <= timestamp < end
+		#(in ms).  Returns a dict of arrays, with string columns still as codes (see decode).
+		table = self._table(event_type, _columns(event_type))
+		mask = np.ones(len(table['matchId']), dtype=bool)
+		if accountIds is not None:
+			mask &= np.isin(table['accountId'], np.asarray(list(accountIds), dtype=np.int64))
+		if matchIds is not None:
+			mask &= np.isin(table['matchId'], np.asarray(list(matchIds), dtype=np.int64))
+		if start is not None:
+			mask &= table['timestamp'] >= start
+		if end is not None:
+			mask &= table['timestamp'] < end
+		if mask.all():
+			return dict(table)
+		return dict((c, a[mask]) for c, a in table.items())
+
+	def code(self, column, value):
+		#The stored code of a string value, or -1 if it never occurs
+		strings = self.vocab().get(column, [])
+		return strings.index(value) if value in strings else -1
+
+	def decode(self, column, codes):
+		#String values of a code column (None for -1)
+		strings = np.array(self.vocab().get(column, []) + [None], dtype=object)
+		return strings[np.asarray(codes)]
+
+	def events_frame(self, event_type, **filters):
+		#events() as a DataFrame with the string columns decoded
+		columns = self.events(event_type, **filters)
+		for column, kind in EVENT_TYPES[event_type][1]:
+			if kind == 'str':
+				columns[column] = self.decode(column, columns[column])
+		return pd.DataFrame(columns)
+
+	def ward_histogram(self, accountIds=None, matchIds=None, bin_minutes=2):
+		#Wards placed per (ward type, time bin) over every selected match: a DataFrame indexed by ward type with one column
+		#per bin (the start minute of the bin).  One bincount over the whole table.
+		wards = self.events('WARD_PLACED', accountIds=accountIds, matchIds=matchIds)
+		bins = (wards['timestamp']//(bin_minutes*60000)).astype(np.int64)
+		types = wards['wardType'].astype(np.int64)
+		n_bins = int(bins.max()) + 1 if len(bins) else 0
+		n_types = len(self.vocab().get('wardType', []))
+		counts = np.bincount(types[types >= 0]*n_bins + bins[types >= 0], minlength=n_types*n_bins).reshape(n_types, n_bins)
+		frame = pd.DataFrame(counts, index=self.vocab().get('wardType', []), columns=np.arange(n_bins)*bin_minutes)
+		return frame[frame.sum(axis=1) > 0]
+
+	def objective_timings(self, matchIds=None, start=None, end=None):
+		#Every elite monster kill of the selected matches with its time in minutes: DataFrame of matchId, minute, teamId,
+		#monsterType and monsterSubType
+		kills = self.events_frame('ELITE_MONSTER_KILL', matchIds=matchIds, start=start, end=end)
+		kills['minute'] = kills['timestamp']/60000.
+		return kills[['matchId', 'minute', 'teamId', 'monsterType', 'monsterSubType']]
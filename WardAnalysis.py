@@ -0,0 +1,160 @@
+import RiotConstants as Consts
+import numpy as np
+import pandas as pd
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from TimelineStore import _columns, _load_vocab, _read_parts, _table_dir, region_dir
+
+#Warding histograms and elite monster timings for many players and matches at once, spread over a process pool.
+#
+#The work is split by match: the selected matches are cut into chunks (at least one per worker, and none bigger than a
+#part of the timeline store, see TimelineStore.py), and each worker reads just the parts that hold its chunk, keeping
+#only its own matches' rows as it reads them.  Every flush writes one part of each table, so part n of WARD_PLACED and
+#part n of ELITE_MONSTER_KILL cover the same matches as part n of the match list, which is how a chunk's parts are
+#found.  Each worker returns ward counts per (account, ward type, bin) and the monster timings of its matches, and the
+#results are added up in the parent.  Nothing here touches a GUI: export_figures draws straight to files.
+
+#Same spawn rules as get_warding_data_histogram, in minutes
+DRAGON_SPAWN = 2.5
+DRAGON_RESPAWN = 6
+BARON_SPAWN = 20
+BARON_RESPAWN = 7
+HERALD_SPAWN = 10
+
+MONSTER_COLOURS = {'BARON_NASHOR':'purple', 'EARTH_DRAGON':'brown', 'AIR_DRAGON':'grey', 'FIRE_DRAGON':'red', 'WATER_DRAGON':'blue', 'ELDER_DRAGON':'yellow', 'RIFTHERALD':'cyan'}
+WARD_COLOURS = {'YELLOW_TRINKET':'yellow', 'SIGHT_WARD':'green', 'CONTROL_WARD':'red', 'BLUE_TRINKET':'blue'}
+
+def _spawns(matchIds, minutes, first_spawn, respawn):
+	#Spawn time of each kill of one monster, for kills sorted by (matchId, timestamp): the first spawn for the first
+	#kill of a match, otherwise respawn minutes after the previous kill
+	first = np.ones(len(matchIds), dtype=bool)
+	first[1:] = matchIds[1:] != matchIds[:-1]
+	previous = np.concatenate([[0.], minutes[:-1]])
+	return np.where(first, first_spawn, previous + respawn)
+
+def monster_timings(kills, monsterTypes, monsterSubTypes, matchIds):
+	#DataFrame of matchId, monster, spawn and death (minutes) from the ELITE_MONSTER_KILL columns of some matches, with
+	#monster types already decoded.  Like get_warding_data_histogram, dragons are named by subtype, and a baron or
+	#herald that was never killed still gets its spawn, with death NaN.
+	order = np.lexsort((kills['timestamp'], kills['matchId']))
+	match = kills['matchId'][order]
+	minutes = kills['timestamp'][order]/60000.
+	types = monsterTypes[order]
+	subtypes = monsterSubTypes[order]
+
+	frames = []
+	for monster, first_spawn, respawn in (('DRAGON', DRAGON_SPAWN, DRAGON_RESPAWN), ('BARON_NASHOR', BARON_SPAWN, BARON_RESPAWN), ('RIFTHERALD', HERALD_SPAWN, 0)):
+		is_monster = types == monster
+		name = subtypes[is_monster] if monster == 'DRAGON' else np.full(is_monster.sum(), monster, dtype=object)
+		#Only one herald spawns, so every herald kill is at its first spawn
+		spawn = _spawns(match[is_monster], minutes[is_monster], first_spawn, respawn) if respawn else np.full(is_monster.sum(), first_spawn)
+		frames.append(pd.DataFrame({'matchId':match[is_monster], 'monster':name, 'spawn':spawn, 'death':minutes[is_monster]}))
+		if monster != 'DRAGON':
+			missing = np.setdiff1d(np.asarray(matchIds, dtype=np.int64), match[is_monster])
+			frames.append(pd.DataFrame({'matchId':missing, 'monster':monster, 'spawn':float(first_spawn), 'death':np.nan}))
+	return pd.concat(frames, ignore_index=True).sort_values(['matchId', 'spawn'], kind='stable').reset_index(drop=True)
+
+def _analyse_chunk(args):
+	#Worker: ward counts and monster timings for one chunk of matches (a sorted array), read from the given parts.
+	#by_match says whether the chunk is the matches asked for; otherwise it is every stored match, and timings are only
+	#kept for the matches the selected players warded in.
+	directory, parts, chunk, accountIds, by_match, bin_minutes = args
+	vocab = _load_vocab(directory)
+	paths = lambda table: [os.path.join(_table_dir(directory, table), part) for part in parts]
+	wards = _read_parts(_table_dir(directory, 'WARD_PLACED'), _columns('WARD_PLACED'), paths('WARD_PLACED'), matchIds=chunk)
+	kills = _read_parts(_table_dir(directory, 'ELITE_MONSTER_KILL'), _columns('ELITE_MONSTER_KILL'), paths('ELITE_MONSTER_KILL'), matchIds=chunk)
+
+	mask = wards['wardType'] >= 0
+	if accountIds is not None:
+		mask &= np.isin(wards['accountId'], accountIds)
+	#Ward counts per (account, ward type, bin), by counting the unique rows of the three keys
+	keys = np.stack([wards['accountId'][mask], wards['wardType'][mask].astype(np.int64), (wards['timestamp'][mask]//(bin_minutes*60000)).astype(np.int64)], axis=1)
+	unique, counts = np.unique(keys, axis=0, return_counts=True) if len(keys) else (np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.int64))
+	ward_types = np.array(vocab.get('wardType', []), dtype=object)
+	ward_counts = pd.DataFrame({'accountId':unique[:, 0], 'wardType':ward_types[unique[:, 1]], 'minute':unique[:, 2]*bin_minutes, 'wards':counts})
+
+	#Timings for the selected matches, or for the matches the selected players warded in
+	selected = chunk if by_match else np.unique(wards['matchId'][mask])
+	in_selected = np.isin(kills['matchId'], selected)
+	kills = dict((c, a[in_selected]) for c, a in kills.items())
+	strings = lambda column: np.array(vocab.get(column, []) + [None], dtype=object)[kills[column]]
+	timings = monster_timings(kills, strings('monsterType'), strings('monsterSubType'), selected)
+	return ward_counts, timings
+
+def _chunks(directory, matchIds, n_chunks, max_chunk):
+	#[(part file names, sorted matchIds)] covering the stored matches (those in matchIds, if given).  Matches are taken in
+	#store order, so a chunk spans as few parts as possible.
+	parts = sorted(os.path.basename(p) for p in glob.glob(os.path.join(_table_dir(directory, 'matches'), 'part-*.npz')))
+	stored = [_read_parts(_table_dir(directory, 'matches'), (('matchId', np.int64),), [os.path.join(_table_dir(directory, 'matches'), part)])['matchId'] for part in parts]
+	ids = np.concatenate(stored) if stored else np.zeros(0, dtype=np.int64)
+	part_of = np.repeat(np.arange(len(parts)), [len(s) for s in stored])
+	if matchIds is not None:
+		keep = np.isin(ids, matchIds)
+		ids, part_of = ids[keep], part_of[keep]
+	if len(ids) == 0:
+		return []
+	n = max(n_chunks, -(-len(ids)//max_chunk))
+	return [([parts[i] for i in np.unique(part_of[c])], np.sort(ids[c])) for c in np.array_split(np.arange(len(ids)), min(n, len(ids)))]
+
+def warding_analysis(directory=Consts.TIMELINE_STORE['directory'], accountIds=None, matchIds=None, bin_minutes=2, processes=None, region=Consts.REGIONS['north_america']):
+	#INPUTS:
+		#region: the store read (accountIds and matchIds are those of this region)
+		#accountIds: the players whose wards are counted (everyone if None)
+		#matchIds: the matches to look at (every stored match if None)
+		#processes: size of the process pool (one per core if None)
+	#OUTPUTS: (ward_counts, timings)
+		#ward_counts: DataFrame of accountId, wardType, minute (start of the bin) and wards placed in that bin, over all the matches
+		#timings: DataFrame of matchId, monster, spawn and death (in minutes) for every elite monster of the matches
+	accountIds = None if accountIds is None else np.asarray(list(accountIds), dtype=np.int64)
+	matchIds = None if matchIds is None else np.asarray(list(matchIds), dtype=np.int64)
+	workers = processes or os.cpu_count() or 1
+	directory = region_dir(directory, region)
+	jobs = [(directory, parts, chunk, accountIds, matchIds is not None, bin_minutes) for parts, chunk in _chunks(directory, matchIds, workers, Consts.TIMELINE_STORE['part_size'])]
+
+	if workers == 1 or len(jobs) <= 1:
+		results = [_analyse_chunk(job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			results = list(pool.map(_analyse_chunk, jobs))
+
+	if not results:
+		return pd.DataFrame(columns=['accountId', 'wardType', 'minute', 'wards']), pd.DataFrame(columns=['matchId', 'monster', 'spawn', 'death'])
+	#A player's wards can be spread over several chunks, so add the partial counts up
+	ward_counts = pd.concat([r[0] for r in results], ignore_index=True).groupby(['accountId', 'wardType', 'minute'], as_index=False)['wards'].sum()
+	timings = pd.concat([r[1] for r in results], ignore_index=True)
+	return ward_counts, timings
+
+def warding_profile(ward_counts, accountId):
+	#One player's ward counts as a table: ward types as columns, bins as rows
+	player = ward_counts[ward_counts['accountId'] == accountId]
+	return player.pivot_table(index='minute', columns='wardType', values='wards', aggfunc='sum', fill_value=0)
+
+def export_figures(ward_counts, timings, directory, fmt='png'):
+	#Save a warding histogram per player to directory/<accountId>.<fmt>, with a line at the median spawn time of each
+	#elite monster.  Draws on an Agg canvas directly, so it works without a display and never blocks.
+	from matplotlib.figure import Figure
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+	os.makedirs(directory, exist_ok=True)
+	spawns = timings.groupby('monster')['spawn'].median() if len(timings) else pd.Series(dtype=float)
+	paths = []
+	for accountId in ward_counts['accountId'].unique():
+		profile = warding_profile(ward_counts, accountId)
+		fig = Figure()
+		FigureCanvasAgg(fig)
+		ax = fig.add_subplot(111)
+		bottom = np.zeros(len(profile))
+		width = np.diff(profile.index.values).min() if len(profile) > 1 else 1
+		for ward_type in profile.columns:
+			ax.bar(profile.index.values, profile[ward_type].values, width=width, bottom=bottom, align='edge', color=WARD_COLOURS.get(ward_type), alpha=0.7, label=ward_type)
+			bottom += profile[ward_type].values
+		for monster, t in spawns.items():
+			ax.axvline(t, color=MONSTER_COLOURS.get(monster, 'black'), alpha=0.6)
+		ax.set_xlabel('Minute')
+		ax.set_ylabel('Wards placed')
+		ax.legend()
+		path = os.path.join(directory, str(accountId) + '.' + fmt)
+		fig.savefig(path)
+		paths.append(path)
+	return paths
@@ -0,0 +1,121 @@
+import RiotConstants as Consts
+import time
+from pymysql.constants import ER
+from pymysql.err import OperationalError
+from Metrics import METRICS, profiled
+from ObjectiveCube import ObjectiveCube
+
+#Collects rows for the summoners, matches and summonersjctmatches tables and writes them in batches.
+#Each flush sends one multi-row executemany per statement (pymysql turns INSERT ... VALUES executemany calls into a
+#single multi-row INSERT) and commits once, so a batch is one transaction and a handful of round trips instead of one
+#execute and one commit per row.
+#
+#The crawler's rows are tagged with the region the buffer was created for.
+#
+#Every match added also goes into the objective aggregates (see ObjectiveCube.py), which are written in the same transaction.
+#
+#A flush happens when flush_size rows are waiting, when flush_interval seconds have passed since the last flush (checked
+#whenever rows are added, or when the owner calls flush_if_due), and when the buffer is closed.  A flush that MySQL rolls
+#back to break a deadlock with another writer is sent again.
+#
+#	with WriteBuffer(conn) as buffer:
+#		buffer.add_match(parse_match(response.content).rows())
+#
+#The buffer is not thread safe; like the connection it writes to, it should only be used from one thread.
+
+class WriteBuffer(object):
+
+	def __init__(self, conn, flush_size=Consts.WRITE_BUFFER['flush_size'], flush_interval=Consts.WRITE_BUFFER['flush_interval'], on_flush=None, region=Consts.REGIONS['north_america']):
+		self.conn = conn
+		self.region = region
+		self.flush_size = flush_size
+		self.flush_interval = flush_interval
+		#Called with no arguments after every successful commit (CrawlFrontier uses it to checkpoint)
+		self.on_flush = on_flush
+		#Consts.SQL key -> pending rows.  Statements are flushed in the order they were first used, so summoners and
+		#matches always go in before the junction rows that refer to them.
+		self.pending = {}
+		self.pending_count = 0
+		#Matches in this batch, for the objective aggregates that are updated in the same transaction
+		self.cube = ObjectiveCube(region)
+		self.last_flush = time.monotonic()
+		#Running totals, for reporting ingest rates
+		self.rows_written = 0
+		self.matches_written = 0
+		self.flushes = 0
+		self.flush_time = 0.0
+
+	def add(self, sql_key, row):
+		self.pending.setdefault(sql_key, []).append(row)
+		self.pending_count += 1
+		self.flush_if_due()
+
+	def add_match(self, rows):
+		#rows is the output of MatchRecord.rows (see MatchRecords.py)
+		summoner_rows, match_row, jct_rows = rows
+		tag = (self.region,)
+		self.pending.setdefault('insert_summoner', []).extend(s + tag for s in summoner_rows)
+		self.pending.setdefault('insert_match', []).append(match_row + tag)
+		self.pending.setdefault('insert_jct', []).extend(j + tag for j in jct_rows)
+		#Keep summoner_sample current: both lists are in participant order, so the tier for summoner i is in junction row i
+		self.pending.setdefault('upsert_sample', []).extend((s[1], j[6], self.region) for s, j in zip(summoner_rows, jct_rows))
+		self.pending_count += 2*len(summoner_rows) + 1 + len(jct_rows)
+		self.cube.add(match_row, jct_rows)
+		self.flush_if_due()
+
+	def flush_if_due(self):
+		if self.pending_count >= self.flush_size or (self.pending_count > 0 and time.monotonic() - self.last_flush >= self.flush_interval):
+			self.flush()
+
+	@profiled('db_flush')
+	def flush(self):
+		if self.pending_count == 0:
+			self.last_flush = time.monotonic()
+			return
+		start = time.monotonic()
+		retries = Consts.WRITE_BUFFER['deadlock_retries']
+		for attempt in range(retries + 1):
+			cur = self.conn.cursor()
+			try:
+				for sql_key, rows in self.pending.items():
+					if rows:
+						cur.executemany(Consts.SQL[sql_key], rows)
+				self.cube.write(cur)
+				self.conn.commit()
+				break
+			except OperationalError as e:
+				#The whole transaction was rolled back, so the batch can simply be sent again
+				self.conn.rollback()
+				if e.args[0] != ER.LOCK_DEADLOCK or attempt == retries:
+					raise
+				METRICS.inc('db_deadlocks_total')
+			except Exception:
+				#Nothing from this batch was written, so keep the rows and let the caller decide whether to retry
+				self.conn.rollback()
+				raise
+			finally:
+				cur.close()
+
+		METRICS.observe('db_flush_seconds', time.monotonic() - start)
+		for sql_key, rows in self.pending.items():
+			METRICS.inc('db_rows_written_total', len(rows), statement=sql_key)
+		self.rows_written += self.pending_count
+		self.matches_written += len(self.pending.get('insert_match', ()))
+		self.flushes += 1
+		self.pending = {}
+		self.pending_count = 0
+		self.cube.clear()
+		self.last_flush = time.monotonic()
+		self.flush_time += self.last_flush - start
+		if self.on_flush is not None:
+			self.on_flush()
+
+	def close(self):
+		self.flush()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		#Every buffered row belongs to a complete match, so keep what we have even if the crawl is being interrupted
+		self.flush()
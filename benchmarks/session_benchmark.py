@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import RiotConstants as Consts
+import requests
+from RateLimiter import RateLimiter
+from RiotAPI import RiotAPI
+from RiotStub import RiotStub, write_synthetic_fixtures
+
+#Per-request latency of a fresh connection per call (what _request used to do with requests.get) against the pooled
+#keep-alive session RiotAPI owns now.  Runs against a local RiotStub, so there is no TLS handshake in the numbers and
+#the gap is smaller than it is against the live API.
+#
+#python benchmarks/session_benchmark.py [requests]
+
+def percentile(samples, p):
+	samples = sorted(samples)
+	return samples[min(len(samples) - 1, int(p*len(samples)))]
+
+def report(label, samples):
+	print('%-16s mean %7.3f ms   p50 %7.3f ms   p99 %7.3f ms' % (label, 1000*sum(samples)/len(samples), 1000*percentile(samples, 0.5), 1000*percentile(samples, 0.99)))
+
+def main(n):
+	fixture_dir = tempfile.mkdtemp()
+	write_synthetic_fixtures(fixture_dir, summoners=5, matches_per_summoner=10)
+	matchIds = sorted(int(f[:-5]) for f in os.listdir(os.path.join(fixture_dir, 'match_info')))
+
+	with RiotStub(fixture_dir) as stub:
+		#Limits high enough that the limiter never makes us wait
+		api = RiotAPI('benchmark', base_url=stub.base_url, rate_limiter=RateLimiter(app_limits=[(10**9, 1)]))
+		urls = [api._match_url(matchIds[i % len(matchIds)]) for i in range(n)]
+
+		fresh = []
+		for api_url in urls:
+			start = time.perf_counter()
+			requests.get(stub.base_url.format(url=api_url), params={'api_key':'benchmark'}, timeout=Consts.HTTP_TIMEOUT).json()
+			fresh.append(time.perf_counter() - start)
+
+		pooled = []
+		for api_url in urls:
+			start = time.perf_counter()
+			api._send(api_url).json()
+			pooled.append(time.perf_counter() - start)
+
+	print(str(n) + ' match_info requests against ' + stub.base_url.format(url=''))
+	report('requests.get', fresh)
+	report('pooled session', pooled)
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
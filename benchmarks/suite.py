@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import RiotConstants as Consts
+import numpy as np
+import pymysql
+import LaneModel
+from Metrics import METRICS
+from RateLimiter import RateLimiter
+from ResponseCache import ResponseCache
+from RiotAPI import RiotAPI
+from RiotStub import RiotStub, write_synthetic_fixtures, write_synthetic_seed
+from Schema import create_tables
+from Storage import AnalyticsStore
+
+#End-to-end benchmarks that run without the live API or the real database.
+#
+#Everything runs against a RiotStub serving synthetic fixtures (with optional latency and 429s) and a throwaway
+#database created for the run and dropped afterwards, so results are repeatable and comparable between commits.  The
+#throwaway database needs a MySQL server (the one in Consts.DB): the crawler writes with MySQL's INSERT IGNORE, ON
+#DUPLICATE KEY UPDATE and information_schema, which the embedded stores don't speak.  Only the analytics benchmarks
+#run on an embedded database (an AnalyticsStore).  The benchmarks:
+#	seed          populate_summoners_from_seed on a synthetic seed file
+#	crawl         populate_matches_from_summoners, blocking and with the asyncio crawler
+#	validate      validate_matches_table after deleting some junction rows
+#	objectives    win_probabilities_by_tier from the counters and by scanning
+#	lane          building the lane training data, model inference and matchup table lookups
+#	analytics     syncing an AnalyticsStore from the database, and the objective scan and lane data on it
+#Results, the parameters and a metrics snapshot are written as JSON.
+#
+#python benchmarks/suite.py [--summoners 50] [--matches 20] [--latency 0.02] [--throttle 0.01] [--out results.json]
+
+def median_ms(samples):
+	return 1000*float(np.median(samples))
+
+def repeat(f, n):
+	samples = []
+	for i in range(n):
+		start = time.perf_counter()
+		f()
+		samples.append(time.perf_counter() - start)
+	return samples
+
+def git_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+@contextmanager
+def throwaway_database(db=Consts.DB):
+	#A new, empty database on the server in db with the project's tables, dropped again on exit
+	name = 'league_bench_%d_%d' % (os.getpid(), int(time.time()))
+	server = dict((k, v) for k, v in db.items() if k != 'db')
+	conn = pymysql.connect(**server)
+	conn.cursor().execute('CREATE DATABASE ' + name)
+	conn.close()
+	params = dict(db, db=name)
+	try:
+		conn = pymysql.connect(**params)
+		create_tables(conn)
+		load_meta_champs(conn)
+		conn.close()
+		yield params
+	finally:
+		conn = pymysql.connect(**server)
+		conn.cursor().execute('DROP DATABASE IF EXISTS ' + name)
+		conn.close()
+
+def load_meta_champs(conn):
+	#The synthetic fixtures use championIds 1-500; call 1-14 the meta supports and 15-28 the meta ADCs
+	cur = conn.cursor()
+	cur.executemany('INSERT INTO meta_champs (champId, name) VALUES (%s,%s)', [(i + 1, name) for i, name in enumerate(LaneModel.SUPPORTS + LaneModel.ADCS)])
+	cur.executemany('INSERT INTO meta_supports (champId) VALUES (%s)', [(i + 1,) for i in range(len(LaneModel.SUPPORTS))])
+	cur.executemany('INSERT INTO meta_adc (champId) VALUES (%s)', [(len(LaneModel.SUPPORTS) + i + 1,) for i in range(len(LaneModel.ADCS))])
+	conn.commit()
+	cur.close()
+
+def count(api, table):
+	conn = api._connect()
+	cur = conn.cursor()
+	cur.execute('SELECT COUNT(*) FROM ' + table)
+	n = cur.fetchone()[0]
+	conn.close()
+	return n
+
+def clear_matches(api):
+	#Forget every crawled match, so each crawl benchmark starts from the same state
+	conn = api._connect()
+	cur = conn.cursor()
+	for table in ('summonersjctmatches', 'matches', 'match_tiers', 'objective_counts'):
+		cur.execute('DELETE FROM ' + table)
+	conn.commit()
+	conn.close()
+
+def bench_seed(api, fixture_dir, workdir):
+	path = os.path.join(workdir, 'seed.json')
+	matches = write_synthetic_seed(fixture_dir, path)
+	start = time.perf_counter()
+	api.populate_summoners_from_seed(path)
+	seconds = time.perf_counter() - start
+	summoners = count(api, 'summoners')
+	return {'matches':matches, 'summoners':summoners, 'seconds':seconds, 'summoners_per_second':summoners/seconds}
+
+def bench_crawl(api, stub, sumNo, matchNo, concurrency, prioritize=False):
+	clear_matches(api)
+	api.cache = ResponseCache()
+	requests_before = sum(stub.counts.values())
+	throttled_before = stub.throttled
+	result = api.populate_matches_from_summoners(sumNo, matchNo, concurrency=concurrency, prioritize=prioritize)
+	result['requests'] = sum(stub.counts.values()) - requests_before
+	result['yield_per_request'] = result['matches']/float(result['requests']) if result['requests'] else None
+	result['throttled'] = stub.throttled - throttled_before
+	result['concurrency'] = concurrency
+	result['matches_per_second'] = result['matches']/result['seconds'] if result['seconds'] else None
+	return result
+
+def bench_validate(api, fraction=0.1):
+	#Break a fraction of the matches by deleting one of their junction rows each
+	conn = api._connect()
+	cur = conn.cursor()
+	cur.execute('SELECT matchId FROM matches')
+	matchIds = [row[0] for row in cur.fetchall()]
+	broken = matchIds[:int(fraction*len(matchIds))]
+	for matchId in broken:
+		cur.execute('DELETE FROM summonersjctmatches WHERE matchId = %s LIMIT 1', (matchId,))
+	conn.commit()
+	conn.close()
+	start = time.perf_counter()
+	repaired = api.validate_matches_table()
+	return {'matches':len(matchIds), 'broken':len(broken), 'repaired':repaired, 'seconds':time.perf_counter() - start}
+
+def bench_objectives(api, repeats):
+	api.rebuild_objective_cube()
+	return {
+		'cube_ms':median_ms(repeat(lambda: api.win_probabilities_by_tier(), repeats)),
+		'scan_ms':median_ms(repeat(lambda: api.win_probabilities_by_tier(scan=True), repeats))
+	}
+
+def bench_lane(api, repeats):
+	conn = api._connect()
+	start = time.perf_counter()
+	data, labels = LaneModel.training_data(conn)
+	result = {'training_rows':len(labels), 'training_data_seconds':time.perf_counter() - start}
+	conn.close()
+
+	#Inference costs the same whatever the weights are, so without TensorFlow time it on an untrained network
+	try:
+		start = time.perf_counter()
+		model = LaneModel.LaneModel.train(data, labels, training_epochs=1)
+		result['training_seconds'] = time.perf_counter() - start
+	except ImportError:
+		rng = np.random.RandomState(0)
+		model = LaneModel.LaneModel({'h1':rng.randn(LaneModel.N_INPUT, 100), 'h2':rng.randn(100, 100), 'out':rng.randn(100, LaneModel.N_CLASSES)}, {'b1':rng.randn(100), 'b2':rng.randn(100), 'out':rng.randn(LaneModel.N_CLASSES)})
+		result['training_seconds'] = None
+
+	opponents = [(s, a) for s in LaneModel.SUPPORTS for a in LaneModel.ADCS]
+	result['score_all_196_ms'] = median_ms(repeat(lambda: model.scores(opponents), repeats))
+	table = LaneModel.MatchupTable.build(model, len(labels))
+	result['table_lookup_us'] = 1000*median_ms(repeat(lambda: table.recommend('Thresh', 'Jhin'), 100*repeats))
+	return result
+
+def bench_analytics(api, workdir, engine, repeats):
+	#The same scans as objectives (scan=True) and lane, on a local copy instead of the server
+	api.analytics = AnalyticsStore(os.path.join(workdir, 'analytics.db'), engine=engine)
+	start = time.perf_counter()
+	copied = api.sync_analytics()
+	result = {'engine':api.analytics.engine, 'copied':copied, 'sync_seconds':time.perf_counter() - start}
+	result['scan_ms'] = median_ms(repeat(lambda: api.win_probabilities_by_tier(), repeats))
+	conn = api._analytics_connect()
+	start = time.perf_counter()
+	LaneModel.training_data(conn)
+	result['training_data_seconds'] = time.perf_counter() - start
+	conn.close()
+	api.analytics = None
+	return result
+
+def main(args):
+	workdir = tempfile.mkdtemp()
+	fixture_dir = os.path.join(workdir, 'fixtures')
+	write_synthetic_fixtures(fixture_dir, summoners=args.summoners, matches_per_summoner=args.matches, seed=args.seed)
+	METRICS.reset()
+
+	results = {}
+	with RiotStub(fixture_dir, latency=args.latency, throttle_rate=args.throttle, retry_after=args.retry_after, seed=args.seed) as stub, throwaway_database() as db:
+		api = RiotAPI('benchmark', base_url=stub.base_url, rate_limiter=RateLimiter(app_limits=[(args.rate_limit, 1)]), db=db)
+		results['seed'] = bench_seed(api, fixture_dir, workdir)
+		results['crawl'] = bench_crawl(api, stub, args.summoners, args.matches, None)
+		results['crawl_async'] = bench_crawl(api, stub, args.summoners, args.matches, args.concurrency)
+		#Same crawl with the summoners ordered by CrawlScheduler (using the history the two crawls above left) and
+		#ranked games only, to compare yield_per_request
+		results['crawl_prioritized'] = bench_crawl(api, stub, args.summoners, args.matches, args.concurrency, prioritize=True)
+		results['validate'] = bench_validate(api)
+		results['objectives'] = bench_objectives(api, args.repeats)
+		results['lane'] = bench_lane(api, args.repeats)
+		results['analytics'] = bench_analytics(api, workdir, args.engine, args.repeats)
+
+	report = {
+		'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'commit':git_commit(),
+		'python':platform.python_version(),
+		'platform':platform.platform(),
+		'parameters':vars(args),
+		'results':results,
+		'metrics':METRICS.snapshot()
+	}
+	text = json.dumps(report, indent=1, default=str).replace('Infinity', 'null')
+	with open(args.out, 'w', encoding='utf-8') as f:
+		f.write(text)
+	print(json.dumps(results, indent=1, default=str))
+	print('Wrote ' + args.out)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the crawler and analyses against a local API stub and a throwaway database')
+	parser.add_argument('--summoners', type=int, default=50, help='summoners in the synthetic fixtures (and crawled)')
+	parser.add_argument('--matches', type=int, default=20, help='matches per summoner')
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds the stub adds to every response')
+	parser.add_argument('--throttle', type=float, default=0.0, help='fraction of requests the stub answers with a 429')
+	parser.add_argument('--retry-after', type=float, default=0.1, help='Retry-After of those 429s')
+	parser.add_argument('--rate-limit', type=int, default=1000, help='app rate limit (requests per second) to crawl under')
+	parser.add_argument('--concurrency', type=int, default=8, help='requests in flight for the asyncio crawl')
+	parser.add_argument('--repeats', type=int, default=20, help='repetitions of the latency measurements')
+	parser.add_argument('--engine', choices=('duckdb', 'sqlite'), default=None, help='engine of the analytics store (default: DuckDB if installed)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--out', default='benchmark_results.json', help='where to write the JSON results')
+	main(parser.parse_args())
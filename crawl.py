@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import sys
+import RiotConstants as Consts
+from Metrics import METRICS
+from ResponseCache import ResponseCache
+from RiotAPI import RiotAPI
+
+#Command line entry point for crawl jobs.
+#
+#Only the HTTP client and ingest modules get imported (no pandas, matplotlib or TensorFlow), so a worker is running
+#in well under a second.  Subcommands:
+#	seed PATH                  load the summoners of a seed file, directory or glob (populate_summoners_from_seed)
+#	names PATH                 look up the summoner names in a file, one per line, and add them (write_summoners_to_db)
+#	crawl                      crawl --summoners summoners and --matches of their matches each (populate_matches_from_summoners),
+#	                           in several regions at once if --regions is given, the most promising ones first if
+#	                           --prioritize is given
+#	refresh                    fetch only the games played since the last refresh (refresh_summoners)
+#	validate                   re-fetch the junction rows missing from the matches table (validate_matches_table)
+#	rebuild-cube               recompute the objective counters from the matches table (rebuild_objective_cube)
+#	sync-analytics             bring the analytics store up to date (sync_analytics)
+#The API key comes from --key or the RIOT_API_KEY environment variable.  For example:
+#	python crawl.py crawl --summoners 500 --matches 20 --concurrency 16 --checkpoint crawl.json --metrics-port 9102
+
+def build_api(args):
+	db = dict(Consts.DB)
+	for option, key in (('db_host', 'host'), ('db_user', 'user'), ('db_password', 'passwd'), ('db_name', 'db')):
+		if getattr(args, option) is not None:
+			db[key] = getattr(args, option)
+	analytics = None
+	if args.command == 'sync-analytics':
+		from Storage import AnalyticsStore
+		analytics = AnalyticsStore(args.path, engine=args.engine)
+	return RiotAPI(args.key or os.environ.get('RIOT_API_KEY', ''), region=args.region, base_url=args.base_url, cache=ResponseCache(args.cache_dir), db=db, analytics=analytics)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Crawl the Riot API into the database')
+	parser.add_argument('--key', help='Riot API key (default: $RIOT_API_KEY)')
+	parser.add_argument('--region', default=Consts.REGIONS['north_america'])
+	parser.add_argument('--base-url', default=Consts.URL['base'], help='API base URL, e.g. a RiotStub')
+	parser.add_argument('--cache-dir', help='keep API responses in this directory between runs')
+	parser.add_argument('--db-host')
+	parser.add_argument('--db-user')
+	parser.add_argument('--db-password')
+	parser.add_argument('--db-name')
+	parser.add_argument('--metrics-port', type=int, help='serve /metrics on this port while running')
+	parser.add_argument('--metrics-snapshot', help='write a JSON metrics snapshot to this file while running')
+	commands = parser.add_subparsers(dest='command')
+	commands.required = True
+
+	seed = commands.add_parser('seed')
+	seed.add_argument('path')
+
+	names = commands.add_parser('names')
+	names.add_argument('path')
+	names.add_argument('--concurrency', type=int, default=8)
+
+	crawl = commands.add_parser('crawl')
+	crawl.add_argument('--summoners', type=int, default=100)
+	crawl.add_argument('--matches', type=int, default=20)
+	crawl.add_argument('--concurrency', type=int, help='requests in flight (asyncio crawler); blocking crawl if not given')
+	crawl.add_argument('--checkpoint', help='checkpoint file to resume from and save progress to')
+	crawl.add_argument('--tiers', nargs='+', help='split the sample evenly between these tiers')
+	crawl.add_argument('--regions', nargs='+', help='crawl these regions at once instead of --region')
+	crawl.add_argument('--prioritize', action='store_true', help='crawl the summoners expected to give the most new ranked games (CrawlScheduler)')
+
+	refresh = commands.add_parser('refresh')
+	refresh.add_argument('--summoners', type=int, default=100)
+	refresh.add_argument('--concurrency', type=int, default=8)
+	refresh.add_argument('--max-matches', type=int, default=Consts.REFRESH['max_matches'], help='most new games fetched per summoner in one refresh')
+
+	validate = commands.add_parser('validate')
+	validate.add_argument('--concurrency', type=int, default=8)
+
+	commands.add_parser('rebuild-cube')
+
+	sync = commands.add_parser('sync-analytics')
+	sync.add_argument('--path', default=Consts.ANALYTICS['path'])
+	sync.add_argument('--engine', choices=('duckdb', 'sqlite'), default=Consts.ANALYTICS['engine'])
+	sync.add_argument('--full', action='store_true', help='copy everything again')
+
+	args = parser.parse_args(argv)
+	api = build_api(args)
+	if args.metrics_port is not None:
+		METRICS.serve(args.metrics_port)
+	if args.metrics_snapshot is not None:
+		METRICS.start_snapshots(args.metrics_snapshot)
+
+	try:
+		if args.command == 'seed':
+			api.populate_summoners_from_seed(args.path)
+		elif args.command == 'names':
+			with open(args.path, encoding='utf-8') as f:
+				report = api.write_summoners_to_db((line.strip() for line in f if line.strip()), concurrency=args.concurrency)
+			for name, reason in sorted(report['failed'].items()):
+				print('Failed: ' + name + ' (' + str(reason) + ')')
+		elif args.command == 'crawl':
+			options = {'concurrency':args.concurrency, 'checkpoint':args.checkpoint, 'tiers':args.tiers, 'prioritize':args.prioritize}
+			if args.regions:
+				api.crawl_regions(args.regions, args.summoners, args.matches, **options)
+			else:
+				print(json.dumps(api.populate_matches_from_summoners(args.summoners, args.matches, **options)))
+		elif args.command == 'refresh':
+			print(json.dumps(api.refresh_summoners(args.summoners, concurrency=args.concurrency, max_matches=args.max_matches)))
+		elif args.command == 'validate':
+			api.validate_matches_table(concurrency=args.concurrency)
+		elif args.command == 'rebuild-cube':
+			api.rebuild_objective_cube()
+		elif args.command == 'sync-analytics':
+			print('Copied ' + str(api.sync_analytics(full=args.full)) + ' matches.')
+	finally:
+		METRICS.stop_snapshots()
+		METRICS.stop_serving()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())